@@ -14,6 +14,8 @@ class User(TimeStampedModel, AbstractBaseUser, PermissionsMixin):
     first_name = models.CharField(max_length=100, blank=True, verbose_name='نام')
     last_name = models.CharField(max_length=100, blank=True, verbose_name='نام خانوادگی')
     image = models.ImageField(upload_to='users/', blank=True, null=True, verbose_name='تصویر')
+    # resized copies of the avatar, written by utils.images after upload
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name='نسخه‌های تصویر')
     
     is_active = models.BooleanField(default=True, verbose_name='فعال')
     is_staff = models.BooleanField(default=False, verbose_name='کارمند')
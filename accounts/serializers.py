@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from utils.serializers import ImageVariantsField
 
 User = get_user_model()
 
@@ -54,6 +55,7 @@ class UserUpdateSerializer(serializers.ModelSerializer):
     
 
 class UserProfileSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = User
@@ -62,5 +64,6 @@ class UserProfileSerializer(serializers.ModelSerializer):
             "first_name",
             "last_name",
             "image",
+            "image_variants",
             "created",
         )
\ No newline at end of file
@@ -0,0 +1,25 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import User
+from utils import images
+
+
+@receiver(pre_save, sender=User)
+def reset_user_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.reset_stale(instance)
+
+
+@receiver(post_save, sender=User)
+def generate_user_image_variants(sender, instance, raw=False, **kwargs):
+    """
+    Resize a newly uploaded avatar in the background once the save commits.
+    """
+    if not raw:
+        images.schedule(instance)
+
+
+@receiver(post_delete, sender=User)
+def delete_user_image_variants(sender, instance, **kwargs):
+    images.discard(instance.image.storage, instance.image_variants)
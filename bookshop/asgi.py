@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookshop.settings')
 
 application = get_asgi_application()
+
+# build the typeahead index while the server starts, not on the first request
+from products.autocomplete import autocomplete  # noqa: E402
+
+autocomplete.warm_up()
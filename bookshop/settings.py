@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 
@@ -92,6 +93,17 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # writers wait for the lock when their transaction begins instead
+            # of failing when a read has to be upgraded to a write (checkout)
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'TEST': {
+            # file-backed so the concurrency tests can open several
+            # connections; kept out of the source tree
+            'NAME': Path(tempfile.gettempdir()) / 'bookshop_test_db.sqlite3',
+        },
     }
 }
 
@@ -149,6 +161,67 @@ REST_FRAMEWORK = {
         ),
 }
 
+# Keyset pagination for catalog lists (see utils.pagination)
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# Rows per INSERT when a list is posted to a bulk-capable endpoint
+BULK_CREATE_BATCH_SIZE = 1000
+
+# Bulk catalog feeds post tens of thousands of products in one body
+DATA_UPLOAD_MAX_MEMORY_SIZE = 50 * 1024 * 1024
+
+# Catalog responses are cached in-process (LRU, bounded by entry count).
+# Switch 'catalog' to FileBasedCache to share it between workers on one host.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+CATALOG_CACHE_ALIAS = 'catalog'
+
+# Full-text search backend for products (see products.search)
+PRODUCT_SEARCH_BACKEND = 'products.search.SQLiteFTSBackend'
+
+# Seconds after which each process rebuilds its autocomplete index in the
+# background, picking up sales and changes made by other processes
+AUTOCOMPLETE_MAX_AGE = 3600
+
+# Seconds a discount code lookup stays cached (changed codes are dropped at once)
+DISCOUNT_CODE_CACHE_TTL = 60
+
+# Seconds the category tree stays cached (changes are dropped at once in
+# the process that made them, and within this delay in the others)
+CATEGORY_TREE_CACHE_TTL = 300
+
+# Related products ("frequently bought together") stored per product by
+# the rebuild_related_products command
+RELATED_PRODUCTS_KEPT = 50
+
+# Upper bounds (tomans) of the price bands offered as a facet
+PRODUCT_PRICE_BANDS = [100000, 250000, 500000, 1000000]
+
+# How long reserved stock is held for a cart before it is released
+STOCK_RESERVATION_TTL = timedelta(minutes=15)
+
+# Resized copies generated for uploaded logos and avatars (see utils.images):
+# name -> maximum (width, height), each written in every listed format
+IMAGE_VARIANTS = {
+    'thumbnail': (96, 96),
+    'small': (256, 256),
+    'medium': (512, 512),
+}
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+IMAGE_WORKERS = 4
+
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Your Project API',
@@ -30,6 +30,7 @@ urlpatterns = [
     path('api/schema/swagger-ui/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('accounts/', include('accounts.urls'), name='accounts'),
     path('products/', include('products.urls'), name='products'),
+    path('orders/', include('orders.urls'), name='orders'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 ]
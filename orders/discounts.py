@@ -0,0 +1,113 @@
+"""
+Discount code validation and redemption for the checkout hot path.
+
+Codes are looked up through the default cache: each code (or its absence)
+is kept for ``DISCOUNT_CODE_CACHE_TTL`` seconds and dropped as soon as the
+DiscountCode is saved or deleted, so validating a code usually costs no
+query. The activity window is checked against the current time on every
+call, so codes still expire on time while cached.
+
+Per-user usage is one DiscountUser row per (user, code) holding
+``used_count``. A redemption increments it with a conditional UPDATE
+(``used_count < usage_limit_per_user``), which the database applies
+atomically, so concurrent checkouts can never exceed the limit.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Now
+from django.utils import timezone
+
+
+CACHE_KEY = 'orders:discount-code:{}'
+
+# what is cached of a DiscountCode
+CachedCode = namedtuple('CachedCode', 'pk code amount usage_limit_per_user start end')
+
+
+class DiscountError(Exception):
+    """
+    Raised when a discount code cannot be used.
+    """
+
+
+def _cache_key(code):
+    # codes are free text; keep keys memcached-safe
+    return CACHE_KEY.format(code.encode().hex())
+
+
+def get_code(code):
+    """
+    Return the active DiscountCode ``code`` as a CachedCode, or None.
+    """
+    from .models import DiscountCode
+
+    key = _cache_key(code)
+    cached = cache.get(key)
+    if cached is None:
+        row = (
+            DiscountCode.objects.filter(code=code, is_active=True)
+            .values_list('pk', 'code', 'amount', 'usage_limit_per_user', 'start', 'end')
+            .first()
+        )
+        # an empty tuple remembers unknown codes too
+        cached = tuple(row) if row else ()
+        cache.set(key, cached, getattr(settings, 'DISCOUNT_CODE_CACHE_TTL', 60))
+    return CachedCode(*cached) if cached else None
+
+
+def forget(code):
+    """
+    Drop ``code`` from the cache, after its DiscountCode changed.
+    """
+    cache.delete(_cache_key(code))
+
+
+def validate(code, now=None):
+    """
+    Return the CachedCode of ``code`` if it can be used at ``now``.
+
+    Raises:
+        DiscountError: If the code does not exist, is inactive or is
+                       outside its activity window.
+    """
+    now = now or timezone.now()
+    discount = get_code(code)
+    if discount is None or not discount.start <= now <= discount.end:
+        raise DiscountError('Invalid or expired discount code.')
+    return discount
+
+
+def redeem(user_id, code, now=None):
+    """
+    Record one use of ``code`` by the user ``user_id``.
+
+    Two queries: the usage row is created if missing, then incremented
+    only while under the code's per-user limit.
+
+    Returns:
+        CachedCode: The redeemed code.
+
+    Raises:
+        DiscountError: If the code cannot be used or the user reached its
+                       usage limit; no use is recorded.
+    """
+    from .models import DiscountUser
+
+    discount = validate(code, now)
+    with transaction.atomic():
+        DiscountUser.objects.bulk_create(
+            [DiscountUser(user_id=user_id, discount_code_id=discount.pk, used_count=0)],
+            ignore_conflicts=True,
+        )
+        redeemed = DiscountUser.objects.filter(
+            user_id=user_id,
+            discount_code_id=discount.pk,
+            used_count__lt=discount.usage_limit_per_user,
+        ).update(used_count=F('used_count') + 1, used_at=Now())
+        if not redeemed:
+            raise DiscountError('This discount code has already been used.')
+    return discount
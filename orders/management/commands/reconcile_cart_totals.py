@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min
+
+from orders.models import Cart
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the stored totals of carts that drifted from their items, '
+        'walking the cart table by primary key in chunks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of carts checked per UPDATE.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        batch_size = options['batch_size']
+        bounds = Cart.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        fixed = 0
+        if bounds['low'] is not None:
+            for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+                carts = Cart.objects.filter(pk__gte=start, pk__lt=start + batch_size)
+                fixed += carts.out_of_sync().update_totals()
+        self.stdout.write(self.style.SUCCESS(
+            f'Fixed the totals of {fixed} carts in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders import services
+
+
+class Command(BaseCommand):
+    help = 'Return the stock held by expired cart reservations. Meant to run every minute or so.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of reservations released per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        released = services.release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Released {released} expired reservations in {time.monotonic() - started:.1f}s'
+        ))
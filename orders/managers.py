@@ -0,0 +1,45 @@
+from django.db import models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Now
+
+
+class CartQuerySet(models.QuerySet):
+    """
+    QuerySet of carts whose stored totals can be recomputed set-based.
+    """
+    def item_totals(self):
+        """
+        Return ``(total_price, discount_price)`` expressions summing the
+        items of each cart in a correlated subquery.
+        """
+        from .models import CartItem
+
+        items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        return tuple(
+            Coalesce(
+                Subquery(items.annotate(total=Sum(F(price) * F('quantity'))).values('total')),
+                0,
+            )
+            for price in ('price', 'discount_price')
+        )
+
+    def update_totals(self):
+        """
+        Recompute ``total_price`` and ``discount_price`` of every cart in
+        the queryset from its items with a single UPDATE.
+
+        Returns:
+            int: The number of carts updated.
+        """
+        total_price, discount_price = self.item_totals()
+        return self.update(total_price=total_price, discount_price=discount_price, updated=Now())
+
+    def out_of_sync(self):
+        """
+        Carts whose stored totals differ from the sum of their items.
+        """
+        total_price, discount_price = self.item_totals()
+        return (
+            self.annotate(expected_total=total_price, expected_discount=discount_price)
+            .exclude(total_price=F('expected_total'), discount_price=F('expected_discount'))
+        )
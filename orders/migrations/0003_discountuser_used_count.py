@@ -0,0 +1,30 @@
+# Generated by Django 6.0.4 on 2026-10-18 18:41
+
+from django.db import migrations, models
+
+
+def count_existing_uses(apps, schema_editor):
+    # every row recorded before used_count existed was a single use
+    DiscountUser = apps.get_model('orders', 'DiscountUser')
+    DiscountUser.objects.update(used_count=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discountuser',
+            name='used_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='تعداد استفاده'),
+        ),
+        migrations.AlterField(
+            model_name='discountuser',
+            name='used_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='زمان آخرین استفاده'),
+        ),
+        migrations.RunPython(count_existing_uses, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from utils.models import TimeStampedModel
 from products.models import Product
 from django.core.validators import MinValueValidator
+from .managers import CartQuerySet
 
 class Cart(TimeStampedModel):
 
@@ -22,6 +23,9 @@ class Cart(TimeStampedModel):
         verbose_name="مبلغ نهایی پس از تخفیف (تومان)"
     )
 
+    # the totals are kept in sync by CartItem.save() / delete()
+    objects = CartQuerySet.as_manager()
+
     class Meta:
         verbose_name = "سبد خرید"
         verbose_name_plural = "سبدهای خرید"
@@ -68,9 +72,59 @@ class CartItem(TimeStampedModel):
 
     def __str__(self):
         return f"{self.product} × {self.quantity}"
+
+    def save(self, *args, **kwargs):
+        """
+        Save the item and refresh its cart's totals in the same transaction,
+        with one aggregate UPDATE whatever the size of the cart.
+        """
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Cart.objects.filter(pk=self.cart_id).update_totals()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Cart.objects.filter(pk=self.cart_id).update_totals()
+        return result
     
 
 
+class StockReservation(TimeStampedModel):
+
+    cart = models.ForeignKey(
+        Cart,
+        on_delete=models.CASCADE,
+        related_name="reservations",
+        verbose_name="سبد خرید"
+    )
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.PROTECT,
+        related_name="reservations",
+        verbose_name="محصول"
+    )
+
+    quantity = models.PositiveIntegerField(
+        validators=[MinValueValidator(1)],
+        verbose_name="تعداد"
+    )
+
+    expires_at = models.DateTimeField(
+        db_index=True,
+        verbose_name="زمان انقضا"
+    )
+
+    class Meta:
+        verbose_name = "رزرو موجودی"
+        verbose_name_plural = "رزروهای موجودی"
+
+    def __str__(self):
+        return f"{self.product} × {self.quantity} ({self.cart})"
+
+
+
 class DiscountCode(TimeStampedModel):
 
     code = models.CharField(
@@ -128,14 +182,20 @@ class DiscountUser(models.Model):
         verbose_name="کد تخفیف"
     )
 
+    used_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="تعداد استفاده"
+    )
+
     used_at = models.DateTimeField(
         auto_now_add=True,
-        verbose_name="زمان استفاده"
+        verbose_name="زمان آخرین استفاده"
     )
 
     class Meta:
         verbose_name = "استفاده از کد تخفیف"
         verbose_name_plural = "استفاده‌های کد تخفیف"
+        # one row per user and code; ``used_count`` counts the uses
         unique_together = ("user", "discount_code")
 
 
@@ -150,6 +210,19 @@ class Order(TimeStampedModel):
         ("canceled", "لغو شده"),
     )
 
+    # statuses whose items count as sold copies
+    SOLD_STATUSES = ("paid", "processing", "shipped", "completed")
+
+    # status -> statuses an order may move to from it
+    ALLOWED_TRANSITIONS = {
+        "pending": ("paid", "canceled"),
+        "paid": ("processing", "canceled"),
+        "processing": ("shipped", "canceled"),
+        "shipped": ("completed",),
+        "completed": (),
+        "canceled": (),
+    }
+
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.PROTECT,
@@ -185,6 +258,10 @@ class Order(TimeStampedModel):
         verbose_name = "سفارش"
         verbose_name_plural = "سفارش‌ها"
         ordering = ["-created"]
+        indexes = [
+            # a user's order history, keyset-paginated on (-created, -id)
+            models.Index(fields=["user", "-created", "-id"], name="order_user_created_idx"),
+        ]
 
     def __str__(self):
         return f"سفارش #{self.id}"
@@ -29,4 +29,79 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = models.OrderItem
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+class TransportSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = models.Transport
+        fields = ('name_company', 'tracking_code', 'send_date')
+
+
+class OrderHistoryItemSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = models.OrderItem
+        fields = ('product', 'product_title', 'product_sku', 'quantity', 'price', 'discount_price')
+
+
+class OrderHistorySerializer(serializers.ModelSerializer):
+    """
+    An order of the user's history with its shipping and items, which the
+    view loads with ``select_related`` / ``prefetch_related``.
+    """
+    transport = TransportSerializer(read_only=True)
+    items = OrderHistoryItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = models.Order
+        fields = ('id', 'status', 'total_price', 'discount_price', 'created', 'updated', 'transport', 'items')
+
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    """
+    Totals and status only, read from the order row alone.
+    """
+
+    class Meta:
+        model = models.Order
+        fields = ('id', 'status', 'total_price', 'discount_price', 'created')
+
+
+class CheckoutSerializer(serializers.Serializer):
+    """
+    Input of a checkout: one of the user's carts and how to ship it.
+    """
+    cart = serializers.PrimaryKeyRelatedField(queryset=models.Cart.objects.all())
+    transport = serializers.CharField(max_length=150)
+    discount_code = serializers.CharField(max_length=50, required=False, allow_blank=True)
+
+    def validate_cart(self, cart):
+        # other users' carts do not exist as far as this user is concerned
+        if cart.user_id != self.context['request'].user.pk:
+            raise serializers.ValidationError(f'Invalid pk "{cart.pk}" - object does not exist.')
+        return cart
+
+
+class OrderTransitionSerializer(serializers.Serializer):
+    """
+    One order of a bulk transition: its new status and/or shipping.
+    """
+    order = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=models.Order.STATUS_CHOICES, required=False)
+    tracking_code = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    send_date = serializers.DateTimeField(required=False, allow_null=True)
+
+
+class BulkOrderTransitionSerializer(serializers.Serializer):
+    orders = OrderTransitionSerializer(many=True, allow_empty=False, max_length=10000)
+
+    def validate_orders(self, orders):
+        # moves of one order would depend on each other's order of application
+        seen, duplicates = set(), set()
+        for change in orders:
+            (duplicates if change['order'] in seen else seen).add(change['order'])
+        if duplicates:
+            raise serializers.ValidationError(f'Orders listed more than once: {sorted(duplicates)}.')
+        return orders
@@ -0,0 +1,416 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from products import response_cache
+from products.models import Product
+from . import discounts
+from .models import Cart, Order, OrderItem, StockReservation, Transport
+from .signals import order_canceled, order_paid
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when some products do not have enough stock; nothing is taken.
+
+    ``shortages`` maps each short product id to the quantity still available.
+    """
+    def __init__(self, shortages):
+        self.shortages = shortages
+        super().__init__(f'Insufficient stock for products {sorted(shortages)}.')
+
+
+class CheckoutError(Exception):
+    """
+    Raised when a cart cannot be checked out; nothing is written.
+
+    ``field`` names the checkout input at fault.
+    """
+    def __init__(self, message, field='non_field_errors'):
+        self.field = field
+        super().__init__(message)
+
+
+def _quantities(items):
+    """
+    Normalize ``{product_id: quantity}`` or ``(product_id, quantity)`` pairs,
+    summing repeated products.
+    """
+    pairs = items.items() if hasattr(items, 'items') else items
+    quantities = Counter()
+    for product_id, quantity in pairs:
+        if quantity <= 0:
+            raise ValueError(f'Quantity of product {product_id} must be positive.')
+        quantities[product_id] += quantity
+    return dict(quantities)
+
+
+def _per_product(quantities):
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField(),
+    )
+
+
+def _stock_changed(product_ids):
+    # stock is part of the product representations
+    def invalidate():
+        for product_id in product_ids:
+            response_cache.bump('product', product_id)
+    transaction.on_commit(invalidate)
+
+
+def take_stock(items):
+    """
+    Decrement the stock of several products at once, all or nothing.
+
+    A single ``UPDATE ... SET stock = stock - n WHERE stock >= n`` covers
+    every product, so concurrent callers can never oversell: the database
+    applies each row's check and decrement atomically. If fewer rows than
+    products were updated, InsufficientStock is raised and the atomic block
+    rolls the statement back.
+    """
+    quantities = _quantities(items)
+    if not quantities:
+        return
+    condition = Q()
+    for product_id, quantity in quantities.items():
+        condition |= Q(pk=product_id, stock__gte=quantity)
+
+    try:
+        with transaction.atomic():
+            updated = Product.objects.filter(condition).update(
+                stock=F('stock') - _per_product(quantities),
+                updated=Now(),
+            )
+            if updated != len(quantities):
+                raise InsufficientStock({})
+    except InsufficientStock as exc:
+        # read what is left once the partial decrement is rolled back
+        available = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'stock'))
+        exc.shortages = {
+            product_id: available.get(product_id, 0)
+            for product_id, quantity in quantities.items()
+            if available.get(product_id, 0) < quantity
+        }
+        raise
+    _stock_changed(quantities)
+
+
+def put_back_stock(items, batch_size=500):
+    """
+    Increment the stock of several products, with one
+    ``stock = stock + n`` UPDATE per distinct quantity and ``batch_size``
+    products.
+    """
+    quantities = _quantities(items)
+    if not quantities:
+        return
+    by_quantity = defaultdict(list)
+    for product_id, quantity in quantities.items():
+        by_quantity[quantity].append(product_id)
+    with transaction.atomic():
+        for quantity, product_ids in by_quantity.items():
+            for start in range(0, len(product_ids), batch_size):
+                Product.objects.filter(pk__in=product_ids[start:start + batch_size]).update(
+                    stock=F('stock') + quantity,
+                    updated=Now(),
+                )
+    _stock_changed(quantities)
+
+
+def reserve(cart, items, ttl=None):
+    """
+    Take stock for ``items`` and hold it for ``cart`` until it expires.
+
+    Args:
+        cart: The Cart the stock is held for.
+        items: ``{product_id: quantity}`` or ``(product_id, quantity)`` pairs.
+        ttl: A timedelta; defaults to ``settings.STOCK_RESERVATION_TTL``.
+
+    Returns:
+        list: The created StockReservation objects.
+
+    Raises:
+        InsufficientStock: If any product is short; nothing is reserved.
+    """
+    quantities = _quantities(items)
+    ttl = ttl if ttl is not None else settings.STOCK_RESERVATION_TTL
+    expires_at = timezone.now() + ttl
+    with transaction.atomic():
+        take_stock(quantities)
+        return StockReservation.objects.bulk_create([
+            StockReservation(cart=cart, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        ])
+
+
+def _release(reservations):
+    """
+    Return the stock held by a StockReservation queryset and delete it.
+    """
+    with transaction.atomic():
+        pks = list(reservations.select_for_update().values_list('pk', flat=True))
+        if not pks:
+            return 0
+        held = (
+            StockReservation.objects.filter(pk__in=pks)
+            .values('product')
+            .annotate(total=Sum('quantity'))
+            .values_list('product', 'total')
+        )
+        put_back_stock(held)
+        StockReservation.objects.filter(pk__in=pks).delete()
+    return len(pks)
+
+
+def release(cart, product_ids=None):
+    """
+    Release the stock ``cart`` holds (only for ``product_ids`` if given).
+
+    Returns:
+        int: The number of reservations released.
+    """
+    reservations = StockReservation.objects.filter(cart=cart)
+    if product_ids is not None:
+        reservations = reservations.filter(product__in=product_ids)
+    return _release(reservations)
+
+
+def release_expired(now=None, batch_size=1000):
+    """
+    Release every reservation that expired before ``now``, ``batch_size``
+    reservations per transaction.
+
+    Returns:
+        int: The number of reservations released.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        count = _release(StockReservation.objects.filter(expires_at__lte=now).order_by('pk')[:batch_size])
+        released += count
+        if count < batch_size:
+            return released
+
+
+def _consume_reservations(cart, quantities):
+    """
+    Take the stock needed for ``quantities`` out of what ``cart`` holds:
+    only the part not already reserved is taken from the products, and
+    reserved stock the order does not need is put back.
+    """
+    reserved = Counter()
+    for product_id, quantity in (
+        StockReservation.objects.select_for_update().filter(cart=cart).values_list('product', 'quantity')
+    ):
+        reserved[product_id] += quantity
+
+    missing = {
+        product_id: quantity - reserved[product_id]
+        for product_id, quantity in quantities.items()
+        if quantity > reserved[product_id]
+    }
+    surplus = {
+        product_id: quantity - quantities.get(product_id, 0)
+        for product_id, quantity in reserved.items()
+        if quantity > quantities.get(product_id, 0)
+    }
+    take_stock(missing)
+    put_back_stock(surplus)
+    if reserved:
+        StockReservation.objects.filter(cart=cart).delete()
+
+
+def checkout(cart, transport_company, discount_code=None):
+    """
+    Turn ``cart`` into a pending Order in a single transaction.
+
+    Titles are snapshotted from the products and prices from the cart
+    items, so the order agrees with the cart totals the buyer was shown,
+    into OrderItems with one ``bulk_create``, stock is taken set-based for what the cart's
+    reservations do not already hold, the discount code is redeemed and
+    the cart is emptied. The number of queries does not depend on the
+    number of items.
+
+    Args:
+        cart: The Cart to check out.
+        transport_company: Name of the shipping company.
+        discount_code: Optional code of a DiscountCode to apply.
+
+    Returns:
+        Order: The created order. ``total_price`` is the items at their
+               cart price and ``discount_price`` the cart discounts plus
+               the code's amount.
+
+    Raises:
+        CheckoutError: If the cart is empty or the code cannot be used.
+        InsufficientStock: If any product is short; nothing is written.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # one checkout per cart at a time
+        cart = Cart.objects.select_for_update().get(pk=cart.pk)
+        items = list(
+            cart.items.order_by('pk').values_list(
+                'product', 'quantity', 'product__name', 'product__slug', 'price', 'discount_price',
+            )
+        )
+        if not items:
+            raise CheckoutError('The cart is empty.', field='cart')
+
+        _consume_reservations(cart, {product_id: quantity for product_id, quantity, *_ in items})
+
+        total_price = sum(price * quantity for _, quantity, _, _, price, _ in items)
+        discount_price = sum((price - paid) * quantity for _, quantity, _, _, price, paid in items)
+        if discount_code:
+            try:
+                discount = discounts.redeem(cart.user_id, discount_code, now)
+            except discounts.DiscountError as exc:
+                raise CheckoutError(str(exc), field='discount_code')
+            discount_price += min(discount.amount, total_price - discount_price)
+
+        order = Order.objects.create(
+            user_id=cart.user_id,
+            transport=Transport.objects.create(name_company=transport_company),
+            total_price=total_price,
+            discount_price=discount_price,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=product_id,
+                product_title=name,
+                product_sku=slug,
+                quantity=quantity,
+                price=price,
+                discount_price=price - paid,
+            )
+            for product_id, quantity, name, slug, price, paid in items
+        ])
+
+        cart.items.all().delete()
+        Cart.objects.filter(pk=cart.pk).update_totals()
+    return order
+
+
+def _update_transports(fields, rows, now):
+    """
+    Write ``(transport_id, values)`` rows, values given in ``fields`` order.
+
+    One ``SET field = CASE id WHEN ... END`` UPDATE per batch; the SQL is
+    built as text because ``bulk_update`` resolves one expression per row
+    and field, which dominates the time of large batches.
+    """
+    quote = connection.ops.quote_name
+    opts = Transport._meta
+    columns = [opts.get_field(name) for name in fields]
+    # two parameters per row and field, plus the row's id in the WHERE
+    per_row = 2 * len(columns) + 1
+    batch_size = (connection.features.max_query_params or 1000 * per_row) // per_row
+    updated = opts.get_field('updated').get_db_prep_value(now, connection)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        cases = ' '.join(['WHEN %s THEN %s'] * len(batch))
+        assignments, params = [], []
+        for position, field in enumerate(columns):
+            assignments.append(f'{quote(field.column)} = CASE {quote(opts.pk.column)} {cases} END')
+            for pk, values in batch:
+                params += [pk, field.get_db_prep_value(values[position], connection)]
+        sql = f"""
+            UPDATE {quote(opts.db_table)}
+            SET {', '.join(assignments)}, {quote(opts.get_field('updated').column)} = %s
+            WHERE {quote(opts.pk.column)} IN ({', '.join(['%s'] * len(batch))})
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*params, updated, *(pk for pk, _ in batch)])
+
+
+def transition_orders(changes, batch_size=1000):
+    """
+    Move many orders to new statuses and update their shipping, set-based.
+
+    Each change is a dict with the ``order`` id and any of ``status``,
+    ``tracking_code`` and ``send_date``; an order may appear only once. Status moves must be allowed by
+    ``Order.ALLOWED_TRANSITIONS``; orders moved to ``shipped`` without a
+    ``send_date`` get the current time. Orders are processed in
+    transactions of ``batch_size``: their rows are locked and read in one
+    query, then written with one conditional UPDATE per (from, to) status
+    pair and a few batched UPDATEs of their Transports. ``order_paid`` is
+    sent for the orders that became sold and ``order_canceled`` for the
+    sold orders that were canceled, and the stock of canceled orders is
+    put back.
+
+    Returns:
+        list: One result per change, in order: ``{order, ok, status}`` or
+              ``{order, ok: False, error}``.
+    """
+    changes = list(changes)
+    if len({change['order'] for change in changes}) != len(changes):
+        raise ValueError('Each order may be changed only once per call.')
+    now = timezone.now()
+    results = []
+    for start in range(0, len(changes), batch_size):
+        batch = changes[start:start + batch_size]
+        with transaction.atomic():
+            current = {
+                pk: (status, transport_id)
+                for pk, status, transport_id in Order.objects.select_for_update()
+                .filter(pk__in={change['order'] for change in batch})
+                .values_list('pk', 'status', 'transport_id')
+            }
+            moves = defaultdict(list)
+            shipping = defaultdict(list)
+            for change in batch:
+                pk = change['order']
+                if pk not in current:
+                    results.append({'order': pk, 'ok': False, 'error': 'Order not found.'})
+                    continue
+                status, transport_id = current[pk]
+                target = change.get('status') or status
+                if target != status:
+                    if target not in Order.ALLOWED_TRANSITIONS[status]:
+                        results.append({
+                            'order': pk,
+                            'ok': False,
+                            'error': f'Cannot move an order from "{status}" to "{target}".',
+                        })
+                        continue
+                    moves[(status, target)].append(pk)
+
+                values = {field: change[field] for field in ('tracking_code', 'send_date') if field in change}
+                if target == 'shipped' and status != 'shipped' and values.get('send_date') is None:
+                    # also when the client sent an explicit null
+                    values['send_date'] = now
+                if values:
+                    fields = tuple(sorted(values))
+                    shipping[fields].append((transport_id, [values[field] for field in fields]))
+                results.append({'order': pk, 'ok': True, 'status': target})
+
+            for (source, target), pks in moves.items():
+                Order.objects.filter(pk__in=pks, status=source).update(status=target, updated=Now())
+            for fields, rows in shipping.items():
+                _update_transports(fields, rows, now)
+            canceled, paid, unsold = [], [], []
+            for (source, target), pks in moves.items():
+                if target == 'canceled':
+                    canceled += pks
+                if target in Order.SOLD_STATUSES and source not in Order.SOLD_STATUSES:
+                    paid += pks
+                elif source in Order.SOLD_STATUSES and target not in Order.SOLD_STATUSES:
+                    unsold += pks
+            if canceled:
+                put_back_stock(
+                    OrderItem.objects.filter(order__in=canceled)
+                    .values('product').annotate(total=Sum('quantity')).order_by()
+                    .values_list('product', 'total')
+                )
+            if paid:
+                order_paid.send(sender=Order, order_ids=paid)
+            if unsold:
+                order_canceled.send(sender=Order, order_ids=unsold)
+    return results
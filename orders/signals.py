@@ -0,0 +1,78 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import discounts
+from .models import DiscountCode, Order
+
+
+# Sent inside the transaction that moves orders into ``Order.SOLD_STATUSES``
+# (i.e. marks them paid), once per batch, so receivers can update sales
+# rollups set-based.
+# Arguments: ``sender`` (Order) and ``order_ids``.
+order_paid = Signal()
+
+# Sent inside the transaction that moves sold orders out of
+# ``Order.SOLD_STATUSES`` (i.e. cancels them), so receivers can take them
+# back out of the sales rollups.
+# Arguments: ``sender`` (Order) and ``order_ids``.
+order_canceled = Signal()
+
+
+@receiver(pre_save, sender=Order)
+def snapshot_order_status(sender, instance, raw=False, **kwargs):
+    """
+    Remember the status an order had before this save.
+    """
+    instance._previous_status = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._previous_status = (
+        Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Order)
+def announce_sold_order(sender, instance, raw=False, **kwargs):
+    """
+    Send ``order_paid`` or ``order_canceled`` when a save moves the order
+    into or out of ``Order.SOLD_STATUSES``.
+    """
+    if raw:
+        return
+    was_sold = getattr(instance, '_previous_status', None) in Order.SOLD_STATUSES
+    is_sold = instance.status in Order.SOLD_STATUSES
+    if is_sold and not was_sold:
+        order_paid.send(sender=Order, order_ids=[instance.pk])
+    elif was_sold and not is_sold:
+        order_canceled.send(sender=Order, order_ids=[instance.pk])
+    instance._previous_status = instance.status
+
+
+@receiver(pre_save, sender=DiscountCode)
+def snapshot_discount_code(sender, instance, raw=False, **kwargs):
+    """
+    Remember the code a DiscountCode had, in case it is renamed.
+    """
+    instance._previous_code = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._previous_code = (
+        DiscountCode.objects.filter(pk=instance.pk).values_list('code', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=DiscountCode)
+@receiver(post_delete, sender=DiscountCode)
+def forget_discount_code(sender, instance, **kwargs):
+    """
+    Drop changed codes from the validation cache, also once committed so a
+    concurrent lookup cannot cache the old row again.
+    """
+    codes = {instance.code, getattr(instance, '_previous_code', None)} - {None}
+
+    def forget():
+        for code in codes:
+            discounts.forget(code)
+    forget()
+    transaction.on_commit(forget)
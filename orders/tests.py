@@ -1,3 +1,652 @@
-from django.test import TestCase
+import csv
+import json
+import threading
+import time
+from datetime import timedelta
+from unittest import skipUnless
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, close_old_connections, connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from products.models import Category, Product, Publisher
+from . import discounts, services
+from .signals import order_paid
+from .models import Cart, CartItem, DiscountCode, DiscountUser, Order, OrderItem, StockReservation, Transport
+
+
+def create_product(slug, stock):
+    category, _ = Category.objects.get_or_create(slug='category', defaults={'name': 'category'})
+    publisher, _ = Publisher.objects.get_or_create(slug='publisher', defaults={'name': 'publisher'})
+    return Product.objects.create(
+        slug=slug,
+        name=slug,
+        price=1000,
+        stock=stock,
+        author='author',
+        category=category,
+        main_topic='topic',
+        publisher=publisher,
+        description='description',
+        language='fa',
+    )
+
+
+def create_cart(email):
+    user = get_user_model().objects.create(email=email)
+    return Cart.objects.create(user=user)
+
+
+class CartTotalsTests(TestCase):
+
+    def setUp(self):
+        self.cart = create_cart('buyer@example.com')
+        self.book = create_product('book', stock=5)
+        self.other = create_product('other', stock=5)
+
+    def totals(self):
+        self.cart.refresh_from_db(fields=['total_price', 'discount_price'])
+        return self.cart.total_price, self.cart.discount_price
+
+    def add(self, product, quantity, price=1000, discount_price=800):
+        return CartItem.objects.create(
+            cart=self.cart, product=product, quantity=quantity, price=price, discount_price=discount_price,
+        )
+
+    def test_totals_follow_items(self):
+        item = self.add(self.book, 2)
+        self.assertEqual(self.totals(), (2000, 1600))
+        self.add(self.other, 1, price=500, discount_price=500)
+        self.assertEqual(self.totals(), (2500, 2100))
+        item.quantity = 3
+        item.save()
+        self.assertEqual(self.totals(), (3500, 2900))
+        item.delete()
+        self.assertEqual(self.totals(), (500, 500))
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.add(self.book, 1)
+        for i in range(30):
+            self.add(create_product(f'book-{i}', stock=1), 1)
+        with CaptureQueriesContext(connection) as large:
+            self.add(self.other, 1)
+        self.assertEqual(len(small), len(large))
+
+    def test_reconcile_fixes_drifted_carts(self):
+        self.add(self.book, 2)
+        other_cart = create_cart('other@example.com')
+        Cart.objects.filter(pk=self.cart.pk).update(total_price=1, discount_price=1)
+        Cart.objects.filter(pk=other_cart.pk).update(total_price=5)
+        out = StringIO()
+        call_command('reconcile_cart_totals', batch_size=1, stdout=out)
+        self.assertIn('Fixed the totals of 2 carts', out.getvalue())
+        self.assertEqual(self.totals(), (2000, 1600))
+        self.assertEqual(Cart.objects.get(pk=other_cart.pk).total_price, 0)
+
+
+def fill_cart(cart, products, quantity=1):
+    for product in products:
+        CartItem.objects.create(
+            cart=cart, product=product, quantity=quantity, price=product.price, discount_price=product.effective_price,
+        )
+
+
+class CheckoutTests(TestCase):
+    url = '/orders/api/checkout/'
+
+    def setUp(self):
+        cache.clear()
+        self.cart = create_cart('buyer@example.com')
+        self.book = create_product('book', stock=5)
+        self.other = create_product('other', stock=5)
+        Product.objects.filter(pk=self.other.pk).update(discount_price=600)
+        self.other.refresh_from_db()
+        self.client = APIClient()
+        self.client.force_authenticate(self.cart.user)
+
+    def stock(self, product):
+        product.refresh_from_db(fields=['stock'])
+        return product.stock
+
+    def test_checkout_snapshots_items_and_empties_cart(self):
+        fill_cart(self.cart, [self.book, self.other], quantity=2)
+        order = services.checkout(self.cart, 'post')
+        self.assertEqual((order.status, order.total_price, order.discount_price), ('pending', 4000, 800))
+        self.assertEqual(
+            sorted(order.items.values_list('product_title', 'product_sku', 'quantity', 'price', 'discount_price')),
+            [('book', 'book', 2, 1000, 0), ('other', 'other', 2, 1000, 400)],
+        )
+        self.assertEqual((self.stock(self.book), self.stock(self.other)), (3, 3))
+        self.assertFalse(self.cart.items.exists())
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_price, 0)
+
+    def test_prices_come_from_the_cart(self):
+        fill_cart(self.cart, [self.book, self.other], quantity=2)
+        self.cart.refresh_from_db()
+        Product.objects.filter(pk=self.book.pk).update(price=1500, discount_price=1200)
+        order = services.checkout(self.cart, 'post')
+        self.assertEqual(
+            (order.total_price, order.total_price - order.discount_price),
+            (self.cart.total_price, self.cart.discount_price),
+        )
+        self.assertEqual(order.items.get(product=self.book).price, 1000)
+
+    def test_reservations_are_consumed(self):
+        services.reserve(self.cart, {self.book.pk: 2, self.other.pk: 1})
+        fill_cart(self.cart, [self.book], quantity=3)
+        services.checkout(self.cart, 'post')
+        self.assertEqual((self.stock(self.book), self.stock(self.other)), (2, 5))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_discount_code(self):
+        create_discount('SPRING')
+        fill_cart(self.cart, [self.book])
+        order = services.checkout(self.cart, 'post', 'SPRING')
+        self.assertEqual(order.discount_price, 500)
+        fill_cart(self.cart, [self.book])
+        with self.assertRaises(services.CheckoutError):
+            services.checkout(self.cart, 'post', 'SPRING')
+        with self.assertRaises(services.CheckoutError):
+            services.checkout(self.cart, 'post', 'UNKNOWN')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        fill_cart(self.cart, [self.book])
+        with CaptureQueriesContext(connection) as small:
+            services.checkout(self.cart, 'post')
+        fill_cart(self.cart, [create_product(f'book-{i}', stock=1) for i in range(20)])
+        with CaptureQueriesContext(connection) as large:
+            services.checkout(self.cart, 'post')
+        self.assertEqual(len(small), len(large))
+
+    def test_api(self):
+        self.assertEqual(self.client.post(self.url, {'cart': self.cart.pk, 'transport': 'post'}).status_code, 400)
+        fill_cart(self.cart, [self.book], quantity=6)
+        response = self.client.post(self.url, {'cart': self.cart.pk, 'transport': 'post'})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['shortages'], {self.book.pk: 5})
+
+        CartItem.objects.filter(cart=self.cart).update(quantity=1)
+        response = self.client.post(self.url, {'cart': self.cart.pk, 'transport': 'post'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['product_title'] for item in response.data['items']], ['book'])
+
+        stranger = create_cart('stranger@example.com')
+        response = self.client.post(self.url, {'cart': stranger.pk, 'transport': 'post'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cart', response.data)
+
+
+def create_discount(code, usage_limit_per_user=1, **fields):
+    now = timezone.now()
+    fields.setdefault('start', now - timedelta(days=1))
+    fields.setdefault('end', now + timedelta(days=1))
+    return DiscountCode.objects.create(code=code, amount=500, usage_limit_per_user=usage_limit_per_user, **fields)
+
+
+class DiscountTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create(email='buyer@example.com')
+        self.discount = create_discount('SPRING', usage_limit_per_user=3)
+
+    def test_usage_limit_above_one(self):
+        for _ in range(3):
+            discounts.redeem(self.user.pk, 'SPRING')
+        with self.assertRaises(discounts.DiscountError):
+            discounts.redeem(self.user.pk, 'SPRING')
+        usage = DiscountUser.objects.get()
+        self.assertEqual(usage.used_count, 3)
+
+    def test_validation_is_cached(self):
+        discounts.validate('SPRING')
+        with self.assertNumQueries(0):
+            self.assertEqual(discounts.validate('SPRING').amount, 500)
+            with self.assertRaises(discounts.DiscountError):
+                discounts.validate('SPRING', now=self.discount.end + timedelta(seconds=1))
+        with self.assertRaises(discounts.DiscountError):
+            discounts.validate('UNKNOWN')
+        with self.assertNumQueries(0), self.assertRaises(discounts.DiscountError):
+            discounts.validate('UNKNOWN')
+
+    def test_changes_drop_cached_codes(self):
+        discounts.validate('SPRING')
+        self.discount.code = 'SUMMER'
+        self.discount.save()
+        with self.assertRaises(discounts.DiscountError):
+            discounts.validate('SPRING')
+        discounts.validate('SUMMER')
+        self.discount.is_active = False
+        self.discount.save()
+        with self.assertRaises(discounts.DiscountError):
+            discounts.validate('SUMMER')
+
+
+class OrderHistoryTests(TestCase):
+    url = '/orders/api/orders/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = create_product('book', stock=5)
+        cls.user = get_user_model().objects.create(email='buyer@example.com')
+        cls.orders = [cls.create_order(cls.user, items=1 + i % 3) for i in range(12)]
+        cls.create_order(get_user_model().objects.create(email='other@example.com'))
+
+    @classmethod
+    def create_order(cls, user, items=1):
+        order = Order.objects.create(
+            user=user, transport=Transport.objects.create(name_company='post'), total_price=1000,
+        )
+        for i in range(items):
+            product = cls.book if i == 0 else create_product(f'book-{order.pk}-{i}', stock=1)
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=1000)
+        return order
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_pages_cover_the_users_orders_newest_first(self):
+        ids, url = [], f'{self.url}?page_size=5'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(order['id'] for order in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, [order.pk for order in reversed(self.orders)])
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        for page_size in (2, 12):
+            with self.assertNumQueries(2):
+                response = self.client.get(self.url, {'page_size': page_size})
+        order = response.data['results'][0]
+        self.assertEqual(order['transport']['name_company'], 'post')
+        self.assertEqual(len(order['items']), len(self.orders[-1].items.all()))
+
+    def test_summary(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'summary': 1})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'status', 'total_price', 'discount_price', 'created'})
+
+    def test_only_own_orders(self):
+        other = Order.objects.exclude(user=self.user).get()
+        self.assertEqual(self.client.get(f'{self.url}{other.pk}/').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}{self.orders[0].pk}/').status_code, 200)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    @skipUnless(connection.vendor == 'sqlite', 'query plans are checked with SQLite EXPLAIN QUERY PLAN')
+    def test_pages_are_read_from_the_user_index(self):
+        cursor = self.client.get(self.url, {'page_size': 2, 'summary': 1}).data['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(cursor)
+        with connection.cursor() as explain:
+            explain.execute(f'EXPLAIN QUERY PLAN {queries[0]["sql"]}')
+            plan = ' '.join(row[-1] for row in explain.fetchall())
+        self.assertIn('order_user_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class OrderItemExportTests(TestCase):
+    url = '/orders/api/order-items/export/'
+
+    @classmethod
+    def setUpTestData(cls):
+        book = create_product('book', stock=5)
+        cls.user = get_user_model().objects.create(email='buyer@example.com')
+        cls.staff = get_user_model().objects.create(email='staff@example.com', is_staff=True)
+        for status in ('pending', 'paid'):
+            order = Order.objects.create(
+                user=cls.user, transport=Transport.objects.create(name_company='post'), status=status, total_price=1000,
+            )
+            OrderItem.objects.create(order=order, product=book, quantity=2, price=1000)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response, content = self.export()
+        self.assertIn('filename="order-items.ndjson"', response['Content-Disposition'])
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['order__status'] for row in rows], ['pending', 'paid'])
+        self.assertEqual(rows[0]['quantity'], 2)
+
+    def test_csv_by_status(self):
+        response, content = self.export(output='csv', status='paid')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual((rows[0]['order__status'], rows[0]['quantity']), ('paid', '2'))
+
+    def test_unknown_output(self):
+        self.assertEqual(self.client.get(self.url, {'output': 'xml'}).status_code, 400)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+
+class OrderTransitionTests(TestCase):
+    url = '/orders/api/orders/transitions/'
+
+    def setUp(self):
+        self.book = create_product('book', stock=5)
+        self.user = get_user_model().objects.create(email='buyer@example.com')
+        self.staff = get_user_model().objects.create(email='staff@example.com', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def create_order(self, status='pending', quantity=1):
+        order = Order.objects.create(
+            user=self.user, transport=Transport.objects.create(name_company='post'), status=status, total_price=1000,
+        )
+        OrderItem.objects.create(order=order, product=self.book, quantity=quantity, price=1000)
+        return order
+
+    def test_moves_orders_and_reports_each(self):
+        shipped, paid, done = self.create_order('processing'), self.create_order('paid'), self.create_order('completed')
+        results = services.transition_orders([
+            {'order': shipped.pk, 'status': 'shipped', 'tracking_code': 'TR-1'},
+            {'order': paid.pk, 'status': 'processing'},
+            {'order': done.pk, 'status': 'pending'},
+            {'order': 0, 'status': 'paid'},
+        ])
+        self.assertEqual(results, [
+            {'order': shipped.pk, 'ok': True, 'status': 'shipped'},
+            {'order': paid.pk, 'ok': True, 'status': 'processing'},
+            {'order': done.pk, 'ok': False, 'error': 'Cannot move an order from "completed" to "pending".'},
+            {'order': 0, 'ok': False, 'error': 'Order not found.'},
+        ])
+        self.assertEqual(
+            dict(Order.objects.values_list('pk', 'status')),
+            {shipped.pk: 'shipped', paid.pk: 'processing', done.pk: 'completed'},
+        )
+        transport = Transport.objects.get(orders=shipped)
+        self.assertEqual(transport.tracking_code, 'TR-1')
+        self.assertIsNotNone(transport.send_date)
+
+    def test_null_send_date_on_shipping_gets_the_current_time(self):
+        order = self.create_order('processing')
+        response = self.client.post(
+            self.url, {'orders': [{'order': order.pk, 'status': 'shipped', 'send_date': None}]}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(Transport.objects.get(orders=order).send_date)
+
+    def test_shipping_only_update(self):
+        order = self.create_order('shipped')
+        sent = timezone.now() - timedelta(days=1)
+        results = services.transition_orders([{'order': order.pk, 'tracking_code': 'TR-2', 'send_date': sent}])
+        self.assertEqual(results, [{'order': order.pk, 'ok': True, 'status': 'shipped'}])
+        transport = Transport.objects.get(orders=order)
+        self.assertEqual((transport.tracking_code, transport.send_date), ('TR-2', sent))
+
+    def test_paid_orders_are_announced_once_and_canceled_stock_put_back(self):
+        pending = [self.create_order() for _ in range(3)]
+        canceled = self.create_order('paid', quantity=2)
+        announced = []
+
+        def receiver(sender, order_ids, **kwargs):
+            announced.append(sorted(order_ids))
+        order_paid.connect(receiver)
+        self.addCleanup(order_paid.disconnect, receiver)
+
+        services.transition_orders(
+            [{'order': order.pk, 'status': 'paid'} for order in pending]
+            + [{'order': canceled.pk, 'status': 'canceled'}]
+        )
+        self.assertEqual(announced, [[order.pk for order in pending]])
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 7)
+
+    def test_canceled_orders_leave_the_sales_rollup(self):
+        from products.models import ProductDailySales
+
+        first, second = self.create_order(quantity=1), self.create_order(quantity=1)
+        services.transition_orders([{'order': order.pk, 'status': 'paid'} for order in (first, second)])
+        services.transition_orders([{'order': first.pk, 'status': 'canceled'}])
+        self.assertEqual(ProductDailySales.objects.get(product=self.book).quantity, 1)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        for count in (1, 20):
+            orders = [self.create_order('processing') for _ in range(count)]
+            # savepoint, select, status update, transport update, release
+            with self.assertNumQueries(5):
+                services.transition_orders(
+                    [{'order': order.pk, 'status': 'shipped', 'tracking_code': f'TR-{order.pk}'} for order in orders]
+                )
+
+    def test_api(self):
+        order = self.create_order()
+        response = self.client.post(
+            self.url, {'orders': [{'order': order.pk, 'status': 'paid'}]}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [{'order': order.pk, 'ok': True, 'status': 'paid'}])
+
+        response = self.client.post(self.url, {'orders': [{'order': order.pk, 'status': 'lost'}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.post(self.url, {'orders': []}, format='json').status_code, 403)
+
+    def test_orders_listed_twice_are_rejected(self):
+        first, second = self.create_order('paid'), self.create_order()
+        response = self.client.post(self.url, {'orders': [
+            {'order': first.pk, 'status': 'processing'},
+            {'order': second.pk, 'status': 'paid'},
+            {'order': second.pk, 'status': 'processing'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(second.pk), str(response.data['orders']))
+        self.assertEqual(Order.objects.get(pk=first.pk).status, 'paid')
+        with self.assertRaises(ValueError):
+            services.transition_orders([{'order': second.pk}, {'order': second.pk}])
+
+
+class StockReservationTests(TestCase):
+
+    def setUp(self):
+        self.cart = create_cart('buyer@example.com')
+        self.book = create_product('book', stock=5)
+        self.other = create_product('other', stock=2)
+
+    def stock(self, product):
+        product.refresh_from_db(fields=['stock'])
+        return product.stock
+
+    def test_reserve_takes_stock_for_every_product(self):
+        with CaptureQueriesContext(connection) as one:
+            services.reserve(self.cart, {self.book.pk: 1})
+        with CaptureQueriesContext(connection) as two:
+            services.reserve(self.cart, {self.book.pk: 2, self.other.pk: 2})
+        self.assertEqual(len(one), len(two))
+        self.assertEqual(self.stock(self.book), 2)
+        self.assertEqual(self.stock(self.other), 0)
+        self.assertEqual(self.cart.reservations.count(), 3)
+
+    def test_shortage_reserves_nothing(self):
+        with self.assertRaises(services.InsufficientStock) as raised:
+            services.reserve(self.cart, {self.book.pk: 3, self.other.pk: 3})
+        self.assertEqual(raised.exception.shortages, {self.other.pk: 2})
+        self.assertEqual(self.stock(self.book), 5)
+        self.assertEqual(self.stock(self.other), 2)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_release_returns_stock(self):
+        services.reserve(self.cart, {self.book.pk: 3, self.other.pk: 1})
+        services.reserve(self.cart, {self.book.pk: 1})
+        self.assertEqual(services.release(self.cart, [self.book.pk]), 2)
+        self.assertEqual(self.stock(self.book), 5)
+        self.assertEqual(self.stock(self.other), 1)
+
+    def test_release_expired(self):
+        other_cart = create_cart('other@example.com')
+        services.reserve(self.cart, {self.book.pk: 2}, ttl=timedelta(minutes=-1))
+        services.reserve(other_cart, {self.book.pk: 1})
+        self.assertEqual(services.release_expired(batch_size=1), 1)
+        self.assertEqual(self.stock(self.book), 4)
+        self.assertEqual(list(StockReservation.objects.values_list('cart', flat=True)), [other_cart.pk])
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    """
+    Many buyers racing for the last copies of one book must never oversell.
+    """
+    threads = 24
+    stock = 10
+
+    def test_hot_book_is_never_oversold(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('an in-memory SQLite database cannot be shared between threads')
+        book = create_product('hot-book', stock=self.stock)
+        carts = [create_cart(f'buyer{i}@example.com') for i in range(self.threads)]
+        results = []
+        start = threading.Barrier(self.threads)
+
+        def buy(cart):
+            start.wait()
+            try:
+                for attempt in range(50):
+                    try:
+                        services.reserve(cart, {book.pk: 1})
+                        results.append(True)
+                        return
+                    except services.InsufficientStock:
+                        results.append(False)
+                        return
+                    except OperationalError:
+                        # SQLite allows a single writer; wait for the lock
+                        time.sleep(0.01 * (attempt + 1))
+                results.append(None)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        workers = [threading.Thread(target=buy, args=(cart,)) for cart in carts]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        book.refresh_from_db()
+        self.assertNotIn(None, results)
+        self.assertEqual(results.count(True), self.stock)
+        self.assertEqual(book.stock, 0)
+        self.assertEqual(
+            sum(StockReservation.objects.values_list('quantity', flat=True)),
+            self.stock,
+        )
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """
+    Concurrent checkouts of carts holding the last copies of a book must
+    sell exactly the stock, each either completing or failing cleanly.
+    """
+    threads = 12
+    stock = 5
+
+    def test_concurrent_checkouts(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('an in-memory SQLite database cannot be shared between threads')
+        book = create_product('hot-book', stock=self.stock)
+        carts = [create_cart(f'buyer{i}@example.com') for i in range(self.threads)]
+        for cart in carts:
+            fill_cart(cart, [book])
+        results = []
+        start = threading.Barrier(self.threads)
+
+        def buy(cart):
+            start.wait()
+            try:
+                for attempt in range(100):
+                    try:
+                        services.checkout(cart, 'post')
+                        results.append(True)
+                        return
+                    except services.InsufficientStock:
+                        results.append(False)
+                        return
+                    except OperationalError:
+                        # SQLite allows a single writer; wait for the lock
+                        time.sleep(0.01 * (attempt + 1))
+                results.append(None)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        workers = [threading.Thread(target=buy, args=(cart,)) for cart in carts]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        book.refresh_from_db()
+        self.assertNotIn(None, results)
+        self.assertEqual(results.count(True), self.stock)
+        self.assertEqual(book.stock, 0)
+        self.assertEqual(Order.objects.count(), self.stock)
+        self.assertEqual(CartItem.objects.count(), self.threads - self.stock)
+
+
+class DiscountConcurrencyTests(TransactionTestCase):
+    """
+    Concurrent checkouts redeeming the same code must never exceed its
+    per-user limit.
+    """
+    threads = 12
+    limit = 3
+
+    def test_limit_is_never_exceeded(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('an in-memory SQLite database cannot be shared between threads')
+        cache.clear()
+        user = get_user_model().objects.create(email='buyer@example.com')
+        create_discount('SPRING', usage_limit_per_user=self.limit)
+        results = []
+        start = threading.Barrier(self.threads)
+
+        def redeem():
+            start.wait()
+            try:
+                for attempt in range(50):
+                    try:
+                        discounts.redeem(user.pk, 'SPRING')
+                        results.append(True)
+                        return
+                    except discounts.DiscountError:
+                        results.append(False)
+                        return
+                    except OperationalError:
+                        time.sleep(0.01 * (attempt + 1))
+                results.append(None)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        workers = [threading.Thread(target=redeem) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertNotIn(None, results)
+        self.assertEqual(results.count(True), self.limit)
+        self.assertEqual(DiscountUser.objects.get().used_count, self.limit)
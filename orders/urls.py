@@ -0,0 +1,18 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+from . import views
+
+
+router = DefaultRouter()
+router.register(r'orders', views.OrderHistoryViewSet, basename='order')
+
+
+app_name = 'orders'
+
+urlpatterns = [
+    # before the router, whose detail route would take "transitions" for a pk
+    path('api/orders/transitions/', views.OrderTransitionView.as_view(), name='order-transitions'),
+    path('api/', include(router.urls)),
+    path('api/checkout/', views.CheckoutView.as_view(), name='checkout'),
+    path('api/order-items/export/', views.OrderItemExportView.as_view(), name='order-item-export'),
+]
@@ -1,3 +1,120 @@
-from django.shortcuts import render
+from django.db.models import Prefetch
+from rest_framework import status, viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from utils.exports import EXPORT_FORMATS, streaming_export
+from utils.pagination import KeysetPagination
+from . import models
+from . import serializers
+from . import services
 
-# Create your views here.
+
+class OrderItemExportView(APIView):
+    """
+    Stream every order item as NDJSON or CSV, for staff only.
+
+    Query params:
+        output: ``ndjson`` (default) or ``csv``.
+        status: Only export items of orders in this status.
+    """
+    permission_classes = [IsAdminUser]
+    export_fields = (
+        'id', 'order_id', 'order__status', 'product_id', 'product_title',
+        'product_sku', 'quantity', 'price', 'discount_price', 'created',
+    )
+
+    def get(self, request):
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'output': f'Must be one of: {", ".join(EXPORT_FORMATS)}.'})
+
+        queryset = models.OrderItem.objects.order_by('pk')
+        if request.query_params.get('status'):
+            queryset = queryset.filter(order__status=request.query_params['status'])
+        return streaming_export(queryset, self.export_fields, export_format, filename='order-items')
+
+
+class CheckoutView(APIView):
+    """
+    Turn one of the user's carts into a pending order.
+
+    Body:
+        cart: The cart id.
+        transport: Name of the shipping company.
+        discount_code: Optional discount code.
+
+    Answers 201 with the order and its items, 400 for an empty cart or an
+    unusable code, and 409 with the ``shortages`` (product id -> quantity
+    still available) when stock ran out.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = serializers.CheckoutSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            order = services.checkout(data['cart'], data['transport'], data.get('discount_code'))
+        except services.CheckoutError as exc:
+            raise ValidationError({exc.field: [str(exc)]})
+        except services.InsufficientStock as exc:
+            return Response(
+                {'detail': str(exc), 'shortages': exc.shortages},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        response = serializers.OrderSerializer(order).data
+        response['items'] = serializers.OrderItemSerializer(order.items.all(), many=True).data
+        return Response(response, status=status.HTTP_201_CREATED)
+
+
+class OrderTransitionView(APIView):
+    """
+    Move many orders to new statuses and update their shipping, for staff.
+
+    Body:
+        orders: Up to 10000 ``{order, status, tracking_code, send_date}``
+                objects; all but ``order`` are optional.
+
+    Answers 200 with one ``{order, ok, status}`` or ``{order, ok, error}``
+    result per entry, in order: orders that cannot make their move are
+    reported and left untouched, the others are applied.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = serializers.BulkOrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({'results': services.transition_orders(serializer.validated_data['orders'])})
+
+
+class OrderHistoryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    The authenticated user's orders, newest first.
+
+    Lists are keyset-paginated on ``(-created, -id)`` over the
+    ``(user, -created, -id)`` index, so a page costs the same however many
+    orders the user has. Full pages load transport and items in two
+    queries; with ``?summary=1`` only totals and status are read, in one.
+    """
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    summary_fields = ('id', 'status', 'total_price', 'discount_price', 'created')
+
+    def is_summary(self):
+        return self.request.query_params.get('summary', '').lower() in ('1', 'true', 'yes')
+
+    def get_serializer_class(self):
+        if self.is_summary():
+            return serializers.OrderSummarySerializer
+        return serializers.OrderHistorySerializer
+
+    def get_queryset(self):
+        queryset = models.Order.objects.filter(user=self.request.user)
+        if self.is_summary():
+            return queryset.only(*self.summary_fields)
+        return queryset.select_related('transport').prefetch_related(
+            Prefetch('items', queryset=models.OrderItem.objects.order_by('pk'))
+        )
@@ -0,0 +1,90 @@
+"""
+Hot keys of ``Product.more`` materialized into real, indexed columns.
+
+``more`` is free-form JSON filled by editors and catalog feeds, so filtering
+on it means parsing JSON on every row. The keys listed in ``MORE_COLUMNS``
+are copied (normalized) into columns of the same name whenever a product is
+written: in ``Product.save()``, and through the ``pre_bulk_create`` signal
+for the bulk paths. Rows written before a key was declared are filled by
+the ``backfill_more_columns`` command.
+
+To declare a new hot key, add the column to Product (``editable=False``,
+indexed), add it here with its parser and run the backfill.
+"""
+import re
+
+from .search import normalize_text
+
+
+_NUMBER_RE = re.compile(r'\d+')
+
+
+def parse_isbn(value):
+    """
+    ``"978-600-123-456-7"`` -> ``"9786001234567"``; digits (and a final X)
+    only, so hyphenated and plain ISBNs match.
+    """
+    text = normalize_text(str(value)).upper()
+    return ''.join(char for char in text if char.isdigit() or char == 'X')[:20]
+
+
+def parse_number(value):
+    """
+    The first integer in ``value``: ``320``, ``"۳۲۰"`` and ``"320 صفحه"``
+    all give 320. None when there is no number.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if value >= 0 else None
+    match = _NUMBER_RE.search(normalize_text(str(value)))
+    return int(match.group()) if match else None
+
+
+def parse_year(value):
+    year = parse_number(value)
+    return year if year is not None and year < 10000 else None
+
+
+def parse_label(value):
+    return normalize_text(str(value)).strip()[:50]
+
+
+# column -> (key in ``more``, parser, value when the key is missing)
+MORE_COLUMNS = {
+    'isbn': ('isbn', parse_isbn, ''),
+    'page_count': ('page_count', parse_number, None),
+    'publish_year': ('publish_year', parse_year, None),
+    'cover_type': ('cover_type', parse_label, ''),
+}
+
+
+def extract(more):
+    """
+    Return ``{column: value}`` for every declared key of a ``more`` dict.
+    """
+    more = more if isinstance(more, dict) else {}
+    values = {}
+    for column, (key, parse, empty) in MORE_COLUMNS.items():
+        value = more.get(key)
+        if value is None or value == '':
+            values[column] = empty
+        else:
+            parsed = parse(value)
+            values[column] = empty if parsed is None else parsed
+    return values
+
+
+def sync(product):
+    """
+    Copy the declared keys of ``product.more`` onto its columns.
+
+    Returns:
+        bool: Whether any column changed.
+    """
+    changed = False
+    for column, value in extract(product.more).items():
+        if getattr(product, column) != value:
+            setattr(product, column, value)
+            changed = True
+    return changed
@@ -0,0 +1,444 @@
+"""
+In-process prefix index answering the search box's typeahead requests.
+
+Product names, authors and publisher names are kept in a sorted array of
+normalized keys, one per word position, so "پاتر" finds "هری پاتر". A
+prefix is two binary searches; the matching range is ranked by popularity
+(copies sold). Large ranges, i.e. one or two typed letters, have their top
+suggestions memoized until an entry under that prefix changes.
+
+Each process builds its own index in the background as the server starts
+(see ``Autocomplete.warm_up``), or on first use otherwise, and applies the
+Product/Publisher signals of its own process; bulk writes are merged into
+the sorted arrays in one pass. Popularity and changes made by other
+processes are picked up by a background rebuild once the index is older
+than ``AUTOCOMPLETE_MAX_AGE`` seconds.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+
+from .search import normalize_text
+
+
+# longest key stored per word position, and how many word positions of a
+# label are indexed; longer queries are matched on their first MAX_KEY_LENGTH
+# characters and then checked against the full label
+MAX_KEY_LENGTH = 40
+MAX_WORDS = 6
+MAX_LIMIT = 20
+
+
+def index_keys(text):
+    words = normalize_text(text).split()[:MAX_WORDS]
+    return {' '.join(words[start:])[:MAX_KEY_LENGTH] for start in range(len(words))}
+
+
+class PrefixIndex:
+    """
+    Sorted-array prefix index of suggestions ranked by popularity.
+
+    Entries are identified by hashable ids such as ``('product', 12)`` and
+    carry a label (the indexed text) and a JSON-ready payload.
+    """
+    # ranges larger than this are ranked once and memoized per prefix
+    scan_limit = 2000
+    # batches from this size on are merged by add_many in one pass
+    merge_threshold = 100
+
+    def __init__(self):
+        self._keys = []
+        self._ids = []
+        self._labels = {}
+        self._payloads = {}
+        self._popularity = {}
+        self._top = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._labels)
+
+    def __contains__(self, entry_id):
+        return entry_id in self._labels
+
+    def add(self, entry_id, label, payload, popularity=0):
+        with self._lock:
+            if entry_id in self._labels:
+                self.remove(entry_id)
+            self._labels[entry_id] = label
+            self._payloads[entry_id] = payload
+            self._popularity[entry_id] = popularity
+            for key in index_keys(label):
+                position = bisect_left(self._keys, key)
+                self._keys.insert(position, key)
+                self._ids.insert(position, entry_id)
+                self._forget(key)
+
+    def remove(self, entry_id):
+        with self._lock:
+            label = self._labels.pop(entry_id, None)
+            if label is None:
+                return
+            del self._payloads[entry_id]
+            del self._popularity[entry_id]
+            for key in index_keys(label):
+                position = bisect_left(self._keys, key)
+                while position < len(self._keys) and self._keys[position] == key:
+                    if self._ids[position] == entry_id:
+                        del self._keys[position]
+                        del self._ids[position]
+                        break
+                    position += 1
+                self._forget(key)
+
+    def add_many(self, entries):
+        """
+        Add or replace many ``(entry_id, label, payload, popularity)``
+        entries at once.
+
+        Small batches go through ``add``. Larger ones are sorted and merged
+        into the arrays in a single pass, copying the runs between two new
+        keys as slices, instead of one ``list.insert`` (a pass each) per key.
+        """
+        entries = list({entry[0]: entry for entry in entries}.values())
+        with self._lock:
+            if len(entries) < self.merge_threshold:
+                for entry in entries:
+                    self.add(*entry)
+                return
+            keys, ids = self._keys, self._ids
+            replaced = {entry_id for entry_id, *_ in entries if entry_id in self._labels}
+            if replaced:
+                kept = [pair for pair in zip(keys, ids) if pair[1] not in replaced]
+                keys, ids = [key for key, _ in kept], [entry_id for _, entry_id in kept]
+            added = []
+            for entry_id, label, payload, popularity in entries:
+                self._labels[entry_id] = label
+                self._payloads[entry_id] = payload
+                self._popularity[entry_id] = popularity
+                added.extend((key, entry_id) for key in index_keys(label))
+            added.sort(key=itemgetter(0))
+
+            merged_keys, merged_ids, start = [], [], 0
+            for key, entry_id in added:
+                position = bisect_left(keys, key, start)
+                merged_keys += keys[start:position]
+                merged_ids += ids[start:position]
+                merged_keys.append(key)
+                merged_ids.append(entry_id)
+                start = position
+            self._keys = merged_keys + keys[start:]
+            self._ids = merged_ids + ids[start:]
+            self._top.clear()
+
+    def set_popularity(self, entry_id, popularity):
+        with self._lock:
+            if entry_id not in self._labels or self._popularity[entry_id] == popularity:
+                return
+            self._popularity[entry_id] = popularity
+            for key in index_keys(self._labels[entry_id]):
+                self._forget(key)
+
+    def popularity(self, entry_id):
+        return self._popularity.get(entry_id, 0)
+
+    def payload(self, entry_id):
+        return self._payloads.get(entry_id)
+
+    def load(self, entries):
+        """
+        Bulk-load ``(entry_id, label, payload, popularity)`` tuples into an
+        empty index with a single sort.
+        """
+        pairs = []
+        for entry_id, label, payload, popularity in entries:
+            self._labels[entry_id] = label
+            self._payloads[entry_id] = payload
+            self._popularity[entry_id] = popularity
+            pairs.extend((key, entry_id) for key in index_keys(label))
+        pairs.sort(key=lambda pair: pair[0])
+        self._keys = [key for key, _ in pairs]
+        self._ids = [entry_id for _, entry_id in pairs]
+
+    def suggest(self, query, limit=10):
+        """
+        Return the payloads of the ``limit`` most popular entries having a
+        word that starts with ``query`` (or a run of words, for multi-word
+        queries).
+        """
+        normalized = ' '.join(normalize_text(query).split())
+        if not normalized:
+            return []
+        prefix = normalized[:MAX_KEY_LENGTH]
+        limit = min(limit, MAX_LIMIT)
+        with self._lock:
+            low = bisect_left(self._keys, prefix)
+            high = bisect_left(self._keys, prefix + '\uffff', low)
+            if high - low > self.scan_limit and len(prefix) == len(normalized):
+                top = self._top.get(prefix)
+                if top is None:
+                    top = self._top[prefix] = self._rank(low, high, MAX_LIMIT)
+                ranked = top[:limit]
+            else:
+                ranked = self._rank(low, high, limit, None if prefix == normalized else normalized)
+            return [self._payloads[entry_id] for entry_id in ranked]
+
+    def _rank(self, low, high, limit, full_query=None):
+        candidates = set(self._ids[low:high])
+        if full_query is not None:
+            candidates = {
+                entry_id for entry_id in candidates
+                if any(key.startswith(full_query) for key in self._full_keys(entry_id))
+            }
+        popularity, labels = self._popularity, self._labels
+        return heapq.nsmallest(
+            limit,
+            candidates,
+            key=lambda entry_id: (-popularity[entry_id], len(labels[entry_id]), labels[entry_id]),
+        )
+
+    def _full_keys(self, entry_id):
+        words = normalize_text(self._labels[entry_id]).split()
+        return [' '.join(words[start:]) for start in range(len(words))]
+
+    def _forget(self, key):
+        # memoized rankings of every prefix of a changed key are stale
+        if self._top:
+            for length in range(1, len(key) + 1):
+                self._top.pop(key[:length], None)
+
+
+class CatalogIndex(PrefixIndex):
+    """
+    PrefixIndex of products, authors and publishers.
+
+    Authors are entries of their own, kept while at least one book has
+    them; their popularity is the sum of their books'.
+    """
+    def __init__(self):
+        super().__init__()
+        self.author_books = {}
+
+    @classmethod
+    def build(cls):
+        """
+        Build the index from the database. Popularity is the number of
+        copies sold; authors and publishers add up their books' sales.
+        """
+        from orders.models import Order
+        from .models import Product, Publisher
+
+        entries = []
+        authors = {}
+        publisher_sales = {}
+        products = (
+            Product.objects.order_by()
+            .annotate(sold=Coalesce(
+                Sum('order_items__quantity', filter=Q(order_items__order__status__in=Order.SOLD_STATUSES)),
+                0,
+            ))
+            .values_list('pk', 'slug', 'name', 'author', 'publisher_id', 'sold')
+        )
+        for pk, slug, name, author, publisher_id, sold in products.iterator(chunk_size=5000):
+            entries.append((('product', pk), name, product_payload(pk, slug, name), sold))
+            author_key = normalize_text(author).strip()
+            if author_key:
+                entry = authors.setdefault(author_key, [author, 0, 0])
+                entry[1] += 1
+                entry[2] += sold
+            publisher_sales[publisher_id] = publisher_sales.get(publisher_id, 0) + sold
+
+        for author_key, (author, _, sold) in authors.items():
+            entries.append((('author', author_key), author, author_payload(author), sold))
+        publishers = Publisher.objects.values_list('pk', 'slug', 'name')
+        for pk, slug, name in publishers.iterator(chunk_size=5000):
+            entries.append((('publisher', pk), name, publisher_payload(pk, slug, name), publisher_sales.get(pk, 0)))
+
+        index = cls()
+        index.load(entries)
+        index.author_books = {author_key: count for author_key, (_, count, _) in authors.items()}
+        return index
+
+    def save_product(self, product, previous_author=None):
+        """
+        Add or update a product; ``previous_author`` is its author before
+        this save (None for new products or when unknown).
+        """
+        entry_id = ('product', product.pk)
+        with self._lock:
+            known = entry_id in self
+            sold = self.popularity(entry_id)
+            self.add(entry_id, product.name, product_payload(product.pk, product.slug, product.name), sold)
+            if known:
+                if previous_author is None or previous_author == product.author:
+                    return
+                self._remove_book(previous_author, sold)
+            self._add_book(product.author, sold)
+
+    def save_products(self, products):
+        """
+        Add or update many products at once, e.g. after a bulk create.
+
+        Authors of products already indexed are left as they are, as for
+        ``save_product`` without a ``previous_author``.
+        """
+        with self._lock:
+            entries, new_authors = [], {}
+            for product in products:
+                entry_id = ('product', product.pk)
+                sold = self.popularity(entry_id)
+                if entry_id not in self:
+                    author_key = normalize_text(product.author).strip()
+                    if author_key:
+                        self.author_books[author_key] = self.author_books.get(author_key, 0) + 1
+                        if ('author', author_key) not in self and author_key not in new_authors:
+                            new_authors[author_key] = (
+                                ('author', author_key), product.author, author_payload(product.author), 0,
+                            )
+                entries.append((entry_id, product.name, product_payload(product.pk, product.slug, product.name), sold))
+            self.add_many([*entries, *new_authors.values()])
+
+    def save_publishers(self, publishers):
+        self.add_many(
+            (
+                ('publisher', publisher.pk),
+                publisher.name,
+                publisher_payload(publisher.pk, publisher.slug, publisher.name),
+                self.popularity(('publisher', publisher.pk)),
+            )
+            for publisher in publishers
+        )
+
+    def delete_product(self, pk, author):
+        entry_id = ('product', pk)
+        with self._lock:
+            if entry_id in self:
+                self._remove_book(author, self.popularity(entry_id))
+                self.remove(entry_id)
+
+    def save_publisher(self, publisher):
+        entry_id = ('publisher', publisher.pk)
+        payload = publisher_payload(publisher.pk, publisher.slug, publisher.name)
+        self.add(entry_id, publisher.name, payload, self.popularity(entry_id))
+
+    def delete_publisher(self, pk):
+        self.remove(('publisher', pk))
+
+    def _add_book(self, author, sold):
+        author_key = normalize_text(author).strip()
+        if not author_key:
+            return
+        entry_id = ('author', author_key)
+        self.author_books[author_key] = self.author_books.get(author_key, 0) + 1
+        if entry_id in self:
+            self.set_popularity(entry_id, self.popularity(entry_id) + sold)
+        else:
+            self.add(entry_id, author, author_payload(author), sold)
+
+    def _remove_book(self, author, sold):
+        author_key = normalize_text(author).strip()
+        if author_key not in self.author_books:
+            return
+        entry_id = ('author', author_key)
+        self.author_books[author_key] -= 1
+        if self.author_books[author_key] <= 0:
+            del self.author_books[author_key]
+            self.remove(entry_id)
+        else:
+            self.set_popularity(entry_id, max(self.popularity(entry_id) - sold, 0))
+
+
+def product_payload(pk, slug, name):
+    return {'type': 'product', 'id': pk, 'slug': slug, 'text': name}
+
+
+def author_payload(author):
+    return {'type': 'author', 'text': author}
+
+
+def publisher_payload(pk, slug, name):
+    return {'type': 'publisher', 'id': pk, 'slug': slug, 'text': name}
+
+
+class Autocomplete:
+    """
+    The process-wide CatalogIndex: built on first use and rebuilt in a
+    background thread once older than ``AUTOCOMPLETE_MAX_AGE`` seconds,
+    serving the previous index meanwhile.
+    """
+    def __init__(self):
+        self._index = None
+        self._built_at = 0
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        # set whenever a background build finishes, successful or not
+        self._built = threading.Event()
+
+    @property
+    def index(self):
+        """
+        The current index, or None if it has not been built yet (signals
+        then have nothing to update).
+        """
+        return self._index
+
+    def warm_up(self):
+        """
+        Start building the index in the background, at server startup, so
+        the first typeahead request does not wait for it.
+        """
+        if self._index is None:
+            self._rebuild_in_background()
+
+    def get_index(self):
+        if self._index is None:
+            if self._rebuilding:
+                # the warm-up build is already running
+                self._built.wait()
+            with self._lock:
+                if self._index is None:
+                    self._install(CatalogIndex.build())
+        elif time.monotonic() - self._built_at > getattr(settings, 'AUTOCOMPLETE_MAX_AGE', 3600):
+            self._rebuild_in_background()
+        return self._index
+
+    def suggest(self, query, limit=10):
+        return self.get_index().suggest(query, limit)
+
+    def reset(self):
+        with self._lock:
+            self._index = None
+
+    def _install(self, index):
+        self._index = index
+        self._built_at = time.monotonic()
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+            self._built.clear()
+
+        def rebuild():
+            close_old_connections()
+            try:
+                index = CatalogIndex.build()
+                with self._lock:
+                    self._install(index)
+            finally:
+                self._rebuilding = False
+                self._built.set()
+                close_old_connections()
+
+        threading.Thread(target=rebuild, name='autocomplete-rebuild', daemon=True).start()
+
+
+autocomplete = Autocomplete()
@@ -0,0 +1,143 @@
+"""
+Bestseller rankings read from the ProductDailySales rollup.
+
+``record_orders`` adds the items of newly paid orders to the rollup with
+a few queries per batch of orders, whatever the size of the order
+history, and ``remove_orders`` takes canceled ones back out; ``rebuild``
+recomputes it from every sold order. A ranking then
+sums at most ``MAX_DAYS`` rows per product, read from the
+``(day, product, quantity)`` index alone.
+
+Sales are dated by the day the order was placed, so the incremental and
+the rebuilt rollup agree.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+
+# longest ranking window, in days
+MAX_DAYS = 365
+
+# products incremented per UPDATE
+PRODUCTS_PER_UPDATE = 500
+
+
+def _daily_totals(items):
+    """
+    Group an OrderItem queryset into ``{product, day, total}`` rows.
+    """
+    return (
+        items.order_by()
+        .values('product', day=TruncDate('order__created'))
+        .annotate(total=Sum('quantity'))
+    )
+
+
+def record_orders(order_ids):
+    """
+    Add the items of newly paid orders to the daily sales.
+
+    Rows are created on first use and incremented with one
+    ``quantity = quantity + n`` statement per distinct amount and day.
+    """
+    _add_orders(order_ids, 1)
+
+
+def remove_orders(order_ids):
+    """
+    Take the items of sold orders that were canceled out of the daily
+    sales, dropping the rows left empty.
+    """
+    _add_orders(order_ids, -1)
+
+
+def _add_orders(order_ids, sign):
+    from orders.models import OrderItem
+    from .models import ProductDailySales
+
+    by_amount = defaultdict(lambda: defaultdict(list))
+    for row in _daily_totals(OrderItem.objects.filter(order__in=list(order_ids))):
+        if row['total']:
+            by_amount[sign * row['total']][row['day']].append(row['product'])
+    if not by_amount:
+        return
+
+    with transaction.atomic():
+        if sign > 0:
+            ProductDailySales.objects.bulk_create(
+                [
+                    ProductDailySales(product_id=product, day=day)
+                    for days in by_amount.values() for day, products in days.items() for product in products
+                ],
+                ignore_conflicts=True,
+            )
+        for amount, days in by_amount.items():
+            # quantities are unsigned, so a decrement stops at zero
+            quantity = F('quantity') + amount if amount > 0 else Greatest(F('quantity') + amount, Value(0))
+            for day, products in days.items():
+                for start in range(0, len(products), PRODUCTS_PER_UPDATE):
+                    ProductDailySales.objects.filter(
+                        day=day, product__in=products[start:start + PRODUCTS_PER_UPDATE],
+                    ).update(quantity=quantity)
+        if sign < 0:
+            # a rebuild stores no row for a day without sales
+            days = {day for by_day in by_amount.values() for day in by_day}
+            ProductDailySales.objects.filter(day__in=days, quantity__lte=0).delete()
+
+
+def rebuild(batch_size=5000):
+    """
+    Recompute the daily sales from every sold order.
+
+    Returns:
+        int: The number of rows stored.
+    """
+    from orders.models import Order, OrderItem
+    from .models import ProductDailySales
+
+    sold = OrderItem.objects.filter(order__status__in=Order.SOLD_STATUSES)
+    stored = 0
+    with transaction.atomic():
+        ProductDailySales.objects.all().delete()
+        batch = []
+        for row in _daily_totals(sold).iterator(chunk_size=batch_size):
+            batch.append(ProductDailySales(product_id=row['product'], day=row['day'], quantity=row['total']))
+            if len(batch) >= batch_size:
+                stored += len(ProductDailySales.objects.bulk_create(batch))
+                batch = []
+        stored += len(ProductDailySales.objects.bulk_create(batch))
+    return stored
+
+
+def ranking(days=7, limit=10, **filters):
+    """
+    Return the best sellers of the last ``days`` days, today included.
+
+    Args:
+        days: Length of the window, at most ``MAX_DAYS``.
+        limit: Number of products returned.
+        **filters: Lookups on the product, such as ``category=3``.
+
+    Returns:
+        list: ``(product_id, copies sold)`` tuples, best first.
+    """
+    from .models import ProductDailySales
+
+    today = timezone.localdate()
+    # the days are listed rather than given as a range: for ``day >= x``
+    # SQLite prefers walking the (product, day) index to skip sorting the
+    # groups, which reads the whole history
+    window = [today - timedelta(days=offset) for offset in range(min(days, MAX_DAYS))]
+    rows = (
+        ProductDailySales.objects
+        .filter(day__in=window, **{f'product__{lookup}': value for lookup, value in filters.items()})
+        .values('product')
+        .annotate(sold=Sum('quantity'))
+        .order_by('-sold', 'product')[:limit]
+    )
+    return [(row['product'], row['sold']) for row in rows]
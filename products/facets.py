@@ -0,0 +1,197 @@
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+
+
+FACETS = ('category', 'publisher', 'language', 'main_topic', 'price_band')
+
+# facet values incremented per UPDATE
+VALUES_PER_UPDATE = 500
+
+# facet name -> Product column it is read from
+_FACET_COLUMNS = {
+    'category': 'category_id',
+    'publisher': 'publisher_id',
+    'language': 'language',
+    'main_topic': 'main_topic',
+    'price_band': 'price',
+}
+
+
+def price_bands():
+    """
+    Return the configured price bands as ``(label, low, high)`` tuples.
+
+    ``high`` is exclusive and ``None`` for the open-ended last band.
+    """
+    bounds = [0, *getattr(settings, 'PRODUCT_PRICE_BANDS', [])]
+    bands = []
+    for low, high in zip(bounds, bounds[1:] + [None]):
+        label = f'{low}-{high}' if high is not None else f'{low}-'
+        bands.append((label, low, high))
+    return bands
+
+
+def price_band(price):
+    """
+    Return the label of the band containing ``price``.
+    """
+    for label, low, high in price_bands():
+        if price >= low and (high is None or price < high):
+            return label
+    return None
+
+
+def price_band_expression(field='price'):
+    """
+    SQL expression mapping ``field`` to its price band label.
+    """
+    whens = [
+        When(Q(**{f'{field}__gte': low}) & (Q(**{f'{field}__lt': high}) if high is not None else Q()), then=Value(label))
+        for label, low, high in price_bands()
+    ]
+    return Case(*whens, output_field=CharField())
+
+
+def facet_values(row):
+    """
+    Map a Product instance, or a dict of its facet columns, to facet values.
+    """
+    get = row.get if isinstance(row, dict) else lambda name: getattr(row, name)
+    values = {}
+    for facet, column in _FACET_COLUMNS.items():
+        value = get(column)
+        if facet == 'price_band':
+            value = price_band(value)
+        values[facet] = str(value) if value is not None else ''
+    return values
+
+
+def snapshot(queryset):
+    """
+    Return the current facet values of every product in ``queryset``.
+    """
+    return [facet_values(row) for row in queryset.values(*_FACET_COLUMNS.values())]
+
+
+def apply_delta(added=(), removed=()):
+    """
+    Adjust the stored facet counts for products entering or leaving the catalog.
+
+    ``added`` and ``removed`` are iterables of ``facet_values`` dicts. Rows
+    are created on first use and updated with one ``count = count + n``
+    statement per distinct delta and facet (and ``VALUES_PER_UPDATE``
+    values), so a single product save costs a handful of queries
+    regardless of catalog size.
+    """
+    from .models import FacetCount
+
+    delta = Counter()
+    for values in added:
+        for facet, value in values.items():
+            delta[(facet, value)] += 1
+    for values in removed:
+        for facet, value in values.items():
+            delta[(facet, value)] -= 1
+
+    by_amount = defaultdict(lambda: defaultdict(list))
+    for (facet, value), amount in delta.items():
+        if amount:
+            by_amount[amount][facet].append(value)
+    if not by_amount:
+        return
+
+    with transaction.atomic():
+        FacetCount.objects.bulk_create(
+            [
+                FacetCount(facet=facet, value=value)
+                for by_facet in by_amount.values() for facet, values in by_facet.items() for value in values
+            ],
+            ignore_conflicts=True,
+        )
+        for amount, by_facet in by_amount.items():
+            for facet, values in by_facet.items():
+                for start in range(0, len(values), VALUES_PER_UPDATE):
+                    FacetCount.objects.filter(
+                        facet=facet, value__in=values[start:start + VALUES_PER_UPDATE],
+                    ).update(count=F('count') + amount)
+
+
+def rebuild():
+    """
+    Recompute every facet count from the Product table.
+    """
+    from .models import FacetCount, Product
+
+    rows = []
+    for facet, column in _FACET_COLUMNS.items():
+        expression = price_band_expression() if facet == 'price_band' else F(column)
+        counts = (
+            Product.objects.order_by()
+            .annotate(facet_value=expression)
+            .values('facet_value')
+            .annotate(total=Count('pk'))
+        )
+        rows.extend(
+            FacetCount(facet=facet, value=str(row['facet_value'] or ''), count=row['total'])
+            for row in counts
+        )
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(rows)
+
+
+def counts(queryset=None):
+    """
+    Return ``{facet: {value: count}}``.
+
+    Without a queryset the precomputed FacetCount table is read. For a
+    filtered queryset the counts are aggregated over the filtered rows
+    only, with one GROUP BY per facet: there is no precomputed table per
+    filter combination, so this path scales with the number of matching
+    products.
+    """
+    from .models import FacetCount
+
+    result = {facet: {} for facet in FACETS}
+    if queryset is None:
+        for facet, value, count in FacetCount.objects.filter(count__gt=0).values_list('facet', 'value', 'count'):
+            result[facet][value] = count
+        return result
+
+    queryset = queryset.order_by()
+    for facet, column in _FACET_COLUMNS.items():
+        expression = price_band_expression() if facet == 'price_band' else F(column)
+        rows = queryset.annotate(facet_value=expression).values('facet_value').annotate(total=Count('pk'))
+        for row in rows:
+            result[facet][str(row['facet_value'] or '')] = row['total']
+    return result
+
+
+def filter_products(queryset, params):
+    """
+    Apply the facet filters found in ``params`` to a Product queryset.
+
+    ``category`` and ``publisher`` take slugs; ``price_band`` takes a band
+    label as returned by ``price_bands``.
+    """
+    if params.get('category'):
+        queryset = queryset.filter(category__slug=params['category'])
+    if params.get('publisher'):
+        queryset = queryset.filter(publisher__slug=params['publisher'])
+    if params.get('language'):
+        queryset = queryset.filter(language=params['language'])
+    if params.get('main_topic'):
+        queryset = queryset.filter(main_topic=params['main_topic'])
+    if params.get('price_band'):
+        for label, low, high in price_bands():
+            if label == params['price_band']:
+                queryset = queryset.filter(price__gte=low)
+                if high is not None:
+                    queryset = queryset.filter(price__lt=high)
+                break
+        else:
+            queryset = queryset.none()
+    return queryset
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products import attributes, response_cache
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the hot keys of Product.more into their columns for existing '
+        'products, walking the table by primary key in chunks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Number of products read and updated per chunk.',
+        )
+        parser.add_argument(
+            '--after',
+            type=int,
+            default=0,
+            help='Only process products with a larger primary key (to resume).',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = options['after']
+        columns = list(attributes.MORE_COLUMNS)
+        scanned = changed = 0
+        started = time.monotonic()
+
+        while True:
+            products = list(
+                Product.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .only('pk', 'more', *columns)[:batch_size]
+            )
+            if not products:
+                break
+            now = timezone.now()
+            stale = [product for product in products if attributes.sync(product)]
+            for product in stale:
+                product.updated = now
+            Product.objects.bulk_update(stale, [*columns, 'updated'])
+            if stale:
+                response_cache.bump_many('product', [product.pk for product in stale])
+
+            last_pk = products[-1].pk
+            scanned += len(products)
+            changed += len(stale)
+            self.stdout.write(f'{scanned} products scanned, {changed} updated (last id {last_pk})')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Backfilled {changed} of {scanned} products in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,232 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from products import attributes, facets
+from products.models import Category, Product, Publisher
+from utils.signals import post_bulk_create, pre_bulk_create
+
+
+# columns copied onto Product as-is (after type conversion)
+PRODUCT_COLUMNS = (
+    'name', 'price', 'discount_price', 'stock', 'author', 'main_topic',
+    'secondary_topic', 'translator', 'description', 'language', 'more',
+)
+
+
+class SlugCache:
+    """
+    In-memory ``slug -> pk`` lookup for a model, filled lazily with one
+    query per batch of unseen slugs. Unknown slugs are remembered too.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.pks = {}
+
+    def load(self, slugs):
+        missing = {slug for slug in slugs if slug not in self.pks}
+        if missing:
+            found = dict(self.model.objects.filter(slug__in=missing).values_list('slug', 'pk'))
+            for slug in missing:
+                self.pks[slug] = found.get(slug)
+
+    def get(self, slug):
+        return self.pks.get(slug)
+
+
+class Command(BaseCommand):
+    help = (
+        'Stream a CSV or JSONL catalog file and upsert products by slug. '
+        'Category and publisher are referenced by slug; columns missing from '
+        'the file keep their current value on existing products.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import.')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            help='File format. Defaults to the file extension.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows upserted per transaction.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Checkpoint file. Defaults to <path>.checkpoint.',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip the rows already imported according to the checkpoint.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'File not found: {path}')
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        batch_size = options['batch_size']
+
+        done = self.read_checkpoint(checkpoint) if options['resume'] else 0
+        if done:
+            self.stdout.write(f'Resuming after row {done}')
+
+        self.categories = SlugCache(Category)
+        self.publishers = SlugCache(Publisher)
+        imported = skipped = 0
+        started = time.monotonic()
+
+        with open(path, newline='', encoding='utf-8') as handle:
+            rows = self.read_rows(handle, file_format)
+            rows = islice(rows, done, None)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                written, errors = self.import_batch(batch, done)
+                for line, error in errors:
+                    self.stderr.write(f'row {line}: {error}')
+                done += len(batch)
+                imported += written
+                skipped += len(errors)
+                self.write_checkpoint(checkpoint, done)
+
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'{done} rows, {imported / elapsed:.0f} rows/sec')
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {imported} products ({skipped} skipped) in {elapsed:.1f}s '
+            f'({imported / elapsed if elapsed else 0:.0f} rows/sec)'
+        ))
+
+    def read_rows(self, handle, file_format):
+        """
+        Yield the rows of the file as dicts; a JSONL line that cannot be
+        read is yielded as the ValueError describing it, so it is reported
+        and skipped like any other bad row.
+        """
+        if file_format == 'csv':
+            yield from csv.DictReader(handle)
+            return
+        for line in handle:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield ValueError(f'invalid JSON: {exc}')
+                continue
+            yield row if isinstance(row, dict) else ValueError('expected a JSON object')
+
+    def import_batch(self, batch, offset):
+        """
+        Upsert one batch of rows, returning ``(written, errors)``.
+        """
+        rows = [row for row in batch if isinstance(row, dict)]
+        self.categories.load(row.get('category') for row in rows)
+        self.publishers.load(row.get('publisher') for row in rows)
+        existing = set(
+            Product.objects.filter(slug__in=[row.get('slug') for row in rows]).values_list('slug', flat=True)
+        )
+
+        products = {}
+        errors = []
+        for line, row in enumerate(batch, start=offset + 1):
+            if isinstance(row, Exception):
+                errors.append((line, row))
+                continue
+            try:
+                product = self.build_product(row, row.get('slug') in existing)
+            except (KeyError, ValueError, ValidationError) as exc:
+                errors.append((line, exc))
+                continue
+            # the last occurrence of a slug within the batch wins
+            products[product.slug] = (product, row)
+        if not products:
+            return 0, errors
+
+        # rows are upserted per set of provided columns, so that a row only
+        # ever overwrites the columns it actually has
+        groups = {}
+        for product, row in products.values():
+            columns = tuple(column for column in PRODUCT_COLUMNS if column in row)
+            groups.setdefault(columns, []).append(product)
+        slugs = list(products)
+        with transaction.atomic():
+            replaced = facets.snapshot(Product.objects.filter(slug__in=slugs))
+            for columns, group in groups.items():
+                update_fields = [*columns, 'category', 'publisher', 'updated']
+                if 'more' in columns:
+                    update_fields += list(attributes.MORE_COLUMNS)
+                pre_bulk_create.send(sender=Product, instances=group)
+                Product.objects.bulk_create(
+                    group,
+                    update_conflicts=True,
+                    unique_fields=['slug'],
+                    update_fields=update_fields,
+                )
+            facets.apply_delta(removed=replaced)
+            # the rows as stored: columns missing from the file kept their value
+            post_bulk_create.send(sender=Product, instances=list(Product.objects.filter(slug__in=slugs)))
+        return len(products), errors
+
+    def build_product(self, row, exists=False):
+        """
+        Build an unsaved Product from a row. New products are validated
+        in full; for existing ones only the provided columns are, since
+        the others keep their stored value.
+        """
+        category = self.categories.get(row.get('category'))
+        if category is None:
+            raise ValueError(f'unknown category {row.get("category")!r}')
+        publisher = self.publishers.get(row.get('publisher'))
+        if publisher is None:
+            raise ValueError(f'unknown publisher {row.get("publisher")!r}')
+
+        values = {'slug': row['slug'], 'category_id': category, 'publisher_id': publisher}
+        for column in PRODUCT_COLUMNS:
+            if column not in row:
+                continue
+            field = Product._meta.get_field(column)
+            value = row[column]
+            if value == '' and field.null:
+                value = None
+            elif column == 'more' and isinstance(value, str):
+                value = json.loads(value) if value else {}
+            values[column] = field.to_python(value)
+        product = Product(**values)
+        exclude = ['category', 'publisher']
+        if exists:
+            exclude += [
+                field.name for field in Product._meta.concrete_fields
+                if field.name != 'slug' and field.name not in row
+            ]
+        product.clean_fields(exclude=exclude)
+        return product
+
+    def read_checkpoint(self, checkpoint):
+        if not os.path.exists(checkpoint):
+            return 0
+        with open(checkpoint) as handle:
+            return json.load(handle)['rows']
+
+    def write_checkpoint(self, checkpoint, rows):
+        # write-then-rename so an interruption never leaves a torn file
+        temporary = f'{checkpoint}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump({'rows': rows}, handle)
+        os.replace(temporary, checkpoint)
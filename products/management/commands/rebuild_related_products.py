@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute the "frequently bought together" counts from the paid orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of product ids whose pairs are grouped per statement.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        stored = recommendations.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored {stored} related product pairs in {time.monotonic() - started:.1f}s'
+        ))
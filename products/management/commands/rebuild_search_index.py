@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Product
+from products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product full-text search index from the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Number of products indexed per batch.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        queryset = Product.objects.only('name', 'author', 'translator', 'description').order_by()
+        with transaction.atomic():
+            get_search_backend().rebuild(queryset, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {Product.objects.count()} products in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
+
+CATEGORY_TREE_CACHE_KEY = 'products:category-tree'
+
+
+class CategoryManager(models.Manager):
+    """
+    Custom manager for Category model with materialized-path subtree queries
+    """
+    def descendant_ids(self, category=None, path=None, include_self=True):
+        """
+        Return a lazy queryset of the ids in the subtree under ``category``
+        (or under the given materialized ``path``, which may also be an
+        expression such as a ``Subquery``).
+
+        It is a single ``path LIKE 'prefix%'`` query and can be used
+        directly as a subquery, e.g. ``Product.objects.filter(category__in=...)``.
+        """
+        path = category.path if category is not None else path
+        queryset = self.filter(path__startswith=path)
+        if not include_self:
+            queryset = queryset.exclude(path=path)
+        return queryset.values_list('pk', flat=True)
+
+    def tree(self):
+        """
+        Return the whole category tree as nested dicts, for menus.
+
+        Built from a single query and cached for ``CATEGORY_TREE_CACHE_TTL``
+        seconds. Changes drop it at once in the process that made them;
+        other processes, with their own cache, catch up within the TTL.
+        """
+        tree = cache.get(CATEGORY_TREE_CACHE_KEY)
+        if tree is None:
+            tree = self._build_tree()
+            cache.set(CATEGORY_TREE_CACHE_KEY, tree, getattr(settings, 'CATEGORY_TREE_CACHE_TTL', 300))
+        return tree
+
+    def clear_tree_cache(self):
+        cache.delete(CATEGORY_TREE_CACHE_KEY)
+
+    def _build_tree(self):
+        nodes = {}
+        roots = []
+        rows = self.order_by('depth', 'name').values('id', 'name', 'slug', 'parent_id')
+        for row in rows:
+            node = {'id': row['id'], 'name': row['name'], 'slug': row['slug'], 'children': []}
+            nodes[row['id']] = node
+            parent = nodes.get(row['parent_id'])
+            if parent is not None:
+                parent['children'].append(node)
+            else:
+                roots.append(node)
+        return roots
@@ -0,0 +1,27 @@
+# Generated by Django 6.0.4 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(max_length=20, verbose_name='فیلتر')),
+                ('value', models.CharField(max_length=255, verbose_name='مقدار')),
+                ('count', models.IntegerField(default=0, verbose_name='تعداد')),
+            ],
+            options={
+                'verbose_name': 'شمارش فیلتر',
+                'verbose_name_plural': 'شمارش فیلترها',
+                'unique_together': {('facet', 'value')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.4 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='publisher',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='نسخه\u200cهای تصویر'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.4 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_publisher_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='cover_type',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=50, verbose_name='نوع جلد'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='isbn',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20, verbose_name='شابک'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='page_count',
+            field=models.PositiveIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='تعداد صفحات'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='publish_year',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, editable=False, null=True, verbose_name='سال انتشار'),
+        ),
+    ]
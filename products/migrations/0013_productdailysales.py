@@ -0,0 +1,29 @@
+# Generated by Django 6.0.4 on 2026-10-18 18:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_relatedproduct'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='روز')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='تعداد فروش')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='products.product', verbose_name='محصول')),
+            ],
+            options={
+                'verbose_name': 'فروش روزانه محصول',
+                'verbose_name_plural': 'فروش روزانه محصولات',
+                'indexes': [models.Index(fields=['day', 'product', 'quantity'], name='daily_sales_day_idx')],
+                'unique_together': {('product', 'day')},
+            },
+        ),
+    ]
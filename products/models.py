@@ -1,5 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Concat, Substr
+from django.core.exceptions import ValidationError
 from utils.models import TimeStampedModel
+from . import attributes
+from .managers import CategoryManager
 
 
 class Product(TimeStampedModel):
@@ -25,6 +30,14 @@ class Product(TimeStampedModel):
         verbose_name="قیمت با تخفیف (تومان)"
     )
 
+    # what the shopper pays, kept by the database for indexed sorting/filtering
+    effective_price = models.GeneratedField(
+        expression=Coalesce("discount_price", "price"),
+        output_field=models.PositiveIntegerField(),
+        db_persist=True,
+        verbose_name="قیمت نهایی (تومان)"
+    )
+
 
     stock = models.PositiveIntegerField(
         default=0,
@@ -85,14 +98,69 @@ class Product(TimeStampedModel):
         verbose_name="اطلاعات تکمیلی"
     )
 
+    # hot keys of ``more``, kept in sync by products.attributes
+    isbn = models.CharField(
+        max_length=20,
+        blank=True,
+        default="",
+        editable=False,
+        db_index=True,
+        verbose_name="شابک"
+    )
+
+    page_count = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="تعداد صفحات"
+    )
+
+    publish_year = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="سال انتشار"
+    )
+
+    cover_type = models.CharField(
+        max_length=50,
+        blank=True,
+        default="",
+        editable=False,
+        db_index=True,
+        verbose_name="نوع جلد"
+    )
+
     class Meta:
         verbose_name = "کتاب"
         verbose_name_plural = "کتاب‌ها"
         ordering = ["-created"]
+        indexes = [
+            # keyset pagination walks (created, id) backwards
+            models.Index(fields=["-created", "-id"], name="product_created_id_idx"),
+            # max(updated) validates conditional GETs on the list
+            models.Index(fields=["updated"], name="product_updated_idx"),
+            # facet filters keep the list's (created, id) order
+            models.Index(fields=["category", "-created", "-id"], name="product_category_created_idx"),
+            models.Index(fields=["publisher", "-created", "-id"], name="product_publisher_created_idx"),
+            models.Index(fields=["language", "-created", "-id"], name="product_language_created_idx"),
+            # price sorting and price band ranges
+            models.Index(fields=["price", "id"], name="product_price_idx"),
+            models.Index(fields=["effective_price", "id"], name="product_effective_price_idx"),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        changed = attributes.sync(self)
+        update_fields = kwargs.get('update_fields')
+        if changed and update_fields is not None and 'more' in update_fields:
+            kwargs['update_fields'] = {*update_fields, *attributes.MORE_COLUMNS}
+        super().save(*args, **kwargs)
+
 
 
 
@@ -120,6 +188,26 @@ class Category(TimeStampedModel):
         verbose_name="اسلاگ"
     )
 
+    # materialized path: zero-padded ids of every ancestor and the
+    # category itself, e.g. "00000001/00000007/"
+    path = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        db_index=True,
+        verbose_name="مسیر"
+    )
+
+    depth = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name="عمق"
+    )
+
+    PATH_STEP = 8
+
+    objects = CategoryManager()
+
     class Meta:
         verbose_name = "دسته‌بندی"
         verbose_name_plural = "دسته‌بندی‌ها"
@@ -127,6 +215,52 @@ class Category(TimeStampedModel):
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def path_segment(cls, pk):
+        return f"{pk:0{cls.PATH_STEP}d}/"
+
+    def is_ancestor_of(self, other):
+        """
+        Return True if ``other`` lies in the subtree under this category.
+        """
+        return bool(self.path) and other.path.startswith(self.path)
+
+    def clean(self):
+        if self.pk and self.parent_id:
+            parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).first()
+            if parent_path and parent_path.startswith(self.path or self.path_segment(self.pk)):
+                raise ValidationError({'parent': 'A category cannot be moved under itself or its descendants.'})
+
+    def save(self, *args, **kwargs):
+        """
+        Save the category and keep the materialized path of it and of its
+        whole subtree up to date.
+
+        Moving a category rewrites the paths of all its descendants with a
+        single UPDATE.
+        """
+        with transaction.atomic():
+            old_path, old_depth = self.path, self.depth
+            if self.pk and self.parent_id:
+                self.clean()
+            super().save(*args, **kwargs)
+
+            parent_path = ''
+            if self.parent_id:
+                parent_path = Category.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+            new_path = parent_path + self.path_segment(self.pk)
+            new_depth = new_path.count('/') - 1
+            if new_path == old_path:
+                return
+
+            Category.objects.filter(pk=self.pk).update(path=new_path, depth=new_depth)
+            if old_path:
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(new_path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (new_depth - old_depth),
+                )
+            self.path, self.depth = new_path, new_depth
     
 
 
@@ -139,6 +273,14 @@ class Publisher(TimeStampedModel):
         verbose_name="لوگوی ناشر"
     )
 
+    # resized copies of the logo, written by utils.images after upload
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name="نسخه‌های تصویر"
+    )
+
     name = models.CharField(
         max_length=200,
         unique=True,
@@ -163,4 +305,117 @@ class Publisher(TimeStampedModel):
         ordering = ["name"]
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+
+class FacetCount(models.Model):
+    """
+    Number of products per facet value, maintained incrementally from
+    Product writes so facet counts never need a full-table GROUP BY.
+    """
+
+    facet = models.CharField(
+        max_length=20,
+        verbose_name="فیلتر"
+    )
+
+    value = models.CharField(
+        max_length=255,
+        verbose_name="مقدار"
+    )
+
+    count = models.IntegerField(
+        default=0,
+        verbose_name="تعداد"
+    )
+
+    class Meta:
+        verbose_name = "شمارش فیلتر"
+        verbose_name_plural = "شمارش فیلترها"
+        unique_together = ("facet", "value")
+
+    def __str__(self):
+        return f"{self.facet}={self.value} ({self.count})"
+
+
+class RelatedProduct(models.Model):
+    """
+    How many paid orders contained both ``product`` and ``related``
+    ("frequently bought together"), kept for the top pairs of each product.
+
+    Rebuilt by ``rebuild_related_products`` and incremented as orders are
+    paid (see products.recommendations).
+    """
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="recommendations",
+        verbose_name="محصول"
+    )
+
+    related = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="recommended_with",
+        verbose_name="محصول مرتبط"
+    )
+
+    score = models.PositiveIntegerField(
+        default=0,
+        verbose_name="تعداد خرید مشترک"
+    )
+
+    class Meta:
+        verbose_name = "محصول مرتبط"
+        verbose_name_plural = "محصولات مرتبط"
+        unique_together = ("product", "related")
+        indexes = [
+            # the top related products of a book, read in score order
+            models.Index(fields=["product", "-score", "related"], name="related_product_score_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score})"
+
+
+class ProductDailySales(models.Model):
+    """
+    Copies of a product sold per day (the day its order was placed),
+    counting sold orders only, so bestseller rankings read a few rows per
+    product instead of the whole order history.
+
+    Incremented as orders are paid and rebuilt by
+    ``rebuild_daily_sales`` (see products.bestsellers).
+    """
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="daily_sales",
+        # product lookups use the (product, day) unique index
+        db_index=False,
+        verbose_name="محصول"
+    )
+
+    day = models.DateField(
+        verbose_name="روز"
+    )
+
+    quantity = models.PositiveIntegerField(
+        default=0,
+        verbose_name="تعداد فروش"
+    )
+
+    class Meta:
+        verbose_name = "فروش روزانه محصول"
+        verbose_name_plural = "فروش روزانه محصولات"
+        unique_together = ("product", "day")
+        indexes = [
+            # rankings over a time window read (product, quantity) from this index only
+            models.Index(fields=["day", "product", "quantity"], name="daily_sales_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.day}: {self.quantity}"
@@ -0,0 +1,150 @@
+"""
+"Frequently bought together" counts between products.
+
+The counting is left to the database: joining OrderItem to itself on the
+order yields every (product, related) pair bought together, and GROUP BY
+turns those into sparse co-occurrence counts without a single order item
+being loaded into Python. ``rebuild`` recomputes the counts range by range
+of product ids and keeps the ``RELATED_PRODUCTS_KEPT`` best pairs of every
+product; ``record_orders`` adds the pairs of newly paid orders with one
+upsert.
+
+The SQL uses window functions, ``ON CONFLICT`` and ``UPDATE ... FROM``,
+all available in SQLite (3.33+) and PostgreSQL.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min
+
+
+def kept():
+    """
+    Number of related products stored per product by a rebuild.
+    """
+    return getattr(settings, 'RELATED_PRODUCTS_KEPT', 50)
+
+
+def _tables():
+    from orders.models import Order, OrderItem
+    from .models import RelatedProduct
+
+    quote = connection.ops.quote_name
+    return (
+        quote(RelatedProduct._meta.db_table),
+        quote(OrderItem._meta.db_table),
+        quote(Order._meta.db_table),
+    )
+
+
+def rebuild(chunk_size=2000):
+    """
+    Recompute the counts of every product from the orders sold so far.
+
+    Products are processed in id ranges of ``chunk_size``: the database
+    only ever groups the pairs of one range, and each range is replaced in
+    its own short transaction, so readers always see a complete list.
+
+    Returns:
+        int: The number of pairs stored.
+    """
+    from orders.models import Order
+    from .models import Product, RelatedProduct
+
+    related, items, orders = _tables()
+    statuses = list(Order.SOLD_STATUSES)
+    sql = f"""
+        INSERT INTO {related} (product_id, related_id, score)
+        SELECT product_id, related_id, score FROM (
+            SELECT
+                a.product_id AS product_id,
+                b.product_id AS related_id,
+                COUNT(*) AS score,
+                ROW_NUMBER() OVER (
+                    PARTITION BY a.product_id ORDER BY COUNT(*) DESC, b.product_id
+                ) AS position
+            FROM {items} a
+            JOIN {orders} o ON o.id = a.order_id
+            JOIN {items} b ON b.order_id = a.order_id AND b.product_id <> a.product_id
+            WHERE o.status IN ({', '.join(['%s'] * len(statuses))})
+                AND a.product_id >= %s AND a.product_id < %s
+            GROUP BY a.product_id, b.product_id
+        ) ranked
+        WHERE position <= %s
+    """
+    bounds = Product.objects.aggregate(low=Min('pk'), high=Max('pk'))
+    if bounds['low'] is None:
+        RelatedProduct.objects.all().delete()
+        return 0
+
+    stored = 0
+    for start in range(bounds['low'], bounds['high'] + 1, chunk_size):
+        end = start + chunk_size
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product__gte=start, product__lt=end).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, [*statuses, start, end, kept()])
+                stored += cursor.rowcount
+    return stored
+
+
+def record_orders(order_ids, batch_size=500):
+    """
+    Add the product pairs of newly paid orders to the counts.
+
+    Existing pairs are incremented and new ones inserted by a single
+    upsert per ``batch_size`` orders. New pairs may push a product past
+    ``RELATED_PRODUCTS_KEPT`` entries until the next rebuild trims them.
+    """
+    _add_orders(order_ids, 1, batch_size)
+
+
+def remove_orders(order_ids, batch_size=500):
+    """
+    Subtract the product pairs of sold orders that were canceled from the
+    counts, dropping the pairs no longer bought together.
+    """
+    _add_orders(order_ids, -1, batch_size)
+
+
+def _add_orders(order_ids, sign, batch_size):
+    related, items, _ = _tables()
+    pairs = f"""
+        SELECT a.product_id AS product_id, b.product_id AS related_id, COUNT(*) AS score
+        FROM {items} a
+        JOIN {items} b ON b.order_id = a.order_id AND b.product_id <> a.product_id
+        WHERE a.order_id IN ({{}})
+        GROUP BY a.product_id, b.product_id
+    """
+    order_ids = list(order_ids)
+    for start in range(0, len(order_ids), batch_size):
+        batch = order_ids[start:start + batch_size]
+        placeholders = ', '.join(['%s'] * len(batch))
+        with transaction.atomic(), connection.cursor() as cursor:
+            if sign > 0:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {related} (product_id, related_id, score)
+                    {pairs.format(placeholders)}
+                    ON CONFLICT (product_id, related_id) DO UPDATE SET score = {related}.score + excluded.score
+                    """,
+                    batch,
+                )
+                continue
+            # scores are unsigned, so the subtraction stops at zero
+            cursor.execute(
+                f"""
+                UPDATE {related}
+                SET score = CASE WHEN {related}.score > pairs.score THEN {related}.score - pairs.score ELSE 0 END
+                FROM ({pairs.format(placeholders)}) pairs
+                WHERE {related}.product_id = pairs.product_id AND {related}.related_id = pairs.related_id
+                """,
+                batch,
+            )
+            cursor.execute(
+                f"""
+                DELETE FROM {related}
+                WHERE score = 0
+                    AND product_id IN (SELECT product_id FROM {items} WHERE order_id IN ({placeholders}))
+                """,
+                batch,
+            )
@@ -0,0 +1,97 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# models whose changes also affect the responses of another model,
+# e.g. product lists filtered by category_tree depend on category paths
+DEPENDENCIES = {
+    'product': ('category', 'publisher'),
+}
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def _generation_key(model_name, scope):
+    return f'catalog:gen:{model_name}:{scope}'
+
+
+def bump(model_name, pk=None):
+    """
+    Invalidate the cached lists of ``model_name`` and, if given, the cached
+    detail of the object ``pk`` by bumping their generation numbers.
+    """
+    bump_many(model_name, [pk] if pk is not None else [])
+
+
+def bump_many(model_name, pks):
+    """
+    Invalidate the cached lists of ``model_name`` and the cached details
+    of every object in ``pks``, e.g. after a bulk write.
+    """
+    cache = get_cache()
+    for scope in ('list', *pks):
+        key = _generation_key(model_name, scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def response_key(request, model_name, pk=None):
+    """
+    Build the cache key of a response from its URL, the negotiated format
+    and the current generations of everything it depends on.
+    """
+    scopes = [(model_name, 'list' if pk is None else pk)]
+    scopes += [(dependency, 'list') for dependency in DEPENDENCIES.get(model_name, ())]
+    keys = [_generation_key(name, scope) for name, scope in scopes]
+    generations = get_cache().get_many(keys)
+    state = ':'.join(str(generations.get(key, 0)) for key in keys)
+
+    digest = hashlib.sha1(
+        f"{request.get_full_path()}:{request.META.get('HTTP_ACCEPT', '')}:{state}".encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return f'catalog:response:{model_name}:{digest}'
+
+
+class CacheStats:
+    """
+    Thread-safe hit/miss and latency counters of the response cache.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+            self.hit_seconds = self.miss_seconds = 0.0
+
+    def record(self, hit, seconds):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_seconds += seconds
+            else:
+                self.misses += 1
+                self.miss_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'avg_hit_ms': self.hit_seconds * 1000 / self.hits if self.hits else 0.0,
+                'avg_miss_ms': self.miss_seconds * 1000 / self.misses if self.misses else 0.0,
+            }
+
+
+stats = CacheStats()
@@ -0,0 +1,178 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+
+# Arabic code points that Persian keyboards and older data often mix in
+_PERSIAN_TRANSLATION = str.maketrans({
+    'ي': 'ی',
+    'ى': 'ی',
+    'ك': 'ک',
+    'ة': 'ه',
+    'ۀ': 'ه',
+    'أ': 'ا',
+    'إ': 'ا',
+    'ٱ': 'ا',
+    **{chr(0x06F0 + i): str(i) for i in range(10)},  # Persian digits
+    **{chr(0x0660 + i): str(i) for i in range(10)},  # Arabic-Indic digits
+})
+
+# harakat, superscript alef and tatweel carry no meaning for search;
+# ZWNJ is dropped so "کتاب‌ها" and "کتابها" index the same way
+_STRIP_RE = re.compile('[\u064B-\u065F\u0670\u0640\u200C\u200E\u200F]')
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize_text(text):
+    """
+    Normalize Persian text so that spelling variants index identically.
+    """
+    if not text:
+        return ''
+    text = text.translate(_PERSIAN_TRANSLATION)
+    text = _STRIP_RE.sub('', text)
+    return text.lower()
+
+
+def tokenize(text):
+    """
+    Split text into normalized search tokens.
+    """
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+class BaseSearchBackend:
+    """
+    Interface for product full-text search backends.
+
+    A backend keeps its own index in sync through ``index`` and ``remove``
+    (called from the Product signals) and answers ``search`` with product
+    ids ordered by relevance.
+    """
+    def index(self, products):
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        raise NotImplementedError
+
+    def search(self, query, limit):
+        raise NotImplementedError
+
+    def rebuild(self, queryset, chunk_size=2000):
+        self.clear()
+        batch = []
+        for product in queryset.iterator(chunk_size=chunk_size):
+            batch.append(product)
+            if len(batch) >= chunk_size:
+                self.index(batch)
+                batch = []
+        if batch:
+            self.index(batch)
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    Search backend using the SQLite FTS5 table created by migration 0004.
+
+    Text is normalized with ``normalize_text`` before it is written and
+    before it is queried; results are ranked with bm25, weighting the
+    book name above author/translator and those above the description.
+    """
+    table = 'products_product_fts'
+    weights = (10.0, 5.0, 3.0, 1.0)
+
+    def index(self, products):
+        rows = [
+            (
+                product.pk,
+                normalize_text(product.name),
+                normalize_text(product.author),
+                normalize_text(product.translator),
+                normalize_text(product.description),
+            )
+            for product in products
+        ]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s',
+                [(row[0],) for row in rows],
+            )
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, author, translator, description) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                rows,
+            )
+
+    def remove(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {self.table} WHERE rowid = %s',
+                [(pk,) for pk in product_ids],
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+
+    def search(self, query, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        # every token must match, the last one as a prefix for search-as-you-type
+        match = ' '.join(f'"{token}"' for token in tokens[:-1])
+        match = f'{match} "{tokens[-1]}"*'.strip()
+        weights = ', '.join(str(weight) for weight in self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s '
+                f'ORDER BY bm25({self.table}, {weights}) LIMIT %s',
+                [match, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """
+    Index-less fallback that scans with ``icontains``.
+
+    Only meant for databases without a full-text backend configured.
+    """
+    def index(self, products):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, limit):
+        from products.models import Product
+
+        condition = Q()
+        for token in query.split():
+            condition &= (
+                Q(name__icontains=token)
+                | Q(author__icontains=token)
+                | Q(translator__icontains=token)
+                | Q(description__icontains=token)
+            )
+        return list(Product.objects.filter(condition).values_list('pk', flat=True)[:limit])
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """
+    Return the backend configured by ``PRODUCT_SEARCH_BACKEND``.
+    """
+    path = getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'products.search.SQLiteFTSBackend')
+    return import_string(path)()
@@ -1,24 +1,70 @@
 from rest_framework import serializers
 from products.models import Product, Publisher, Category
+from utils.serializers import (
+    BulkCreateListSerializer,
+    BulkPrimaryKeyRelatedField,
+    ExpandableFieldsMixin,
+    ImageVariantsField,
+    SparseFieldsetMixin,
+)
 
 
+PRODUCT_EXPANDABLE_FIELDS = {
+    'category': 'products.serializers.CategorySerializer',
+    'publisher': 'products.serializers.PublisherSerializer',
+}
 
-class ProductSerializer(serializers.ModelSerializer):
+
+class ProductSerializer(ExpandableFieldsMixin, SparseFieldsetMixin, serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
+    expandable_fields = PRODUCT_EXPANDABLE_FIELDS
+    effective_price = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Product
         fields = '__all__'
+        list_serializer_class = BulkCreateListSerializer
+
+
+class ProductCompactSerializer(ExpandableFieldsMixin, SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Lightweight read-only representation used by product lists.
+
+    Leaves out ``description``, ``more`` and the other columns only the
+    detail page needs.
+    """
+    expandable_fields = PRODUCT_EXPANDABLE_FIELDS
+    effective_price = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = (
+            'id', 'slug', 'name', 'price', 'discount_price', 'effective_price', 'stock',
+            'author', 'translator', 'category', 'publisher', 'language',
+            'main_topic', 'created',
+        )
+        read_only_fields = fields
 
 
 class CategorySerializer(serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
 
     class Meta:
         model = Category
         fields = '__all__'
+        list_serializer_class = BulkCreateListSerializer
+
+    def validate_parent(self, parent):
+        if parent is not None and self.instance is not None and self.instance.is_ancestor_of(parent):
+            raise serializers.ValidationError('A category cannot be moved under itself or its descendants.')
+        return parent
 
 
 class PublisherSerializer(serializers.ModelSerializer):
+    serializer_related_field = BulkPrimaryKeyRelatedField
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Publisher
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        list_serializer_class = BulkCreateListSerializer
\ No newline at end of file
@@ -0,0 +1,237 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.db import transaction
+from django.dispatch import receiver
+
+from . import attributes, bestsellers, facets, recommendations, response_cache
+from .autocomplete import autocomplete
+from .models import Category, Product, Publisher
+from .search import get_search_backend
+from orders.signals import order_canceled, order_paid
+from utils import images
+from utils.signals import image_variants_generated, post_bulk_create, pre_bulk_create
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    """
+    Keep the full-text index in sync with saved products.
+    """
+    if raw:
+        return
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    """
+    Drop deleted products from the full-text index.
+    """
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(pre_save, sender=Product)
+def snapshot_product_facets(sender, instance, raw=False, **kwargs):
+    """
+    Remember the facet values a product had before this save.
+    """
+    instance._facet_snapshot = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    previous = facets.snapshot(Product.objects.filter(pk=instance.pk))
+    instance._facet_snapshot = previous[0] if previous else None
+
+
+@receiver(post_save, sender=Product)
+def update_product_facets(sender, instance, raw=False, **kwargs):
+    """
+    Move the product between facet counts when its facet values change.
+    """
+    if raw:
+        return
+    previous = getattr(instance, '_facet_snapshot', None)
+    current = facets.facet_values(instance)
+    if previous == current:
+        return
+    facets.apply_delta(added=[current], removed=[previous] if previous else [])
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_facets(sender, instance, **kwargs):
+    facets.apply_delta(removed=[facets.facet_values(instance)])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def clear_category_tree(sender, **kwargs):
+    Category.objects.clear_tree_cache()
+
+
+@receiver(pre_bulk_create, sender=Product)
+def materialize_bulk_created_more_columns(sender, instances, **kwargs):
+    """
+    Fill the columns mirrored from ``more``, as ``Product.save()`` would.
+    """
+    for product in instances:
+        attributes.sync(product)
+
+
+@receiver(post_bulk_create, sender=Product)
+def sync_bulk_created_products(sender, instances, **kwargs):
+    """
+    Index and count products inserted with ``bulk_create``.
+    """
+    get_search_backend().index(instances)
+    facets.apply_delta(added=[facets.facet_values(product) for product in instances])
+
+
+@receiver(post_bulk_create, sender=Category)
+def build_bulk_created_category_paths(sender, instances, **kwargs):
+    """
+    Set the materialized path of categories inserted with ``bulk_create``.
+
+    Parents always exist beforehand, so their paths are read in one query.
+    """
+    parent_ids = {category.parent_id for category in instances if category.parent_id}
+    parent_paths = dict(Category.objects.filter(pk__in=parent_ids).values_list('pk', 'path'))
+    for category in instances:
+        category.path = parent_paths.get(category.parent_id, '') + Category.path_segment(category.pk)
+        category.depth = category.path.count('/') - 1
+    Category.objects.bulk_update(instances, ['path', 'depth'], batch_size=1000)
+    Category.objects.clear_tree_cache()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Publisher)
+@receiver(post_delete, sender=Publisher)
+def invalidate_cached_responses(sender, instance, **kwargs):
+    """
+    Drop the cached lists of the model and the cached detail of the instance.
+    """
+    response_cache.bump(sender._meta.model_name, instance.pk)
+
+
+@receiver(post_bulk_create, sender=Product)
+@receiver(post_bulk_create, sender=Category)
+@receiver(post_bulk_create, sender=Publisher)
+def invalidate_bulk_cached_responses(sender, instances, **kwargs):
+    """
+    Drop the cached lists of the model and the cached details of the
+    instances, which bulk upserts may have overwritten.
+    """
+    response_cache.bump_many(sender._meta.model_name, [instance.pk for instance in instances])
+
+
+@receiver(pre_save, sender=Publisher)
+def reset_publisher_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.reset_stale(instance)
+
+
+@receiver(post_save, sender=Publisher)
+def generate_publisher_image_variants(sender, instance, raw=False, **kwargs):
+    """
+    Resize a newly uploaded logo in the background once the save commits.
+    """
+    if not raw:
+        images.schedule(instance)
+
+
+@receiver(post_delete, sender=Publisher)
+def delete_publisher_image_variants(sender, instance, **kwargs):
+    images.discard(instance.image.storage, instance.image_variants)
+
+
+@receiver(post_bulk_create, sender=Publisher)
+def generate_bulk_created_publisher_image_variants(sender, instances, **kwargs):
+    for publisher in instances:
+        images.schedule(publisher)
+
+
+@receiver(image_variants_generated, sender=Publisher)
+def invalidate_publisher_image_variants(sender, pk, **kwargs):
+    response_cache.bump('publisher', pk)
+
+
+@receiver(pre_save, sender=Product)
+def snapshot_product_author(sender, instance, raw=False, **kwargs):
+    """
+    Remember the author a product had, for the autocomplete author entries.
+    """
+    instance._autocomplete_author = None
+    if raw or autocomplete.index is None or instance._state.adding or instance.pk is None:
+        return
+    instance._autocomplete_author = (
+        Product.objects.filter(pk=instance.pk).values_list('author', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Product)
+def update_product_suggestions(sender, instance, raw=False, **kwargs):
+    index = autocomplete.index
+    if raw or index is None:
+        return
+    previous = getattr(instance, '_autocomplete_author', None)
+    transaction.on_commit(lambda: index.save_product(instance, previous))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_suggestions(sender, instance, **kwargs):
+    index = autocomplete.index
+    if index is not None:
+        # Django clears the pk of deleted instances before the commit
+        pk, author = instance.pk, instance.author
+        transaction.on_commit(lambda: index.delete_product(pk, author))
+
+
+@receiver(post_save, sender=Publisher)
+def update_publisher_suggestions(sender, instance, raw=False, **kwargs):
+    index = autocomplete.index
+    if not raw and index is not None:
+        transaction.on_commit(lambda: index.save_publisher(instance))
+
+
+@receiver(post_delete, sender=Publisher)
+def remove_publisher_suggestions(sender, instance, **kwargs):
+    index = autocomplete.index
+    if index is not None:
+        pk = instance.pk
+        transaction.on_commit(lambda: index.delete_publisher(pk))
+
+
+@receiver(post_bulk_create, sender=Product)
+@receiver(post_bulk_create, sender=Publisher)
+def add_bulk_created_suggestions(sender, instances, **kwargs):
+    index = autocomplete.index
+    if index is None:
+        return
+    save = index.save_products if sender is Product else index.save_publishers
+    transaction.on_commit(lambda: save(instances))
+
+
+@receiver(order_paid)
+def record_bought_together(sender, order_ids, **kwargs):
+    """
+    Count the products of newly paid orders as bought together.
+    """
+    recommendations.record_orders(order_ids)
+
+
+@receiver(order_paid)
+def record_daily_sales(sender, order_ids, **kwargs):
+    """
+    Add newly paid orders to the bestseller rollup.
+    """
+    bestsellers.record_orders(order_ids)
+
+
+@receiver(order_canceled)
+def remove_bought_together(sender, order_ids, **kwargs):
+    recommendations.remove_orders(order_ids)
+
+
+@receiver(order_canceled)
+def remove_daily_sales(sender, order_ids, **kwargs):
+    bestsellers.remove_orders(order_ids)
@@ -1,3 +1,1404 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+from rest_framework.test import APIClient
+
+from utils import images
+from utils.fast_serializers import CompiledSerializer
+from utils.serializers import BulkCreateListSerializer
+
+from . import views
+from .autocomplete import CatalogIndex, autocomplete
+from .models import Category, FacetCount, Product, ProductDailySales, Publisher, RelatedProduct
+from .response_cache import get_cache
+
+
+def create_catalog():
+    """
+    Return the default ``(category, publisher)`` products are filed under.
+    """
+    category, _ = Category.objects.get_or_create(slug='category', defaults={'name': 'category'})
+    publisher, _ = Publisher.objects.get_or_create(slug='publisher', defaults={'name': 'publisher'})
+    return category, publisher
+
+
+def create_product(slug, **fields):
+    """
+    Create a product with every required field filled in, filed under the
+    default category and publisher unless others are given.
+    """
+    if 'category' not in fields or 'publisher' not in fields:
+        category, publisher = create_catalog()
+        fields = {'category': category, 'publisher': publisher, **fields}
+    return Product.objects.create(**{
+        'slug': slug,
+        'name': slug,
+        'price': 1000,
+        'author': 'author',
+        'main_topic': 'topic',
+        'description': 'description',
+        'language': 'fa',
+        **fields,
+    })
+
+
+def product_data(slug, **fields):
+    """
+    Request payload of a new product, like ``create_product``.
+    """
+    category, publisher = create_catalog()
+    return {
+        'slug': slug,
+        'name': slug,
+        'price': 1000,
+        'author': 'author',
+        'category': category.pk,
+        'main_topic': 'topic',
+        'publisher': publisher.pk,
+        'description': 'description',
+        'language': 'fa',
+        **fields,
+    }
+
+
+class FacetTests(TestCase):
+    """
+    Facet counts follow product writes and agree with a full rebuild.
+    """
+    url = '/products/api/products/'
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+        self.category, _ = create_catalog()
+
+    def stored_counts(self):
+        return set(FacetCount.objects.filter(count__gt=0).values_list('facet', 'value', 'count'))
+
+    def test_bulk_create_with_many_distinct_values(self):
+        # more values than SQLite accepts ORed in one expression
+        payload = [product_data(f'book-{i}', main_topic=f'topic {i}') for i in range(1500)]
+        response = self.client.post(self.url, payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(FacetCount.objects.get(facet='category', value=str(self.category.pk)).count, 1500)
+        self.assertEqual(FacetCount.objects.filter(facet='main_topic', count=1).count(), 1500)
+
+        incremental = self.stored_counts()
+        call_command('rebuild_facet_counts', stdout=StringIO())
+        self.assertEqual(self.stored_counts(), incremental)
+
+    def facet_counts(self, **params):
+        response = self.client.get(f'{self.url}facets/', params)
+        self.assertEqual(response.status_code, 200)
+        return {
+            facet: {item['value']: item['count'] for item in values}
+            for facet, values in response.data['facets'].items()
+        }
+
+    def test_counts(self):
+        payload = [
+            product_data('history', main_topic='history', price=500),
+            product_data('novel', main_topic='novel', price=1500),
+            product_data('english-novel', main_topic='novel', language='en', price=1500),
+        ]
+        self.assertEqual(self.client.post(self.url, payload, format='json').status_code, 201)
+
+        # unfiltered counts are read from FacetCount, without any GROUP BY
+        with CaptureQueriesContext(connection) as queries:
+            counts = self.facet_counts()
+        self.assertFalse(any('GROUP BY' in query['sql'] for query in queries))
+        self.assertEqual(counts['main_topic'], {'novel': 2, 'history': 1})
+        self.assertEqual(counts['language'], {'fa': 2, 'en': 1})
+
+        self.assertEqual(self.facet_counts(main_topic='novel')['language'], {'fa': 1, 'en': 1})
+        self.assertEqual(self.facet_counts(min_price=1000)['main_topic'], {'novel': 2})
+        self.assertEqual(self.facet_counts(category_tree='unknown')['category'], {})
+
+    def test_values_round_trip_as_filters(self):
+        other = Publisher.objects.create(name='other publisher', slug='other-publisher')
+        payload = [
+            product_data('first', price=500),
+            product_data('second', publisher=other.pk, language='en'),
+        ]
+        self.assertEqual(self.client.post(self.url, payload, format='json').status_code, 201)
+
+        listing = self.client.get(f'{self.url}facets/').data['facets']
+        self.assertCountEqual(
+            listing['publisher'],
+            [{'value': 'publisher', 'label': 'publisher', 'count': 1},
+             {'value': 'other-publisher', 'label': 'other publisher', 'count': 1}],
+        )
+        for facet, items in listing.items():
+            for item in items:
+                with self.subTest(facet=facet, value=item['value']):
+                    response = self.client.get(f'{self.url}facets/', {facet: item['value']})
+                    self.assertEqual(len(response.data['results']), item['count'])
+
+
+class BulkCreateTests(TestCase):
+    """
+    A list payload is validated with a constant number of queries and
+    inserted with one INSERT per ``batch_size`` rows.
+    """
+    url = '/products/api/products/'
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+        create_product('existing')
+
+    def post(self, payload):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, payload, format='json')
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "products_product"')]
+        return response, len(queries), len(inserts)
+
+    def test_duplicate_slugs_in_payload(self):
+        response, _, _ = self.post([product_data('a'), product_data('b'), product_data('a')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(response.data[2], {'slug': ['Duplicate value within this batch.']})
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_existing_slugs(self):
+        response, _, _ = self.post([product_data('new'), product_data('existing')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(list(response.data[1]), ['slug'])
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_one_insert_per_chunk(self):
+        with mock.patch.object(BulkCreateListSerializer, 'batch_size', 2):
+            response, _, inserts = self.post([product_data(f'book-{i}') for i in range(5)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(inserts, 3)
+        self.assertEqual(len({item['id'] for item in response.data}), 5)
+        self.assertEqual(Product.objects.filter(slug__startswith='book-').count(), 5)
+
+    def test_query_count_does_not_grow_with_the_payload(self):
+        _, few, inserts = self.post([product_data(f'few-{i}') for i in range(3)])
+        _, many, _ = self.post([product_data(f'many-{i}') for i in range(30)])
+        self.assertEqual(inserts, 1)
+        self.assertEqual(few, many)
+
+
+class ResponseCacheTests(TestCase):
+    """
+    Cached list and detail responses are dropped by every kind of write.
+    """
+    url = '/products/api/products/'
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+        self.book = create_product('book')
+        self.detail_url = f'{self.url}{self.book.pk}/'
+
+    def get(self, url, cache):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], cache)
+        return response.data
+
+    def test_hit_after_miss(self):
+        self.get(self.url, 'MISS')
+        self.get(self.detail_url, 'MISS')
+        with self.assertNumQueries(0):
+            self.get(self.url, 'HIT')
+            self.get(self.detail_url, 'HIT')
+
+    def test_save_drops_list_and_detail(self):
+        self.get(self.url, 'MISS')
+        self.get(self.detail_url, 'MISS')
+        self.book.name = 'renamed'
+        self.book.save()
+        self.assertEqual(self.get(self.detail_url, 'MISS')['name'], 'renamed')
+        self.assertEqual(self.get(self.url, 'MISS')['results'][0]['name'], 'renamed')
+
+    def test_bulk_create_drops_lists(self):
+        self.get(self.url, 'MISS')
+        self.get(self.detail_url, 'MISS')
+        self.assertEqual(self.client.post(self.url, [product_data('other')], format='json').status_code, 201)
+        self.assertEqual(len(self.get(self.url, 'MISS')['results']), 2)
+        self.get(self.detail_url, 'HIT')
+
+    def test_import_drops_upserted_details(self):
+        self.get(self.detail_url, 'MISS')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = f'{directory}/catalog.csv'
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(
+                'slug,name,price,author,main_topic,description,language,category,publisher\n'
+                'book,renamed,2000,author,topic,description,fa,category,publisher\n'
+            )
+        call_command('import_catalog', path, stdout=StringIO(), stderr=StringIO())
+
+        data = self.get(self.detail_url, 'MISS')
+        self.assertEqual((data['name'], data['price']), ('renamed', 2000))
+
+
+class ConditionalGetTests(TestCase):
+    """
+    List and detail responses carry validators and answer matching
+    conditional requests with 304, whether cached or not.
+    """
+    url = '/products/api/products/'
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+        self.book = create_product('book')
+        self.detail_url = f'{self.url}{self.book.pk}/'
+
+    def test_if_none_match(self):
+        for url in (self.url, self.detail_url):
+            etag = self.client.get(url)['ETag']
+            # answered from the response cache, then from the database
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            get_cache().clear()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get(self.detail_url)['Last-Modified']
+        get_cache().clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_lists_have_no_last_modified(self):
+        # deleting an older row would not move max(updated) forward
+        self.assertFalse(self.client.get(self.url).has_header('Last-Modified'))
+        get_cache().clear()
+        future = http_date(time.time() + 3600)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=future).status_code, 200)
+
+    def test_etag_changes_after_writes(self):
+        list_etag = self.client.get(self.url)['ETag']
+        detail_etag = self.client.get(self.detail_url)['ETag']
+        self.book.name = 'renamed'
+        self.book.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        self.assertEqual(self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+
+        # deleting an older row leaves max(updated) as it was, not the count
+        other = create_product('other')
+        Product.objects.filter(pk=other.pk).update(updated=self.book.updated - timedelta(days=1))
+        get_cache().clear()
+        list_etag = self.client.get(self.url)['ETag']
+        other.delete()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_query_string_changes_etag(self):
+        self.assertNotEqual(
+            self.client.get(self.url)['ETag'],
+            self.client.get(self.url, {'language': 'fa'})['ETag'],
+        )
+
+    def test_malformed_pk_is_not_found(self):
+        self.assertEqual(self.client.get(f'{self.url}abc/').status_code, 404)
+        self.assertEqual(self.client.get(f'{self.url}{self.book.pk + 1}/').status_code, 404)
+
+
+class ImportCatalogTests(TestCase):
+    """
+    ``import_catalog`` upserts by slug, keeps the columns a file leaves
+    out, reports bad rows without stopping and can resume.
+    """
+    header = 'slug,name,price,author,main_topic,description,language,category,publisher\n'
+
+    def setUp(self):
+        get_cache().clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        create_catalog()
+
+    def write(self, name, content):
+        path = f'{self.directory}/{name}'
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_catalog', path, stdout=stdout, stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def test_creates_and_updates_by_slug(self):
+        path = self.write('catalog.csv', self.header + (
+            'first,First,1000,author,topic,description,fa,category,publisher\n'
+            'second,Second,2000,author,topic,description,fa,category,publisher\n'
+            'third,Third,3000,author,topic,description,fa,unknown,publisher\n'
+        ))
+        errors = self.run_import(path)
+        self.assertIn("row 3: unknown category 'unknown'", errors)
+        self.assertEqual(dict(Product.objects.values_list('slug', 'price')), {'first': 1000, 'second': 2000})
+
+    def test_missing_columns_keep_their_value(self):
+        self.run_import(self.write('catalog.csv', self.header + (
+            'book,Book,1000,author,history,description,fa,category,publisher\n'
+        )))
+        errors = self.run_import(self.write('prices.csv', (
+            'slug,price,category,publisher\n'
+            'book,1500,category,publisher\n'
+            'new,900,category,publisher\n'
+        )))
+        book = Product.objects.get(slug='book')
+        self.assertEqual((book.name, book.price, book.main_topic), ('Book', 1500, 'history'))
+        # new products still need every required column
+        self.assertIn('row 2:', errors)
+        self.assertFalse(Product.objects.filter(slug='new').exists())
+        self.assertEqual(FacetCount.objects.get(facet='main_topic', value='history').count, 1)
+
+    def test_malformed_jsonl_lines_are_skipped(self):
+        product = {
+            'name': 'book', 'price': 1000, 'author': 'author', 'main_topic': 'topic',
+            'description': 'description', 'language': 'fa', 'category': 'category', 'publisher': 'publisher',
+        }
+        path = self.write('catalog.jsonl', '\n'.join([
+            json.dumps({**product, 'slug': 'first'}),
+            '{"slug": "broken",',
+            '[1, 2]',
+            json.dumps({**product, 'slug': 'second'}),
+        ]))
+        errors = self.run_import(path, batch_size=2)
+        self.assertIn('row 2: invalid JSON', errors)
+        self.assertIn('row 3: expected a JSON object', errors)
+        self.assertEqual(sorted(Product.objects.values_list('slug', flat=True)), ['first', 'second'])
+
+    def test_resume_skips_imported_rows(self):
+        path = self.write('catalog.csv', self.header + (
+            'first,First,1000,author,topic,description,fa,category,publisher\n'
+            'second,Second,2000,author,topic,description,fa,category,publisher\n'
+        ))
+        self.write('catalog.csv.checkpoint', '{"rows": 1}')
+        self.run_import(path, resume=True)
+        self.assertEqual(list(Product.objects.values_list('slug', flat=True)), ['second'])
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+        self.run_import(path)
+        self.assertEqual(Product.objects.count(), 2)
+
+
+class CategoryTreeTests(TestCase):
+    """
+    Materialized paths follow moves, and subtree queries and the cached
+    tree read them.
+    """
+    def setUp(self):
+        Category.objects.clear_tree_cache()
+        self.books = Category.objects.create(name='books', slug='books')
+        self.novels = Category.objects.create(name='novels', slug='novels', parent=self.books)
+        self.classics = Category.objects.create(name='classics', slug='classics', parent=self.novels)
+        self.poetry = Category.objects.create(name='poetry', slug='poetry')
+
+    def paths(self):
+        return {
+            category.slug: (category.path, category.depth)
+            for category in Category.objects.all()
+        }
+
+    def test_paths(self):
+        segment = Category.path_segment
+        self.assertEqual(self.paths()['classics'], (
+            segment(self.books.pk) + segment(self.novels.pk) + segment(self.classics.pk), 2,
+        ))
+
+    def test_move_rewrites_the_subtree(self):
+        self.novels.parent = self.poetry
+        self.novels.save()
+        segment = Category.path_segment
+        paths = self.paths()
+        self.assertEqual(paths['novels'], (segment(self.poetry.pk) + segment(self.novels.pk), 1))
+        self.assertEqual(paths['classics'], (
+            segment(self.poetry.pk) + segment(self.novels.pk) + segment(self.classics.pk), 2,
+        ))
+        self.assertEqual(paths['books'], (segment(self.books.pk), 0))
+
+        self.novels.parent = None
+        self.novels.save()
+        self.assertEqual(self.paths()['classics'], (segment(self.novels.pk) + segment(self.classics.pk), 1))
+
+    def test_move_under_own_descendant_is_rejected(self):
+        self.books.parent = self.classics
+        with self.assertRaises(ValidationError):
+            self.books.save()
+        self.books.refresh_from_db()
+        self.assertIsNone(self.books.parent_id)
+
+    def test_bulk_created_paths(self):
+        payload = [{'name': 'history', 'slug': 'history', 'parent': self.novels.pk}]
+        response = APIClient().post('/products/api/category/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        history = Category.objects.get(slug='history')
+        self.assertEqual(self.paths()['history'], (self.novels.path + Category.path_segment(history.pk), 2))
+
+    def test_descendant_ids(self):
+        self.assertEqual(
+            set(Category.objects.descendant_ids(self.books)),
+            {self.books.pk, self.novels.pk, self.classics.pk},
+        )
+        self.assertEqual(
+            set(Category.objects.descendant_ids(self.books, include_self=False)),
+            {self.novels.pk, self.classics.pk},
+        )
+        self.assertEqual(set(Category.objects.descendant_ids(path=self.classics.path)), {self.classics.pk})
+
+    def test_tree(self):
+        with self.assertNumQueries(1):
+            tree = Category.objects.tree()
+            Category.objects.tree()
+        self.assertEqual([node['slug'] for node in tree], ['books', 'poetry'])
+        self.assertEqual(tree[0]['children'][0]['children'][0]['slug'], 'classics')
+
+        self.classics.parent = self.poetry
+        self.classics.save()
+        tree = APIClient().get('/products/api/category/tree/').json()
+        self.assertEqual(tree[0]['children'][0]['children'], [])
+        self.assertEqual([node['slug'] for node in tree[1]['children']], ['classics'])
+
+    @override_settings(CATEGORY_TREE_CACHE_TTL=60)
+    def test_tree_expires(self):
+        # the cache of another process is not cleared, only expires
+        with mock.patch('products.managers.cache') as cache:
+            cache.get.return_value = None
+            Category.objects.tree()
+        self.assertEqual(cache.set.call_args.args[2], 60)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'the default search backend uses SQLite FTS5')
+class SearchTests(TestCase):
+    """
+    The full-text index follows product writes, normalizes Persian
+    spelling variants and matches the last word as a prefix.
+    """
+    url = '/products/api/products/search/'
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+        self.book = create_product('shahnameh', name='شاهنامه فردوسي', author='فردوسی')
+        create_product('book-set', name='مجموعه کتاب‌ها', author='نویسنده')
+
+    def search(self, query):
+        response = self.client.get(self.url, {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['slug'] for item in response.data['results']]
+
+    def test_normalizes_persian_variants(self):
+        # stored with Arabic yeh, searched with Persian yeh and the other way round
+        self.assertEqual(self.search('فردوسی'), ['shahnameh'])
+        self.assertEqual(self.search('فردوسي'), ['shahnameh'])
+        # with or without the zero-width non-joiner
+        self.assertEqual(self.search('کتابها'), ['book-set'])
+        self.assertEqual(self.search('کتاب‌ها'), ['book-set'])
+
+    def test_last_word_is_a_prefix(self):
+        self.assertEqual(self.search('شاهنا'), ['shahnameh'])
+        self.assertEqual(self.search('شاهنامه فرد'), ['shahnameh'])
+        self.assertEqual(self.search('شاهنا فردوسی'), [])
+
+    def test_index_follows_save_and_delete(self):
+        self.book.name = 'رستم و سهراب'
+        self.book.save()
+        self.assertEqual(self.search('شاهنامه'), [])
+        self.assertEqual(self.search('سهراب'), ['shahnameh'])
+
+        self.book.delete()
+        self.assertEqual(self.search('سهراب'), [])
+
+    def test_bulk_created_products_are_indexed(self):
+        payload = [product_data('divan', name='دیوان حافظ', author='حافظ')]
+        self.assertEqual(self.client.post('/products/api/products/', payload, format='json').status_code, 201)
+        self.assertEqual(self.search('حافظ'), ['divan'])
+
+    def test_name_ranks_above_description(self):
+        create_product('about', name='تاریخ', author='نویسنده', description='درباره شاهنامه')
+        self.assertEqual(self.search('شاهنامه'), ['shahnameh', 'about'])
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'q': 'x', 'limit': 'x'}).status_code, 400)
+
+
+class SparseFieldsetTests(TestCase):
+    """
+    ``?fields=`` and ``?omit=`` pick the output keys and narrow the
+    columns read from the product table accordingly.
+    """
+    url = '/products/api/products/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = create_product('book', more={'pages': 120})
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        # the query reading the rows, not the validators or the count
+        select = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT') and '"products_product"."name"' in query['sql']
+        ]
+        self.assertEqual(len(select), 1)
+        return response.data, select[0]
+
+    def test_fields_on_lists(self):
+        data, sql = self.get(self.url, fields='id,name,price,unknown')
+        self.assertEqual(set(data['results'][0]), {'id', 'name', 'price'})
+        self.assertNotIn('"products_product"."description"', sql)
+        self.assertNotIn('"products_product"."author"', sql)
+        self.assertIn('"products_product"."price"', sql)
+
+    def test_omit_on_details(self):
+        data, sql = self.get(f'{self.url}{self.book.pk}/', omit='description,more')
+        self.assertNotIn('description', data)
+        self.assertNotIn('more', data)
+        self.assertIn('author', data)
+        self.assertNotIn('"products_product"."description"', sql)
+        self.assertNotIn('"products_product"."more"', sql)
+
+    def test_defaults(self):
+        data, sql = self.get(self.url)
+        self.assertNotIn('description', data['results'][0])
+        self.assertNotIn('"products_product"."description"', sql)
+        data, sql = self.get(f'{self.url}{self.book.pk}/')
+        self.assertEqual(data['more'], {'pages': 120})
+        self.assertIn('"products_product"."description"', sql)
+
+    def test_fields_do_not_apply_to_writes(self):
+        response = self.client.patch(f'{self.url}{self.book.pk}/?fields=id', {'name': 'renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'renamed')
+        self.assertIn('description', response.data)
+
+
+class ProductExportTests(TestCase):
+    """
+    The catalog export streams the filtered products as NDJSON or CSV.
+    """
+    url = '/products/api/products/export/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for slug, language in (('first', 'fa'), ('second', 'en')):
+            create_product(slug, name=f'کتاب {slug}', language=language, more={'pages': 120})
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('filename="products.ndjson"', response['Content-Disposition'])
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['slug'] for row in rows], ['first', 'second'])
+        self.assertEqual(rows[0]['name'], 'کتاب first')
+        self.assertEqual((rows[0]['category_slug'], rows[0]['publisher_slug']), ('category', 'publisher'))
+        self.assertEqual(rows[0]['more'], {'pages': 120})
+
+    def test_csv_is_filtered(self):
+        response, content = self.export(output='csv', language='en')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual([row['slug'] for row in rows], ['second'])
+        self.assertEqual(json.loads(rows[0]['more']), {'pages': 120})
+        self.assertEqual(rows[0]['category_slug'], 'category')
+
+    def test_unknown_output(self):
+        response = self.client.get(self.url, {'output': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('output', response.data)
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Cursor pages walk every row exactly once in both directions, ties on
+    the ordering column included, and malformed cursors are rejected.
+    """
+    url = '/products/api/products/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(7):
+            create_product(f'book-{i}', price=1000 * (i % 3))
+        # every product created at the same instant
+        Product.objects.update(created=timezone.now())
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+
+    def walk(self, url, link='next'):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([item['slug'] for item in response.data['results']])
+            url = response.data[link]
+        return pages, response.data
+
+    def test_next_and_previous_over_ties(self):
+        pages, last = self.walk(f'{self.url}?page_size=3')
+        expected = [f'book-{i}' for i in reversed(range(7))]
+        self.assertEqual(pages, [expected[0:3], expected[3:6], expected[6:]])
+
+        previous, first = self.walk(last['previous'], link='previous')
+        self.assertEqual(previous, pages[-2::-1])
+        self.assertIsNone(first['previous'])
+        self.assertEqual(self.walk(first['next'])[0], pages[1:])
+
+    def test_ascending_ordering_with_ties(self):
+        pages, _ = self.walk(f'{self.url}?page_size=2&ordering=price')
+        slugs = sum(pages, [])
+        products = Product.objects.order_by('price', 'id').values_list('slug', flat=True)
+        self.assertEqual(slugs, list(products))
+
+    def test_malformed_cursors(self):
+        def cursor(**tokens):
+            return base64.b64encode(urlencode(tokens).encode()).decode()
+
+        for value in (
+            'junk', cursor(p='not json'), cursor(p='["1"]'), cursor(p='{"a": 1}'),
+            # well-formed positions holding values of the wrong type
+            cursor(p='["garbage", "x"]'), cursor(p='[null, null]'), cursor(p='[[1], {}]'),
+        ):
+            with self.subTest(cursor=value):
+                response = self.client.get(self.url, {'cursor': value})
+                self.assertEqual(response.status_code, 404)
+
+        position = cursor(p='["x", "1"]')
+        response = self.client.get(self.url, {'cursor': position, 'ordering': 'effective_price'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(IMAGE_VARIANTS={'thumbnail': (32, 32), 'small': (64, 64)})
+class FastSerializerParityTests(TestCase):
+    """
+    Lists served by the compiled fast path are identical to the output
+    of the regular serializers.
+    """
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), (200, 30, 30)).save(buffer, 'PNG')
+        logo = SimpleUploadedFile('logo.png', buffer.getvalue(), content_type='image/png')
+        publisher = Publisher.objects.create(name='publisher', slug='publisher', image=logo)
+        images.build_variants(Publisher, publisher.pk, publisher.image.name)
+        Publisher.objects.create(name='no logo', slug='no-logo')
+        parent = Category.objects.create(name='parent', slug='parent')
+        category = Category.objects.create(name='child', slug='child', parent=parent)
+        create_product(
+            'book',
+            discount_price=800,
+            translator='translator',
+            category=category,
+            publisher=publisher,
+            more={'isbn': '978-600-0000-00-0', 'pages': 120},
+        )
+        create_product('other', price=500, category=parent, publisher=publisher, language='en')
+
+    def assertParity(self, view, url):
+        with mock.patch('utils.fast_serializers.CompiledSerializer.serialize', autospec=True,
+                        side_effect=CompiledSerializer.serialize) as serialize:
+            fast = self.client.get(url)
+        self.assertEqual(fast.status_code, 200)
+        self.assertTrue(serialize.called, 'the fast path was not used')
+
+        get_cache().clear()
+        with mock.patch.object(view, 'fast_read_serialization', False):
+            regular = self.client.get(url)
+        get_cache().clear()
+        self.assertEqual(fast.json(), regular.json())
+        return fast.json()['results']
+
+    def test_products(self):
+        for query in ('', '?fields=id,name,created,updated,more,category', '?omit=description,more'):
+            with self.subTest(query=query):
+                self.assertEqual(len(self.assertParity(views.ProductViewSet, f'/products/api/products/{query}')), 2)
+
+    def test_categories(self):
+        self.assertParity(views.CategoryViewSet, '/products/api/category/')
+
+    def test_publishers(self):
+        results = self.assertParity(views.PublisherViewSet, '/products/api/publisher/')
+        logo = next(item for item in results if item['slug'] == 'publisher')
+        self.assertTrue(logo['image'].startswith('http://testserver/media/publishers/'))
+        self.assertEqual(set(logo['image_variants']), {'thumbnail', 'small'})
+
+    @override_settings(TIME_ZONE='Asia/Tehran')
+    def test_datetimes_in_the_current_timezone(self):
+        results = self.assertParity(views.ProductViewSet, '/products/api/products/?fields=id,created')
+        self.assertTrue(results[0]['created'].endswith('+03:30'))
+
+
+class ProductExpandTests(TestCase):
+    """
+    ``?expand=`` must cost a constant number of queries per page.
+    """
+    url = '/products/api/products/?expand=category,publisher&page_size={}'
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(30):
+            category = Category.objects.create(name=f'category {i}', slug=f'category-{i}')
+            publisher = Publisher.objects.create(name=f'publisher {i}', slug=f'publisher-{i}')
+            create_product(f'book-{i}', name=f'book {i}', category=category, publisher=publisher)
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+
+    def count_queries(self, page_size):
+        get_cache().clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url.format(page_size))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), page_size)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self.assertEqual(self.count_queries(5), self.count_queries(30))
+
+    def test_expanded_relations_are_nested(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url.format(30))
+        product = response.data['results'][0]
+        self.assertEqual(product['category']['slug'], 'category-29')
+        self.assertEqual(product['publisher']['slug'], 'publisher-29')
+
+    def test_unexpanded_relations_are_ids(self):
+        response = self.client.get('/products/api/products/?page_size=1')
+        product = response.data['results'][0]
+        self.assertIsInstance(product['category'], int)
+        self.assertIsInstance(product['publisher'], int)
+
+    def test_expand_with_sparse_fieldsets(self):
+        # relations left out by ?fields= / ?omit= are not expanded (nor joined)
+        product = Product.objects.get(slug='book-0')
+        for url in ('/products/api/products/?page_size=1&', f'/products/api/products/{product.pk}/?'):
+            for query, keys in (
+                ('fields=name&expand=category', {'name'}),
+                ('omit=category&expand=category', None),
+                ('fields=name,category&expand=category', {'name', 'category'}),
+            ):
+                with self.subTest(url=url, query=query):
+                    response = self.client.get(f'{url}{query}')
+                    self.assertEqual(response.status_code, 200)
+                    data = response.data['results'][0] if 'results' in response.data else response.data
+                    if keys is not None:
+                        self.assertEqual(set(data), keys)
+                    if 'category' in data:
+                        self.assertIsInstance(data['category'], dict)
+                    else:
+                        self.assertIn('name', data)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked with SQLite EXPLAIN QUERY PLAN')
+class ProductQueryPlanTests(TestCase):
+    """
+    The catalog list queries must be answered from an index, never by a
+    full scan of the product table.
+    """
+    url = '/products/api/products/'
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=f'category {i}', slug=f'category-{i}') for i in range(5)]
+        Category.objects.create(name='child', slug='child', parent=categories[0])
+        publishers = [Publisher.objects.create(name=f'publisher {i}', slug=f'publisher-{i}') for i in range(5)]
+        Product.objects.bulk_create([
+            Product(
+                slug=f'book-{i}',
+                name=f'book {i}',
+                price=(i % 50) * 20000,
+                discount_price=(i % 50) * 15000 if i % 3 == 0 else None,
+                author='author',
+                category=categories[i % 5],
+                main_topic='topic',
+                publisher=publishers[i % 5],
+                description='description',
+                language='fa' if i % 2 else 'en',
+            )
+            for i in range(500)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def query_plans(self, url):
+        """
+        Request ``url`` and its next page, returning the plan lines of every
+        query that reads the product table.
+        """
+        plans = []
+        while url and len(plans) < 2:
+            get_cache().clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            for query in queries.captured_queries:
+                if 'products_product' not in query['sql']:
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}')
+                    plans.append([row[-1] for row in cursor.fetchall()])
+            url = response.data.get('next') if isinstance(response.data, dict) else None
+        return plans
+
+    def assertNoFullScan(self, url, index=None):
+        plans = self.query_plans(url)
+        self.assertTrue(plans)
+        for plan in plans:
+            product_steps = [step for step in plan if ' products_product' in step]
+            for step in product_steps:
+                self.assertNotEqual(step.strip(), 'SCAN products_product', f'{url}: {plan}')
+            if index is not None:
+                self.assertTrue(
+                    any(step.startswith('SEARCH') and index in step for step in product_steps),
+                    f'{url} does not search {index}: {plan}',
+                )
+
+    def test_list(self):
+        self.assertNoFullScan(self.url)
+
+    def test_detail(self):
+        product = Product.objects.first()
+        self.assertNoFullScan(f'{self.url}{product.pk}/')
+
+    def test_category_filter(self):
+        self.assertNoFullScan(f'{self.url}?category=category-1', 'product_category_created_idx')
+
+    def test_category_tree_filter(self):
+        self.assertNoFullScan(f'{self.url}?category_tree=category-0', 'product_category_created_idx')
+
+    def test_publisher_filter(self):
+        self.assertNoFullScan(f'{self.url}?publisher=publisher-1', 'product_publisher_created_idx')
+
+    def test_language_filter(self):
+        self.assertNoFullScan(f'{self.url}?language=en', 'product_language_created_idx')
+
+    def test_price_band_filter(self):
+        self.assertNoFullScan(f'{self.url}?price_band=250000-500000', 'product_price_idx')
+
+    def test_effective_price_range(self):
+        self.assertNoFullScan(f'{self.url}?min_price=200000&max_price=400000', 'product_effective_price_idx')
+
+    def test_isbn_filter(self):
+        self.assertNoFullScan(f'{self.url}?isbn=978-600-0', 'isbn')
+
+    def test_effective_price_ordering(self):
+        self.assertNoFullScan(f'{self.url}?ordering=-effective_price')
+
+
+class ProductEffectivePriceTests(TestCase):
+    """
+    ``?min_price``, ``?max_price`` and ``?ordering=effective_price`` use the
+    discounted price when there is one.
+    """
+    url = '/products/api/products/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for i, (price, discount_price) in enumerate([(500, None), (900, 100), (300, None), (800, 700)]):
+            create_product(f'book-{i}', price=price, discount_price=discount_price)
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+
+    def effective_prices(self, query):
+        prices = []
+        url = f'{self.url}?page_size=1&{query}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            prices += [product['effective_price'] for product in response.data['results']]
+            url = response.data['next']
+        return prices
+
+    def test_ordering_walks_every_page(self):
+        self.assertEqual(self.effective_prices('ordering=effective_price'), [100, 300, 500, 700])
+        self.assertEqual(self.effective_prices('ordering=-effective_price'), [700, 500, 300, 100])
+
+    def test_price_range(self):
+        self.assertEqual(
+            self.effective_prices('ordering=effective_price&min_price=200&max_price=700'),
+            [300, 500, 700],
+        )
+
+    def test_invalid_price(self):
+        response = self.client.get(f'{self.url}?min_price=cheap')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(IMAGE_VARIANTS={'thumbnail': (32, 32), 'small': (64, 64)})
+class PublisherImageVariantsTests(TestCase):
+    """
+    Logos are resized after the upload commits and exposed as variant URLs.
+    """
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        get_cache().clear()
+
+    def upload(self, name, color=(200, 30, 30, 128)):
+        buffer = BytesIO()
+        Image.new('RGBA', (300, 200), color).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_variants_are_built_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            publisher = Publisher.objects.create(name='publisher', slug='publisher', image=self.upload('logo.png'))
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(publisher.image_variants, {})
+
+        variants = images.build_variants(Publisher, publisher.pk, publisher.image.name)
+        publisher.refresh_from_db()
+        self.assertEqual(publisher.image_variants, variants)
+        with Image.open(publisher.image.storage.path(variants['thumbnail']['jpeg'])) as thumbnail:
+            self.assertEqual(thumbnail.width, 32)
+
+        response = APIClient().get('/products/api/publisher/')
+        urls = response.data['results'][0]['image_variants']
+        self.assertEqual(set(urls), {'thumbnail', 'small'})
+        self.assertTrue(urls['small']['webp'].endswith('/media/publishers/variants/logo.png.small.webp'))
+
+    def test_same_stem_does_not_share_variants(self):
+        first = Publisher.objects.create(name='first', slug='first', image=self.upload('logo.png'))
+        first_variants = images.build_variants(Publisher, first.pk, first.image.name)
+        storage = first.image.storage
+        with storage.open(first_variants['thumbnail']['webp']) as handle:
+            thumbnail = handle.read()
+
+        for name in ('logo.jpg', 'logo.png'):
+            other = Publisher.objects.create(
+                name=name, slug=name.replace('.', '-'), image=self.upload(name, color=(30, 30, 200, 255)),
+            )
+            other_variants = images.build_variants(Publisher, other.pk, other.image.name)
+            self.assertNotEqual(other_variants['thumbnail']['webp'], first_variants['thumbnail']['webp'])
+        with storage.open(first_variants['thumbnail']['webp']) as handle:
+            self.assertEqual(handle.read(), thumbnail)
+
+    def test_replaced_image_drops_stale_variants(self):
+        publisher = Publisher.objects.create(name='publisher', slug='publisher', image=self.upload('logo.png'))
+        images.build_variants(Publisher, publisher.pk, publisher.image.name)
+        publisher.refresh_from_db()
+
+        publisher.image = self.upload('new.png')
+        publisher.save()
+        publisher.refresh_from_db()
+        self.assertEqual(publisher.image_variants, {})
+        # a job for the old image must not record its variants any more
+        self.assertIsNone(images.build_variants(Publisher, publisher.pk, 'publishers/logo.png'))
+
+    def variant_files(self, variants):
+        storage = Publisher._meta.get_field('image').storage
+        return {name: storage.exists(name) for name in images.variant_names(variants)}
+
+    def test_regenerated_variants_replace_their_files(self):
+        publisher = Publisher.objects.create(name='publisher', slug='publisher', image=self.upload('logo.png'))
+        old = images.build_variants(Publisher, publisher.pk, publisher.image.name)
+        new = images.build_variants(Publisher, publisher.pk, publisher.image.name)
+        self.assertEqual(len(self.variant_files(old)), 4)
+        self.assertFalse(any(self.variant_files(old).values()))
+        self.assertTrue(all(self.variant_files(new).values()))
+
+    def test_replaced_or_cleared_image_deletes_variant_files(self):
+        publisher = Publisher.objects.create(name='publisher', slug='publisher', image=self.upload('logo.png'))
+        # the instance in memory does not know about the recorded variants
+        old = images.build_variants(Publisher, publisher.pk, publisher.image.name)
+        with mock.patch('utils.images.submit'), self.captureOnCommitCallbacks(execute=True):
+            publisher.image = self.upload('new.png')
+            publisher.save()
+        self.assertFalse(any(self.variant_files(old).values()))
+
+        new = images.build_variants(Publisher, publisher.pk, publisher.image.name)
+        publisher.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            publisher.image = None
+            publisher.save()
+        self.assertFalse(any(self.variant_files(new).values()))
+        publisher.refresh_from_db()
+        self.assertEqual(publisher.image_variants, {})
+
+    def test_unchanged_image_keeps_its_variants(self):
+        publisher = Publisher.objects.create(name='publisher', slug='publisher', image=self.upload('logo.png'))
+        variants = images.build_variants(Publisher, publisher.pk, publisher.image.name)
+        with self.captureOnCommitCallbacks(execute=True):
+            publisher.name = 'renamed'
+            publisher.save()
+        publisher.refresh_from_db()
+        self.assertEqual(publisher.image_variants, variants)
+        self.assertTrue(all(self.variant_files(variants).values()))
+
+    def test_deleted_publisher_deletes_variant_files(self):
+        publisher = Publisher.objects.create(name='publisher', slug='publisher', image=self.upload('logo.png'))
+        images.build_variants(Publisher, publisher.pk, publisher.image.name)
+        publisher.refresh_from_db()
+        variants = publisher.image_variants
+        with self.captureOnCommitCallbacks(execute=True):
+            publisher.delete()
+        self.assertFalse(any(self.variant_files(variants).values()))
+
+
+class ProductMoreColumnsTests(TestCase):
+    """
+    The hot keys of ``more`` are mirrored into indexed columns on every
+    write path and can be filtered on.
+    """
+    url = '/products/api/products/'
+
+    def setUp(self):
+        self.client = APIClient()
+        get_cache().clear()
+
+    def slugs(self, query):
+        response = self.client.get(f'{self.url}?{query}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(product['slug'] for product in response.data['results'])
+
+    def test_save_normalizes_values(self):
+        product = create_product('book', more={'isbn': '978-600-۱۲۳-456-7', 'page_count': '۳۲۰ صفحه', 'publish_year': 1399, 'cover_type': 'شوميز'})
+        self.assertEqual(
+            (product.isbn, product.page_count, product.publish_year, product.cover_type),
+            ('9786001234567', 320, 1399, 'شومیز'),
+        )
+        product.more = {}
+        product.save(update_fields=['more'])
+        product.refresh_from_db()
+        self.assertEqual((product.isbn, product.page_count), ('', None))
+
+    def test_bulk_create_fills_columns(self):
+        self.client.force_authenticate(get_user_model().objects.create(email='staff@example.com', is_staff=True))
+        response = self.client.post(self.url, [
+            product_data('first', more={'page_count': 120}),
+            product_data('second', more={'page_count': 480}),
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(dict(Product.objects.values_list('slug', 'page_count')), {'first': 120, 'second': 480})
+
+    def test_filters(self):
+        create_product('short', more={'isbn': '9786001234567', 'page_count': 120, 'publish_year': 1398, 'cover_type': 'شومیز'})
+        create_product('long', more={'page_count': 800, 'publish_year': 1401, 'cover_type': 'گالینگور'})
+        create_product('unknown', more={})
+        self.assertEqual(self.slugs('isbn=978-600-1234-567'), ['short'])
+        self.assertEqual(self.slugs('min_pages=200'), ['long'])
+        self.assertEqual(self.slugs('max_year=1400'), ['short'])
+        self.assertEqual(self.slugs('publish_year=1401'), ['long'])
+        self.assertEqual(self.slugs('cover_type=گالينگور'), ['long'])
+        self.assertEqual(self.slugs('isbn=not-an-isbn'), [])
+        self.assertEqual(self.slugs('cover_type=%20'), [])
+        self.assertEqual(self.client.get(f'{self.url}?min_pages=many').status_code, 400)
+
+    def test_backfill(self):
+        product = create_product('book', more={'isbn': '9786001234567', 'publish_year': 1399})
+        Product.objects.update(isbn='', publish_year=None)
+        self.client.get(f'{self.url}{product.pk}/')
+        call_command('backfill_more_columns', batch_size=1, stdout=StringIO())
+        product.refresh_from_db()
+        self.assertEqual((product.isbn, product.publish_year), ('9786001234567', 1399))
+        self.assertEqual(self.client.get(f'{self.url}{product.pk}/')['X-Cache'], 'MISS')
+
+
+class AutocompleteTests(TestCase):
+    """
+    Typeahead suggestions come from the in-memory index, ranked by sales,
+    and follow product and publisher changes without a rebuild.
+    """
+    url = '/products/api/products/autocomplete/'
+
+    @classmethod
+    def setUpTestData(cls):
+        from orders.models import Order, OrderItem, Transport
+
+        cls.category, _ = create_catalog()
+        cls.publisher = Publisher.objects.create(name='نشر چشمه', slug='cheshmeh')
+        cls.potter = cls.create('potter', 'هری پاتر و سنگ جادو', 'جی کی رولینگ')
+        cls.pottery = cls.create('pottery', 'پاتریک و دوستان', 'نویسنده')
+        cls.chamber = cls.create('chamber', 'هری پاتر و تالار اسرار', 'جی کی رولینگ')
+
+        user = get_user_model().objects.create(email='buyer@example.com')
+        transport = Transport.objects.create(name_company='post')
+        for status, product, quantity in (('paid', cls.chamber, 5), ('paid', cls.potter, 2), ('canceled', cls.potter, 9)):
+            order = Order.objects.create(user=user, transport=transport, total_price=1000, status=status)
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=1000)
+
+    @classmethod
+    def create(cls, slug, name, author):
+        return create_product(slug, name=name, author=author, category=cls.category, publisher=cls.publisher)
+
+    def setUp(self):
+        self.client = APIClient()
+        autocomplete.reset()
+
+    def tearDown(self):
+        # other tests must not pay for keeping the index up to date
+        autocomplete.reset()
+
+    def suggest(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [(item['type'], item['text']) for item in response.data['results']]
+
+    def test_word_prefixes_ranked_by_sales(self):
+        self.assertEqual(self.suggest('پات'), [
+            ('product', 'هری پاتر و تالار اسرار'),
+            ('product', 'هری پاتر و سنگ جادو'),
+            ('product', 'پاتریک و دوستان'),
+        ])
+        self.assertEqual(self.suggest('هري پاتر و س'), [('product', 'هری پاتر و سنگ جادو')])
+        self.assertEqual(self.suggest('رولی'), [('author', 'جی کی رولینگ')])
+        self.assertEqual(self.suggest('چشم'), [('publisher', 'نشر چشمه')])
+        self.assertEqual(len(self.suggest('پات', limit=1)), 1)
+
+    def test_served_without_queries(self):
+        self.suggest('پات')
+        with self.assertNumQueries(0):
+            self.suggest('هری')
+
+    def test_query_is_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'q': 'a', 'limit': 'x'}).status_code, 400)
+
+    def test_index_follows_changes(self):
+        self.suggest('پات')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.potter.name = 'هری پاتر و زندانی آزکابان'
+            self.potter.author = 'رولینگ'
+            self.potter.save()
+            self.create('new', 'پاتوق', 'نویسنده')
+            self.pottery.delete()
+            Publisher.objects.create(name='نشر نی', slug='ney')
+        self.assertEqual(self.suggest('هری پاتر و'), [
+            ('product', 'هری پاتر و تالار اسرار'),
+            ('product', 'هری پاتر و زندانی آزکابان'),
+        ])
+        self.assertEqual(self.suggest('پاتو'), [('product', 'پاتوق')])
+        self.assertEqual(self.suggest('پاتری'), [])
+        self.assertEqual(self.suggest('نی'), [('publisher', 'نشر نی')])
+        self.assertEqual(self.suggest('رولینگ'), [('author', 'جی کی رولینگ'), ('author', 'رولینگ')])
+
+        # an author disappears with their last book
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chamber.author = 'رولینگ'
+            self.chamber.save()
+        self.assertEqual(self.suggest('جی'), [])
+        self.assertEqual(self.suggest('رولینگ'), [('author', 'رولینگ')])
+
+    def test_bulk_create_is_merged_in_one_pass(self):
+        index = autocomplete.get_index()
+        payload = [
+            product_data(f'bulk-{i}', name=f'پاتیل {i}', author=f'نویسنده {i % 3}', publisher=self.publisher.pk)
+            for i in range(index.merge_threshold + 20)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/products/api/products/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        built = CatalogIndex.build()
+        self.assertEqual(sorted(zip(index._keys, index._ids)), sorted(zip(built._keys, built._ids)))
+        self.assertEqual(index._keys, sorted(index._keys))
+        self.assertEqual(index.author_books, built.author_books)
+        self.assertEqual(len(self.suggest('پاتی', limit=20)), 20)
+
+    def test_warm_up_builds_in_the_background(self):
+        started, release = threading.Event(), threading.Event()
+        built = CatalogIndex()
+
+        def build():
+            started.set()
+            release.wait(5)
+            return built
+
+        with mock.patch.object(CatalogIndex, 'build', side_effect=build) as patched:
+            autocomplete.warm_up()
+            self.assertTrue(started.wait(5))
+            self.assertIsNone(autocomplete.index)
+            release.set()
+            # a request arriving meanwhile waits for the warm-up build
+            self.assertIs(autocomplete.get_index(), built)
+        self.assertEqual(patched.call_count, 1)
+
+
+class RelatedProductTests(TestCase):
+    """
+    "Frequently bought together" counts come from sold orders only, follow
+    newly paid orders and are served with a single query.
+    """
+    url = '/products/api/products/{}/related/'
+
+    @classmethod
+    def setUpTestData(cls):
+        from orders.models import Transport
+
+        cls.books = {slug: create_product(slug) for slug in ('a', 'b', 'c', 'd')}
+        cls.user = get_user_model().objects.create(email='buyer@example.com')
+        cls.transport = Transport.objects.create(name_company='post')
+        cls.paid = cls.order('paid', 'abc')
+        cls.order('shipped', 'ab')
+        cls.pending = cls.order('pending', 'ad')
+        cls.order('canceled', 'acd')
+
+    @classmethod
+    def order(cls, status, slugs):
+        from orders.models import Order, OrderItem
+
+        order = Order.objects.create(user=cls.user, transport=cls.transport, total_price=1000, status=status)
+        for slug in slugs:
+            OrderItem.objects.create(order=order, product=cls.books[slug], price=1000)
+        return order
+
+    def setUp(self):
+        self.client = APIClient()
+        call_command('rebuild_related_products', chunk_size=2, stdout=StringIO())
+
+    def scores(self, slug):
+        return dict(
+            RelatedProduct.objects.filter(product=self.books[slug])
+            .values_list('related__slug', 'score')
+        )
+
+    def test_rebuild_counts_sold_orders(self):
+        self.assertEqual(self.scores('a'), {'b': 2, 'c': 1})
+        self.assertEqual(self.scores('c'), {'a': 1, 'b': 1})
+        self.assertEqual(self.scores('d'), {})
+
+    @override_settings(RELATED_PRODUCTS_KEPT=1)
+    def test_rebuild_keeps_best_pairs(self):
+        call_command('rebuild_related_products', stdout=StringIO())
+        self.assertEqual(self.scores('a'), {'b': 2})
+
+    def test_paid_order_is_added_once(self):
+        self.pending.status = 'paid'
+        self.pending.save()
+        self.pending.save()
+        self.assertEqual(self.scores('a'), {'b': 2, 'c': 1, 'd': 1})
+        self.assertEqual(self.scores('d'), {'a': 1})
+
+    def test_canceled_order_is_removed(self):
+        self.paid.status = 'canceled'
+        self.paid.save()
+        self.assertEqual(self.scores('a'), {'b': 1})
+        self.assertEqual(self.scores('c'), {})
+        incremental = set(RelatedProduct.objects.values_list('product', 'related', 'score'))
+        call_command('rebuild_related_products', stdout=StringIO())
+        self.assertEqual(set(RelatedProduct.objects.values_list('product', 'related', 'score')), incremental)
+
+    def test_endpoint(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url.format(self.books['a'].pk))
+        self.assertEqual([product['slug'] for product in response.data['results']], ['b', 'c'])
+        response = self.client.get(self.url.format(self.books['a'].pk), {'limit': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(self.client.get(self.url.format('x')).status_code, 404)
+
+
+class BestsellerTests(TestCase):
+    """
+    Bestseller rankings come from the daily sales rollup, which counts
+    sold orders only and follows newly paid orders.
+    """
+    url = '/products/api/products/bestsellers/'
+
+    @classmethod
+    def setUpTestData(cls):
+        from orders.models import Transport
+
+        cls.novels = Category.objects.create(name='novels', slug='novels')
+        cls.poetry = Category.objects.create(name='poetry', slug='poetry')
+        cls.books = {
+            slug: create_product(slug, category=category)
+            for slug, category in (('a', cls.novels), ('b', cls.novels), ('c', cls.poetry))
+        }
+        cls.user = get_user_model().objects.create(email='buyer@example.com')
+        cls.transport = Transport.objects.create(name_company='post')
+        cls.paid = cls.order('paid', {'a': 3, 'b': 1})
+        cls.order('shipped', {'b': 5}, days_ago=10)
+        cls.order('canceled', {'a': 9})
+        cls.pending = cls.order('pending', {'c': 2})
+
+    @classmethod
+    def order(cls, status, quantities, days_ago=0):
+        from orders.models import Order, OrderItem
+
+        order = Order.objects.create(user=cls.user, transport=cls.transport, total_price=1000, status=status)
+        Order.objects.filter(pk=order.pk).update(created=timezone.now() - timedelta(days=days_ago))
+        for slug, quantity in quantities.items():
+            OrderItem.objects.create(order=order, product=cls.books[slug], quantity=quantity, price=1000)
+        return order
+
+    def setUp(self):
+        self.client = APIClient()
+        call_command('rebuild_daily_sales', batch_size=1, stdout=StringIO())
+
+    def ranking(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [(product['slug'], product['sold']) for product in response.data['results']]
+
+    def test_rankings(self):
+        self.assertEqual(self.ranking(), [('a', 3), ('b', 1)])
+        self.assertEqual(self.ranking(days=30), [('b', 6), ('a', 3)])
+        self.assertEqual(self.ranking(days=30, limit=1), [('b', 6)])
+        self.assertEqual(self.ranking(category=self.poetry.pk), [])
+        self.assertEqual(self.client.get(self.url, {'days': 0}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'category': 'x'}).status_code, 400)
+
+    def test_query_count_is_constant(self):
+        with self.assertNumQueries(2):
+            self.client.get(self.url, {'days': 30})
+
+    def test_paid_order_is_added_incrementally(self):
+        self.pending.status = 'paid'
+        self.pending.save()
+        self.assertEqual(self.ranking(category=self.poetry.pk), [('c', 2)])
+        incremental = set(ProductDailySales.objects.values_list('product', 'day', 'quantity'))
+        call_command('rebuild_daily_sales', stdout=StringIO())
+        self.assertEqual(set(ProductDailySales.objects.values_list('product', 'day', 'quantity')), incremental)
+
+    def test_canceled_order_is_removed(self):
+        self.paid.status = 'canceled'
+        self.paid.save()
+        self.assertEqual(self.ranking(days=30), [('b', 5)])
+        incremental = set(ProductDailySales.objects.values_list('product', 'day', 'quantity'))
+        call_command('rebuild_daily_sales', stdout=StringIO())
+        self.assertEqual(set(ProductDailySales.objects.values_list('product', 'day', 'quantity')), incremental)
@@ -13,5 +13,6 @@ app_name = 'products'
 
 urlpatterns = [
     path('api/', include(router.urls)),
+    path('api/cache-stats/', views.CatalogCacheStatsView.as_view(), name='cache-stats'),
 
 ]
@@ -1,10 +1,25 @@
 from django.shortcuts import render
+from django.db.models import F, Max, Subquery
 from rest_framework import viewsets
-from . import serializers
-from . import models
+from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import SAFE_METHODS, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework import status
-
+from . import serializers
+from . import models
+from . import attributes
+from . import bestsellers
+from . import facets
+from . import recommendations
+from . import response_cache
+from .autocomplete import autocomplete
+from .mixins import CachedResponseMixin, ConditionalGetMixin, FastReadMixin
+from .search import get_search_backend
+from utils.exports import EXPORT_FORMATS, streaming_export
+from utils.pagination import KeysetPagination, NameKeysetPagination
 
 class ListCreateMixin:
     """
@@ -14,6 +29,10 @@ class ListCreateMixin:
     either a single object or a list of objects in a single request.
     If the request data is a list, it will attempt to create multiple objects.
     Otherwise, it will proceed with creating a single object as usual.
+
+    Lists are handled by the serializer's ``list_serializer_class``; with
+    BulkCreateListSerializer the whole batch is validated with a constant
+    number of queries and written with ``bulk_create``.
     """
     def create(self, request, *args, **kwargs):
         """
@@ -45,7 +64,7 @@ class ListCreateMixin:
 # Create your views here.
 
 # view for product
-class ProductViewSet(ListCreateMixin, viewsets.ModelViewSet):
+class ProductViewSet(CachedResponseMixin, ConditionalGetMixin, FastReadMixin, ListCreateMixin, viewsets.ModelViewSet):
     """
     ViewSet for handling Product-related operations.
 
@@ -53,13 +72,320 @@ class ProductViewSet(ListCreateMixin, viewsets.ModelViewSet):
     for the Product model. It utilizes the ListCreateMixin to support
     creating products either individually or in bulk via a list.
 
+    Lists are keyset-paginated on ``(-created, -id)``, or on the
+    ``?ordering=`` field, and list/detail responses are cached and
+    support conditional GET.
     """
     queryset = models.Product.objects.all()
     serializer_class = serializers.ProductSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [OrderingFilter]
+    # every ordering is backed by an index ending in id, the keyset tiebreaker
+    ordering_fields = ('created', 'price', 'effective_price')
+    # integer query params and the lookups they filter on
+    number_filters = {
+        'min_price': 'effective_price__gte',
+        'max_price': 'effective_price__lte',
+        'min_pages': 'page_count__gte',
+        'max_pages': 'page_count__lte',
+        'publish_year': 'publish_year',
+        'min_year': 'publish_year__gte',
+        'max_year': 'publish_year__lte',
+    }
+    fast_read_serialization = True
+    # actions answering with many products use the compact serializer
+    list_actions = ('list', 'search', 'facets', 'related', 'bestsellers')
+    export_fields = (
+        'id', 'slug', 'name', 'price', 'discount_price', 'stock', 'author',
+        'translator', 'main_topic', 'secondary_topic', 'language',
+        'description', 'more', 'created', 'updated',
+    )
+
+    def get_serializer_class(self):
+        """
+        Use the compact serializer for lists unless the client picked its
+        own fields with ``?fields=``.
+        """
+        if self.action in self.list_actions and 'fields' not in self.request.query_params:
+            return serializers.ProductCompactSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        """
+        On reads, load only the columns the chosen serializer will output
+        (honouring ``?fields=`` / ``?omit=``).
+        """
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS and self.action in (*self.list_actions, 'retrieve'):
+            queryset = queryset.only(*self.get_read_columns())
+            queryset = self.load_expanded_relations(queryset)
+        return queryset
+
+    def load_expanded_relations(self, queryset):
+        """
+        Join (or prefetch) the relations named in ``?expand=`` so nested
+        representations cost a constant number of queries per page.
+        """
+        for name in self.get_expanded_relations():
+            field = models.Product._meta.get_field(name)
+            if field.many_to_many or field.one_to_many:
+                queryset = queryset.prefetch_related(name)
+            else:
+                queryset = queryset.select_related(name)
+        return queryset
+
+    def get_conditional_state(self, request):
+        """
+        Expanded relations are part of the representation, so their last
+        modification also goes into the entity tag.
+        """
+        state = []
+        for name in sorted(self.get_expanded_relations()):
+            related = models.Product._meta.get_field(name).related_model
+            state.append(str(related.objects.aggregate(last_modified=Max('updated'))['last_modified']))
+        return ':'.join(state)
+
+    def get_expanded_relations(self):
+        """
+        Return the relations named in ``?expand=`` that ``?fields=`` /
+        ``?omit=`` left in the representation; the others are neither
+        output nor read, so they must not be joined either.
+        """
+        serializer_class = self.get_serializer_class()
+        serializer = serializer_class(context=self.get_serializer_context())
+        return serializer_class.expanded_relations(self.request) & set(serializer.fields)
+
+    def get_read_columns(self):
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        concrete = {field.name for field in models.Product._meta.concrete_fields}
+        columns = {field.source for field in serializer.fields.values() if field.source in concrete}
+        # the keyset cursor reads the ordering columns from every row
+        ordering = self.paginator.get_ordering(self.request, super().get_queryset(), self)
+        return columns | {field.lstrip('-') for field in ordering}
+
+    def filter_queryset(self, queryset):
+        """
+        Apply the catalog facet filters (category, publisher, language,
+        main_topic, price_band), the ``number_filters`` (effective price,
+        page count and publish year), ``isbn``, ``cover_type`` and the
+        ``category_tree`` subtree filter from the query string.
+        """
+        queryset = super().filter_queryset(queryset)
+        params = self.request.query_params
+        queryset = facets.filter_products(queryset, params)
+
+        for param, lookup in self.number_filters.items():
+            value = params.get(param)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({param: 'A valid integer is required.'})
+                queryset = queryset.filter(**{lookup: int(value)})
+        # the columns mirrored from ``more`` hold normalized values; a value
+        # that normalizes to nothing would match every product without one
+        for param, parse in (('isbn', attributes.parse_isbn), ('cover_type', attributes.parse_label)):
+            if params.get(param):
+                value = parse(params[param])
+                queryset = queryset.filter(**{param: value}) if value else queryset.none()
+
+        tree_slug = params.get('category_tree')
+        if tree_slug:
+            # products in the category and all of its descendants, in one query
+            root_path = models.Category.objects.filter(slug=tree_slug).values('path')[:1]
+            subtree = models.Category.objects.descendant_ids(path=Subquery(root_path))
+            # category_id IN (...) keeps the product side on its category index
+            queryset = queryset.filter(category__in=subtree)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Stream the (filtered) catalog as NDJSON or CSV.
+
+        Query params:
+            output: ``ndjson`` (default) or ``csv``.
+
+        Returns:
+            StreamingHttpResponse: One row per product, with category and
+                                   publisher given by slug.
+        """
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ValidationError({'output': f'Must be one of: {", ".join(EXPORT_FORMATS)}.'})
+
+        queryset = self.filter_queryset(self.get_queryset()).order_by('pk')
+        return streaming_export(
+            queryset,
+            self.export_fields,
+            export_format,
+            filename='products',
+            category_slug=F('category__slug'),
+            publisher_slug=F('publisher__slug'),
+        )
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Return a page of filtered products together with the product count
+        of every facet value.
+
+        Unfiltered counts come straight from the precomputed FacetCount
+        table. As soon as any filter narrows the products (facets, price,
+        ``category_tree``, ``isbn``...), the counts are aggregated over the
+        filtered rows instead: one GROUP BY per facet, whose cost grows with
+        the number of matching products rather than staying constant.
+
+        Returns:
+            Response: The paginated results plus a ``facets`` mapping of
+                      facet name to a list of ``{value, label, count}``.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+        # any WHERE clause means filter_queryset narrowed the catalog
+        counts = facets.counts(queryset) if queryset.query.has_filters() else facets.counts()
+        response.data['facets'] = self._facet_listing(counts)
+        return response
+
+    def _facet_listing(self, counts):
+        # category and publisher counts are kept by pk but listed by slug,
+        # so every ``value`` can be sent back as the next request's filter
+        related = {}
+        for facet, model in (('category', models.Category), ('publisher', models.Publisher)):
+            pks = [value for value in counts[facet] if value.isdigit()]
+            related[facet] = {
+                str(pk): (slug, name)
+                for pk, slug, name in model.objects.filter(pk__in=pks).values_list('pk', 'slug', 'name')
+            }
+        listing = {}
+        for facet, values in counts.items():
+            items = []
+            for value, count in sorted(values.items(), key=lambda item: -item[1]):
+                value, label = related.get(facet, {}).get(value, (value, value))
+                items.append({'value': value, 'label': label, 'count': count})
+            listing[facet] = items
+        return listing
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """
+        Typeahead suggestions for the search box, served from the in-memory
+        prefix index without touching the database.
+
+        Query params:
+            q: What has been typed so far; every word of a suggestion can
+               match, the last typed word as a prefix.
+            limit: Number of suggestions, at most 20 (default 10).
+
+        Returns:
+            Response: ``results``, the most popular matching products,
+                      authors and publishers as ``{type, text, ...}``.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        return Response({'results': autocomplete.suggest(query, max(limit, 1))})
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """
+        Products frequently bought together with this one, best first.
+
+        Read with a single query on the ``(product, -score, related)`` index
+        of RelatedProduct; a product nobody bought yet has no results.
+
+        Query params:
+            limit: Number of products, at most ``RELATED_PRODUCTS_KEPT``
+                   (default 10).
+        """
+        if not str(pk).isdigit():
+            raise NotFound()
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), recommendations.kept())
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+
+        products = (
+            self.get_queryset()
+            .filter(recommended_with__product=pk)
+            .order_by('-recommended_with__score', 'recommended_with__related_id')[:max(limit, 1)]
+        )
+        return Response({'results': self.get_serializer(products, many=True).data})
+
+    @action(detail=False, methods=['get'])
+    def bestsellers(self, request):
+        """
+        Best selling products over a time window, read from the daily
+        sales rollup rather than the order history.
+
+        Query params:
+            days: Length of the window ending today, 1 to 365 (default 7).
+            category: Only products of this category (id).
+            publisher: Only products of this publisher (id).
+            limit: Number of products, capped by the pagination
+                   ``max_page_size`` (default 10).
+
+        Returns:
+            Response: ``results``, products best first, each with the
+                      number of copies ``sold`` in the window.
+        """
+        values = {}
+        for param in ('days', 'category', 'publisher', 'limit'):
+            value = request.query_params.get(param)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({param: 'A valid integer is required.'})
+                values[param] = int(value)
+        days = values.get('days', 7)
+        if not 1 <= days <= bestsellers.MAX_DAYS:
+            raise ValidationError({'days': f'Must be between 1 and {bestsellers.MAX_DAYS}.'})
+        limit = max(min(values.get('limit', 10), self.pagination_class.max_page_size), 1)
+        filters = {name: values[name] for name in ('category', 'publisher') if name in values}
+
+        ranking = bestsellers.ranking(days, limit, **filters)
+        products = self.get_queryset().in_bulk([pk for pk, _ in ranking])
+        ranking = [(products[pk], sold) for pk, sold in ranking if pk in products]
+        results = self.get_serializer([product for product, _ in ranking], many=True).data
+        for item, (_, sold) in zip(results, ranking):
+            item['sold'] = sold
+        return Response({'results': results})
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over name, author, translator and description.
+
+        Query params:
+            q: The search text. The last word is matched as a prefix.
+            limit: Maximum number of results, capped by the pagination
+                   ``max_page_size``.
+
+        Returns:
+            Response: Matching products ordered by relevance.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'This query parameter is required.'})
+
+        paginator = self.pagination_class
+        try:
+            limit = min(int(request.query_params.get('limit', paginator.page_size)), paginator.max_page_size)
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+
+        ids = get_search_backend().search(query, max(limit, 1))
+        products = self.get_queryset().in_bulk(ids)
+        results = [products[pk] for pk in ids if pk in products]
+        serializer = self.get_serializer(results, many=True)
+        return Response({'results': serializer.data})
 
 
 # view for category
-class CategoryViewSet(ListCreateMixin, viewsets.ModelViewSet):
+class CategoryViewSet(CachedResponseMixin, ConditionalGetMixin, FastReadMixin, ListCreateMixin, viewsets.ModelViewSet):
     """
     ViewSet for handling Category-related operations.
 
@@ -67,12 +393,23 @@ class CategoryViewSet(ListCreateMixin, viewsets.ModelViewSet):
     for the Category model. It leverages the ListCreateMixin to enable
     creating categories either one by one or as a list in a single request.
 
+    Lists are keyset-paginated on ``(name, id)`` and list/detail
+    responses are cached and support conditional GET.
     """
     serializer_class = serializers.CategorySerializer
     queryset = models.Category.objects.all()
+    pagination_class = NameKeysetPagination
+    fast_read_serialization = True
+
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """
+        Return the full category tree as nested nodes for menus.
+        """
+        return Response(models.Category.objects.tree())
 
 # view for publisher
-class PublisherViewSet(ListCreateMixin, viewsets.ModelViewSet):
+class PublisherViewSet(CachedResponseMixin, ConditionalGetMixin, FastReadMixin, ListCreateMixin, viewsets.ModelViewSet):
     """
     ViewSet for handling Publisher-related operations.
 
@@ -81,6 +418,20 @@ class PublisherViewSet(ListCreateMixin, viewsets.ModelViewSet):
     for the creation of publishers either individually or through a bulk list
     in a single API call.
 
+    Lists are keyset-paginated on ``(name, id)`` and list/detail
+    responses are cached and support conditional GET.
     """
     queryset = models.Publisher.objects.all()
-    serializer_class = serializers.PublisherSerializer
\ No newline at end of file
+    serializer_class = serializers.PublisherSerializer
+    pagination_class = NameKeysetPagination
+    fast_read_serialization = True
+
+
+class CatalogCacheStatsView(APIView):
+    """
+    Hit rate and latency counters of the catalog response cache (staff only).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(response_cache.stats.snapshot())
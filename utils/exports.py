@@ -0,0 +1,74 @@
+import csv
+import json
+from datetime import date, datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class _Echo:
+    """
+    File-like object whose ``write`` returns the value, so ``csv.writer``
+    can produce one line at a time for a streaming response.
+    """
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows, fields):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[field]) for field in fields])
+
+
+def streaming_export(queryset, fields, export_format, filename, chunk_size=2000, **expressions):
+    """
+    Stream ``queryset`` as NDJSON or CSV without loading it into memory.
+
+    Rows are read with ``.values(*fields, **expressions).iterator(chunk_size)``
+    so only one chunk of plain dicts is alive at a time, and each row is
+    encoded and handed to the client as soon as it is read.
+
+    Args:
+        queryset: The queryset to export.
+        fields: Model fields (or lookups) to include, in column order.
+        export_format: Either ``'ndjson'`` or ``'csv'``.
+        filename: Download file name, without extension.
+        chunk_size: Number of rows fetched from the database per round trip.
+        **expressions: Extra named columns, e.g. ``category=F('category__slug')``.
+
+    Returns:
+        StreamingHttpResponse: The streaming download.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unsupported export format: {export_format}')
+
+    rows = queryset.values(*fields, **expressions).iterator(chunk_size=chunk_size)
+    if export_format == 'csv':
+        content = csv_lines(rows, [*fields, *expressions])
+    else:
+        content = ndjson_lines(rows)
+
+    response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[export_format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
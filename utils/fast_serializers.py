@@ -0,0 +1,166 @@
+import threading
+
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import fields as drf_fields
+from rest_framework import ISO_8601, relations, serializers
+from rest_framework.settings import api_settings
+
+
+# DRF fields whose to_representation returns database values unchanged
+_IDENTITY_FIELDS = (
+    drf_fields.CharField,
+    drf_fields.IntegerField,
+    drf_fields.BooleanField,
+    drf_fields.JSONField,
+    drf_fields.ReadOnlyField,
+)
+
+
+class CompiledSerializer:
+    """
+    Read-only serialization plan compiled once from a ModelSerializer.
+
+    Instead of instantiating models and running every DRF field's
+    ``to_representation``, rows are read with ``.values(*columns)`` and each
+    output key is copied straight from its column, converting only the
+    types whose JSON form differs from the database value (datetimes,
+    files, decimals...). The output is identical to ``serializer.data``.
+
+    Use ``compile_serializer`` to get one; it returns None for serializers
+    that cannot be compiled (nested serializers, method fields, dotted
+    sources), in which case callers fall back to the regular serializer.
+    """
+    def __init__(self, plan):
+        # plan: [(output_name, column, converter factory or None)]
+        self.plan = plan
+        self.columns = tuple(dict.fromkeys(column for _, column, _ in plan))
+
+    def serialize(self, rows, request=None):
+        # converters are bound once per call, so request-dependent state
+        # (absolute URLs, the active timezone) is resolved once, not per row
+        plan = [
+            (name, column, factory(request) if factory is not None else None)
+            for name, column, factory in self.plan
+        ]
+        results = []
+        for row in rows:
+            item = {}
+            for name, column, convert in plan:
+                value = row[column]
+                if value is not None and convert is not None:
+                    value = convert(value)
+                item[name] = value
+            results.append(item)
+        return results
+
+
+def _file_converter(model_field, use_url):
+    storage = model_field.storage
+
+    def factory(request):
+        def convert(name):
+            if not name:
+                return None
+            if not use_url:
+                return name
+            url = storage.url(name)
+            return request.build_absolute_uri(url) if request is not None else url
+        return convert
+    return factory
+
+
+def _field_converter(field):
+    to_representation = field.to_representation
+
+    def factory(request):
+        return to_representation
+    return factory
+
+
+def _datetime_converter(field):
+    """
+    ISO 8601 datetimes without going through DRF's per-value format lookup;
+    anything unusual (naive values, custom formats) uses the field itself.
+    """
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601:
+        return _field_converter(field)
+    to_representation = field.to_representation
+
+    def factory(request):
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+
+        def convert(value):
+            if isinstance(value, str) or value.tzinfo is None or field_timezone is None:
+                return to_representation(value)
+            text = value.astimezone(field_timezone).isoformat()
+            return text[:-6] + 'Z' if text.endswith('+00:00') else text
+        return convert
+    return factory
+
+
+def _compile_field(field, model):
+    """
+    Return ``(column, converter)`` for a serializer field, or None when the
+    field cannot be read from a single column.
+    """
+    if isinstance(field, (serializers.BaseSerializer, drf_fields.SerializerMethodField, drf_fields.HiddenField)):
+        return None
+    if isinstance(field, drf_fields.ModelField):
+        # represents the model instance, not a column value
+        return None
+    source = field.source
+    if not source or source == '*' or '.' in source:
+        return None
+    try:
+        model_field = model._meta.get_field(source)
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete or model_field.many_to_many:
+        return None
+    if hasattr(field, 'fast_converter'):
+        # fields that know how to convert a column value themselves
+        return source, field.fast_converter(model)
+
+    if isinstance(field, relations.PrimaryKeyRelatedField):
+        return (source, None) if field.pk_field is None else None
+    if isinstance(field, relations.RelatedField):
+        return None
+    if isinstance(field, drf_fields.FileField):
+        return source, _file_converter(model_field, getattr(field, 'use_url', True))
+    if isinstance(field, drf_fields.DateTimeField):
+        return source, _datetime_converter(field)
+    if isinstance(field, _IDENTITY_FIELDS) and not isinstance(field, drf_fields.ChoiceField):
+        return source, None
+    return source, _field_converter(field)
+
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def compile_serializer(serializer):
+    """
+    Compile (or fetch from the cache) the plan for a serializer instance.
+
+    Plans are cached per serializer class and set of readable fields (with
+    their types), so sparse fieldsets and expansions get their own plan.
+    """
+    readable = [field for field in serializer.fields.values() if not field.write_only]
+    key = (type(serializer), tuple((field.field_name, type(field)) for field in readable))
+    if key in _compiled:
+        return _compiled[key]
+
+    model = serializer.Meta.model
+    plan = []
+    for field in readable:
+        compiled = _compile_field(field, model)
+        if compiled is None:
+            plan = None
+            break
+        plan.append((field.field_name, *compiled))
+
+    result = CompiledSerializer(plan) if plan is not None else None
+    with _compiled_lock:
+        _compiled[key] = result
+    return result
@@ -0,0 +1,234 @@
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .signals import image_variants_generated
+
+
+logger = logging.getLogger(__name__)
+
+# Pillow format name, file extension and save options per output format
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def get_variants():
+    """
+    Return ``{variant: (max_width, max_height)}`` from ``settings.IMAGE_VARIANTS``.
+    """
+    return getattr(settings, 'IMAGE_VARIANTS', {'thumbnail': (128, 128)})
+
+
+def get_formats():
+    return getattr(settings, 'IMAGE_VARIANT_FORMATS', ('webp', 'jpeg'))
+
+
+def variant_path(name, variant, output_format):
+    """
+    Storage name of a variant, next to the original:
+    ``publishers/logo.png`` -> ``publishers/variants/logo.png.thumbnail.webp``.
+
+    The whole file name is kept, extension included, so the variants of
+    ``logo.png`` and ``logo.jpg`` never share a name.
+    """
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, 'variants', f'{filename}.{variant}.{FORMATS[output_format][1]}')
+
+
+def _prepare(image, output_format):
+    if output_format == 'jpeg' and image.mode not in ('RGB', 'L'):
+        # JPEG has no alpha channel, flatten transparent logos onto white
+        rgba = image.convert('RGBA')
+        flattened = Image.new('RGB', rgba.size, 'white')
+        flattened.paste(rgba, mask=rgba.getchannel('A'))
+        return flattened
+    if output_format == 'webp' and image.mode not in ('RGB', 'RGBA'):
+        return image.convert('RGBA')
+    return image
+
+
+def generate_variants(field_file):
+    """
+    Write every configured variant of an image file and return
+    ``{'source': name, variant: {format: storage name}}``.
+
+    Images are only ever shrunk, keeping their aspect ratio.
+    """
+    storage = field_file.storage
+    sizes = get_variants()
+    # largest first: each variant is shrunk from the previous one instead
+    # of from the (possibly huge) original
+    order = sorted(sizes, key=lambda variant: sizes[variant], reverse=True)
+    with field_file.open('rb'):
+        image = Image.open(field_file)
+        # let the JPEG decoder downscale while decoding
+        image.draft('RGB', sizes[order[0]])
+        image.load()
+    image = ImageOps.exif_transpose(image)
+
+    variants = {'source': field_file.name}
+    for variant in order:
+        image = image.copy()
+        image.thumbnail(sizes[variant], Image.Resampling.LANCZOS)
+        resized = image
+        variants[variant] = {}
+        for output_format in get_formats():
+            pillow_format, _, options = FORMATS[output_format]
+            buffer = BytesIO()
+            _prepare(resized, output_format).save(buffer, format=pillow_format, **options)
+            # the storage picks a free name rather than overwriting a file
+            # another object may still be serving
+            name = variant_path(field_file.name, variant, output_format)
+            variants[variant][output_format] = storage.save(name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def variant_names(variants):
+    """
+    Return the storage names of the files listed in an ``image_variants``
+    mapping (everything but its ``source``).
+    """
+    return {
+        name
+        for variant, files in variants.items() if variant != 'source'
+        for name in files.values()
+    }
+
+
+def delete_variants(storage, names):
+    """
+    Delete variant files that no row refers to any more.
+    """
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError:
+            logger.warning('Could not delete image variant %s', name, exc_info=True)
+
+
+def build_variants(model, pk, name, field_name='image'):
+    """
+    Build the variants of image ``name`` of one object and record them,
+    unless the image was replaced in the meantime. The files of the
+    variants they replace (or of these ones, if they were not recorded)
+    are deleted.
+
+    Returns:
+        dict: The recorded variants, or None if the image changed.
+    """
+    instance = model._default_manager.filter(pk=pk, **{field_name: name}).first()
+    if instance is None:
+        return None
+    field_file = getattr(instance, field_name)
+    variants = generate_variants(field_file)
+    updated = model._default_manager.filter(pk=pk, **{field_name: name}).update(
+        image_variants=variants,
+        updated=timezone.now(),
+    )
+    if not updated:
+        delete_variants(field_file.storage, variant_names(variants))
+        return None
+    delete_variants(field_file.storage, variant_names(instance.image_variants) - variant_names(variants))
+    image_variants_generated.send(sender=model, pk=pk, variants=variants)
+    return variants
+
+
+def _run(model, pk, name, field_name):
+    # worker threads manage their own connections, like a request would
+    close_old_connections()
+    try:
+        return build_variants(model, pk, name, field_name)
+    except Exception:
+        logger.exception('Could not generate image variants for %s %s', model._meta.label, pk)
+        raise
+    finally:
+        close_old_connections()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_WORKERS', 4),
+                thread_name_prefix='image-variants',
+            )
+        return _executor
+
+
+def submit(model, pk, name, field_name='image', executor=None):
+    """
+    Queue the variant generation of one image on the worker pool
+    (or on ``executor``).
+    """
+    future = (executor or get_executor()).submit(_run, model, pk, name, field_name)
+    _pending.add(future)
+    future.add_done_callback(_pending.discard)
+    return future
+
+
+def schedule(instance, field_name='image'):
+    """
+    Queue variant generation for ``instance`` once the current transaction
+    commits, if its image has no up-to-date variants yet. Never blocks.
+    """
+    name = getattr(instance, field_name).name
+    if not name or instance.image_variants.get('source') == name:
+        return
+    model, pk = type(instance), instance.pk
+    transaction.on_commit(lambda: submit(model, pk, name, field_name))
+
+
+def reset_stale(instance, field_name='image'):
+    """
+    Forget the variants of a replaced or removed image, before it is saved,
+    and delete their files once the save commits.
+    """
+    field_file = getattr(instance, field_name)
+    if instance.image_variants.get('source') == field_file.name:
+        return
+    if not (field_file.name or instance.image_variants):
+        return
+    if instance.pk is not None:
+        # the variants are recorded by a worker, possibly after the
+        # instance was loaded, so the stored ones are the ones to drop
+        stored = (
+            type(instance)._default_manager.filter(pk=instance.pk)
+            .values_list('image_variants', flat=True).first()
+        ) or {}
+        if stored.get('source') == field_file.name:
+            instance.image_variants = stored
+            return
+        discard(field_file.storage, stored)
+    instance.image_variants = {}
+
+
+def discard(storage, variants):
+    """
+    Delete the files of an ``image_variants`` mapping once the current
+    transaction commits.
+    """
+    names = variant_names(variants)
+    if names:
+        transaction.on_commit(lambda: delete_variants(storage, names))
+
+
+def wait_pending(timeout=None):
+    """
+    Block until the queued variant jobs are done (for commands and tests).
+    """
+    wait(list(_pending), timeout=timeout)
@@ -0,0 +1,82 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from utils import images
+
+
+class Command(BaseCommand):
+    help = (
+        'Regenerate the resized variants of every stored image (publisher '
+        'logos, user avatars) on a pool of worker threads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            action='append',
+            help='Only this model, e.g. products.Publisher. Can be repeated.',
+        )
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Skip images whose variants are already up to date.',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'IMAGE_WORKERS', 4),
+            help='Number of worker threads.',
+        )
+
+    def handle(self, *args, **options):
+        models = self.get_models(options['model'])
+        workers = options['workers']
+        done = failed = 0
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image-variants') as executor:
+            pending = set()
+            for model in models:
+                rows = model._default_manager.exclude(image='').exclude(image__isnull=True)
+                for pk, name, variants in rows.values_list('pk', 'image', 'image_variants').iterator(chunk_size=2000):
+                    if options['missing'] and variants.get('source') == name:
+                        continue
+                    pending.add(images.submit(model, pk, name, executor=executor))
+                    # keep a bounded number of jobs queued
+                    if len(pending) >= workers * 4:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        done, failed = self.count(finished, done, failed)
+            finished, _ = wait(pending)
+            done, failed = self.count(finished, done, failed)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Regenerated variants of {done} images ({failed} failed) in {elapsed:.1f}s '
+            f'({done / elapsed if elapsed else 0:.1f} images/sec, {workers} workers)'
+        ))
+
+    def get_models(self, labels):
+        if not labels:
+            return [
+                model for model in apps.get_models()
+                if any(field.name == 'image_variants' for field in model._meta.fields)
+            ]
+        models = []
+        for label in labels:
+            try:
+                models.append(apps.get_model(label))
+            except (LookupError, ValueError):
+                raise CommandError(f'Unknown model: {label}')
+        return models
+
+    def count(self, finished, done, failed):
+        for future in finished:
+            if future.exception() is None:
+                done += 1
+            else:
+                failed += 1
+        return done, failed
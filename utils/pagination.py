@@ -0,0 +1,145 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor (keyset) pagination over a composite, unique ordering.
+
+    DRF's CursorPagination only keys on the first ordering field and falls
+    back to an OFFSET for ties. Here the cursor stores the value of every
+    ordering field, and the next page is fetched with a row-value comparison
+    such as ``created < c OR (created = c AND id < i)``, so every page costs
+    the same index range scan no matter how deep the client pages.
+    """
+    ordering = ('-created', '-id')
+    page_size = getattr(settings, 'API_PAGE_SIZE', 20)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 100)
+
+    def get_ordering(self, request, queryset, view):
+        """
+        Return the ordering, always ending with the primary key so that
+        every row has a unique position.
+        """
+        ordering = super().get_ordering(request, queryset, view)
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            tiebreaker = '-id' if ordering[0].startswith('-') else 'id'
+            ordering = ordering + (tiebreaker,)
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            _, reverse, current_position = self.cursor
+
+        ordering = self._reverse(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self._keyset_filter(queryset.model, ordering, current_position))
+
+        # Fetch one extra row to know whether a following page exists.
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = current_position is not None
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def _keyset_filter(self, model, ordering, position):
+        """
+        Build the condition selecting rows strictly after ``position``
+        in the given ordering.
+
+        Cursors come from the client, so every value is converted with its
+        model field first; anything that does not convert is a 404.
+        """
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        condition = Q()
+        equal = Q()
+        for order, value in zip(ordering, values):
+            field_name = order.lstrip('-')
+            value = self._to_python(model, field_name, value)
+            lookup = '__lt' if order.startswith('-') else '__gt'
+            condition |= equal & Q(**{field_name + lookup: value})
+            equal &= Q(**{field_name: value})
+        return condition
+
+    def _to_python(self, model, field_name, value):
+        field = model._meta.pk if field_name == 'pk' else model._meta.get_field(field_name)
+        # a GeneratedField converts through the field it outputs
+        field = getattr(field, 'output_field', field)
+        try:
+            value = field.to_python(value) if value is not None else None
+        except (TypeError, ValueError, ValidationError):
+            value = None
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            field_name = order.lstrip('-')
+            if isinstance(instance, dict):
+                value = instance[field_name]
+            else:
+                value = getattr(instance, field_name)
+            values.append(str(value))
+        return json.dumps(values)
+
+    @staticmethod
+    def _reverse(ordering):
+        return tuple(item[1:] if item.startswith('-') else '-' + item for item in ordering)
+
+
+class NameKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination for models listed alphabetically by a unique name.
+    """
+    ordering = ('name', 'id')
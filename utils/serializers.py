@@ -0,0 +1,246 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.validators import UniqueValidator
+
+from .signals import post_bulk_create, pre_bulk_create
+
+
+def requested_fields(request):
+    """
+    Parse ``?fields=a,b`` and ``?omit=c`` from a request.
+
+    Returns:
+        tuple: ``(fields, omit)`` where ``fields`` is a set or None when
+               every field is wanted.
+    """
+    def parse(name):
+        value = request.query_params.get(name, '')
+        return {field.strip() for field in value.split(',') if field.strip()}
+
+    return parse('fields') or None, parse('omit')
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin returning only the fields asked for with ``?fields=``
+    and dropping those named in ``?omit=``, on read requests.
+
+    Unknown names are ignored. Views can narrow their SQL to the remaining
+    fields, see ``ProductViewSet.get_queryset``.
+    """
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return fields
+
+        wanted, omit = requested_fields(request)
+        for name in list(fields):
+            if (wanted is not None and name not in wanted) or name in omit:
+                fields.pop(name)
+        return fields
+
+
+def requested_expansions(request):
+    """
+    Parse ``?expand=a,b`` from a request into a set of field names.
+    """
+    value = request.query_params.get('expand', '') if request is not None else ''
+    return {field.strip() for field in value.split(',') if field.strip()}
+
+
+class ExpandableFieldsMixin:
+    """
+    Serializer mixin replacing related ids with nested representations for
+    the fields named in ``?expand=``.
+
+    ``expandable_fields`` maps a field name to the dotted path of the
+    serializer used to expand it. The view is responsible for loading the
+    relations up front (``select_related`` / ``prefetch_related``) so that
+    expanding does not cost a query per row, see ``expanded_relations``.
+    """
+    expandable_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return fields
+
+        for name in requested_expansions(request) & set(self.expandable_fields):
+            if name in fields:
+                serializer_class = import_string(self.expandable_fields[name])
+                many = getattr(fields[name], 'many', False) or isinstance(fields[name], serializers.ManyRelatedField)
+                fields[name] = serializer_class(source=fields[name].source, many=many, read_only=True)
+        return fields
+
+    @classmethod
+    def expanded_relations(cls, request):
+        """
+        Return the relation names the request asks to expand.
+        """
+        return requested_expansions(request) & set(cls.expandable_fields)
+
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that resolves against objects prefetched by a
+    parent BulkCreateListSerializer instead of issuing one query per item.
+
+    Outside of a bulk request it behaves exactly like PrimaryKeyRelatedField.
+    """
+    def to_internal_value(self, data):
+        cache = getattr(self.root, '_related_cache', {}).get(self.field_name)
+        if cache is None:
+            return super().to_internal_value(data)
+
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return cache[pk]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
+class ImageVariantsField(serializers.Field):
+    """
+    Read-only URLs of the resized copies of an image, as recorded by
+    ``utils.images`` in the model's ``image_variants`` column:
+    ``{variant: {format: url}}``. Empty until the variants of the current
+    image have been generated.
+    """
+    def __init__(self, image_field='image', **kwargs):
+        kwargs['read_only'] = True
+        self.image_field = image_field
+        super().__init__(**kwargs)
+
+    def to_representation(self, variants):
+        storage = self.parent.Meta.model._meta.get_field(self.image_field).storage
+        return self.represent(variants, storage, self.context.get('request'))
+
+    @staticmethod
+    def represent(variants, storage, request):
+        urls = {}
+        for variant, files in variants.items():
+            if variant == 'source':
+                continue
+            urls[variant] = {}
+            for output_format, name in files.items():
+                url = storage.url(name)
+                urls[variant][output_format] = request.build_absolute_uri(url) if request is not None else url
+        return urls
+
+    def fast_converter(self, model):
+        """
+        Converter factory used by ``utils.fast_serializers``.
+        """
+        storage = model._meta.get_field(self.image_field).storage
+
+        def factory(request):
+            return lambda variants: self.represent(variants, storage, request)
+        return factory
+
+
+class BulkCreateListSerializer(serializers.ListSerializer):
+    """
+    ListSerializer that validates and inserts a whole batch at once.
+
+    - related primary keys are fetched with one ``in_bulk`` query per field,
+    - unique fields are checked with one ``__in`` query per field, plus a
+      check for duplicates inside the batch itself,
+    - rows are written with ``bulk_create`` in chunks of ``batch_size``
+      inside a single transaction, between ``pre_bulk_create`` and
+      ``post_bulk_create``.
+
+    The child must be a ModelSerializer using BulkPrimaryKeyRelatedField
+    for its relations.
+    """
+    batch_size = getattr(settings, 'BULK_CREATE_BATCH_SIZE', 1000)
+
+    def to_internal_value(self, data):
+        unique_messages = self._take_unique_validators()
+        if isinstance(data, list):
+            self._related_cache = self._prefetch_related(data)
+        try:
+            validated = super().to_internal_value(data)
+        finally:
+            self._related_cache = {}
+
+        errors = self._validate_unique(validated, unique_messages)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return validated
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        instances = [model(**attrs) for attrs in validated_data]
+        pre_bulk_create.send(sender=model, instances=instances)
+        with transaction.atomic():
+            model._default_manager.bulk_create(instances, batch_size=self.batch_size)
+            post_bulk_create.send(sender=model, instances=instances)
+        return instances
+
+    def _take_unique_validators(self):
+        """
+        Remove per-item UniqueValidators from the child fields, returning
+        ``{field_name: message}`` for the batch check that replaces them.
+        """
+        messages = {}
+        for field_name, field in self.child.fields.items():
+            unique = [v for v in field.validators if isinstance(v, UniqueValidator)]
+            if unique:
+                messages[field_name] = unique[0].message
+                field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+        return messages
+
+    def _prefetch_related(self, data):
+        cache = {}
+        for field_name, field in self.child.fields.items():
+            if not isinstance(field, BulkPrimaryKeyRelatedField) or field.read_only:
+                continue
+            pk_field = field.get_queryset().model._meta.pk
+            pks = set()
+            for item in data:
+                value = item.get(field_name) if isinstance(item, dict) else None
+                if value is None or isinstance(value, bool):
+                    continue
+                try:
+                    pks.add(pk_field.to_python(value))
+                except (TypeError, ValueError, DjangoValidationError):
+                    continue
+            cache[field_name] = field.get_queryset().in_bulk(pks) if pks else {}
+        return cache
+
+    def _validate_unique(self, validated, messages):
+        model = self.child.Meta.model
+        errors = [{} for _ in validated]
+        for field_name, message in messages.items():
+            source = self.child.fields[field_name].source
+            values = [attrs.get(source) for attrs in validated]
+            present = list({value for value in values if value is not None})
+
+            existing = set()
+            for start in range(0, len(present), self.batch_size):
+                chunk = present[start:start + self.batch_size]
+                existing.update(
+                    model._default_manager.filter(**{f'{source}__in': chunk}).values_list(source, flat=True)
+                )
+
+            seen = set()
+            for index, value in enumerate(values):
+                if value is None:
+                    continue
+                if value in existing:
+                    errors[index].setdefault(field_name, []).append(message)
+                elif value in seen:
+                    errors[index].setdefault(field_name, []).append('Duplicate value within this batch.')
+                seen.add(value)
+        return errors
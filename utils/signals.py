@@ -0,0 +1,18 @@
+from django.dispatch import Signal
+
+
+# Sent before a batch of unsaved instances is written with ``bulk_create``,
+# so receivers can fill in what ``save()`` would have computed.
+# Arguments: ``sender`` (the model class) and ``instances``.
+pre_bulk_create = Signal()
+
+# Sent after a batch of instances has been written with ``bulk_create``,
+# which bypasses ``save()`` and the per-instance model signals.
+# Arguments: ``sender`` (the model class) and ``instances``.
+post_bulk_create = Signal()
+
+
+# Sent from a worker thread once the resized variants of an image have
+# been written and recorded (see utils.images).
+# Arguments: ``sender`` (the model class), ``pk`` and ``variants``.
+image_variants_generated = Signal()